@@ -0,0 +1,57 @@
+"""
+Время разбора ответа LLM: прежний путь (текст + '===JSON===' + json.loads в dict)
+против structured output (pydantic-core валидирует JSON по схеме StructuredReply),
+а также цена ремонта оборванного ответа.
+
+Запуск: python -m benchmarks.llm_parsing
+"""
+import json
+import logging
+import random
+import timeit
+
+from core.llm_processor import _parse_raw_response
+from core.llm_schema import StructuredReply, parse_structured_reply
+
+REPLY = (
+    "Доброе утро, мои хорошие! Леша, не забудь про контрольную по физике, я в тебя верю. "
+    "Петя, как там рыбалка? Жду фотографий улова. Анна, рада знакомству — расскажи о себе!"
+)
+
+
+def make_payload(rnd: random.Random, updates: int) -> dict:
+    return {
+        "updates": [
+            {
+                "user_id": rnd.randint(10 ** 8, 10 ** 9),
+                "relationship_change": rnd.randint(-5, 5),
+                "new_memory": "Рассказал, что увлекается рыбалкой и ездит на озеро по выходным.",
+            }
+            for _ in range(updates)
+        ],
+        "new_participants": [
+            {"user_id": rnd.randint(10 ** 8, 10 ** 9), "suggested_name": "Анна", "suggested_gender": "female",
+             "initial_relationship": 50}
+        ],
+    }
+
+
+def main():
+    logging.disable(logging.WARNING)  # ремонт предупреждает о каждом отброшенном элементе
+    rnd = random.Random(42)
+    print(f"{'обновлений':>10}{'===JSON===, мкс':>18}{'схема, мкс':>13}{'ремонт, мкс':>14}")
+    for updates in (1, 5, 20):
+        payload = make_payload(rnd, updates)
+        delimited = f"{REPLY}\n===JSON===\n{json.dumps(payload, ensure_ascii=False)}"
+        structured = StructuredReply(text_reply=REPLY, **payload).model_dump_json()
+        truncated = structured[:int(len(structured) * 0.9)]
+
+        runs = 5000
+        legacy = timeit.timeit(lambda: _parse_raw_response(delimited), number=runs) / runs
+        schema = timeit.timeit(lambda: parse_structured_reply(structured), number=runs) / runs
+        repair = timeit.timeit(lambda: parse_structured_reply(truncated), number=runs) / runs
+        print(f"{updates:>10}{legacy * 1e6:>18.2f}{schema * 1e6:>13.2f}{repair * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
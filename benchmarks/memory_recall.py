@@ -0,0 +1,74 @@
+"""
+Поиск воспоминаний в MemoryVectorIndex на большом чате: косинусный top-k по каждому участнику
+одной матричной операцией, плюс время сохранения и подъема индекса с диска.
+
+Запуск: python -m benchmarks.memory_recall
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+import timeit
+
+from core.memory_index import MemoryVectorIndex
+
+WORDS = (
+    "котенок физика экзамен рыбалка гитара концерт школа бабушка дача велосипед футбол "
+    "день рождения подарок ремонт собака кино поход море друзья уроки компьютер игра"
+).split()
+
+
+def make_rows(rnd: random.Random, count: int, participants: int) -> list[dict]:
+    return [
+        {
+            "id": index + 1,
+            "participant_id": rnd.randrange(participants),
+            "memory_summary": " ".join(rnd.choices(WORDS, k=8)),
+        }
+        for index in range(count)
+    ]
+
+
+async def run(count: int, participants: int):
+    rnd = random.Random(42)
+    rows = make_rows(rnd, count, participants)
+
+    async def loader(config_id: int, after_id: int) -> list[dict]:
+        return [row for row in rows if row["id"] > after_id]
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = MemoryVectorIndex(directory=directory)
+        started = time.perf_counter()
+        await index.sync(1, loader)
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await index.flush()
+        save = time.perf_counter() - started
+        size = os.path.getsize(os.path.join(directory, "1.npz"))
+
+        restored = MemoryVectorIndex(directory=directory)
+        started = time.perf_counter()
+        await restored.sync(1, loader)
+        load = time.perf_counter() - started
+
+        query = "Мам, я сегодня сдал экзамен по физике и поеду на рыбалку"
+        ids = list(range(participants))
+        search = min(timeit.repeat(lambda: restored.search(1, query, ids, 3), number=20, repeat=5)) / 20
+
+    print(
+        f"{count:>9} {build * 1000:>14.0f} {save * 1000:>11.0f} {size / 1024:>10.0f} "
+        f"{load * 1000:>13.1f} {search * 1000:>11.2f}"
+    )
+
+
+def main():
+    print(f"{'воспоминаний':>9} {'построение, мс':>14} {'запись, мс':>11} {'файл, КБ':>10} "
+          f"{'подъем, мс':>13} {'поиск, мс':>11}")
+    for count in (1_000, 10_000, 100_000):
+        asyncio.run(run(count, participants=30))
+
+
+if __name__ == "__main__":
+    main()
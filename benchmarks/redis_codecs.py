@@ -0,0 +1,68 @@
+"""
+Сравнение кодеков RedisClient на реалистичных русскоязычных сообщениях чата:
+размер одного сообщения очереди, размер short_term_memory и время encode/decode.
+
+Запуск: python -m benchmarks.redis_codecs
+"""
+import json
+import random
+import timeit
+
+from core.database.codecs import PayloadCodec, CodecFormat
+
+PHRASES = [
+    "Мам, а можно я сегодня задержусь у Пети?",
+    "Кто-нибудь видел мою зарядку? Вчера оставлял на кухне.",
+    "Я уже поел, не переживай 😊",
+    "Завтра контрольная по физике, готовимся всей группой",
+    "Ахаха, ну ты даешь) а что потом было?",
+    "Купите хлеба по дороге домой, пожалуйста",
+    "Погода сегодня просто ужас, весь промок до нитки",
+    "Скинь фотки с выходных, хочу маме показать",
+]
+
+
+def make_message(rnd: random.Random) -> dict:
+    return {
+        "participant_id": rnd.randint(1, 500),
+        "user_id": rnd.randint(10 ** 8, 10 ** 9),
+        "text": " ".join(rnd.choice(PHRASES) for _ in range(rnd.randint(1, 3))),
+        "timestamp": 1717000000.0 + rnd.random() * 86400,
+        "is_direct": rnd.random() < 0.2,
+        "is_reply": rnd.random() < 0.3,
+    }
+
+
+def legacy_encode(value) -> bytes:
+    """Прежний формат: json.dumps с ensure_ascii=True."""
+    return json.dumps(value).encode()
+
+
+def main():
+    rnd = random.Random(42)
+    messages = [make_message(rnd) for _ in range(1000)]
+    memory = [{"role": "user", "content": m["text"]} for m in messages[:30]]
+
+    codecs = {
+        "json (ensure_ascii, было)": (legacy_encode, json.loads),
+        "json": PayloadCodec(CodecFormat.JSON),
+        "msgpack": PayloadCodec(CodecFormat.MSGPACK),
+        "json + zstd": PayloadCodec(CodecFormat.JSON, compress_min_bytes=1024),
+        "msgpack + zstd": PayloadCodec(CodecFormat.MSGPACK, compress_min_bytes=1024),
+    }
+
+    print(f"{'кодек':<28}{'байт/сообщ.':>12}{'memory, байт':>14}{'encode, мкс':>13}{'decode, мкс':>13}")
+    for name, codec in codecs.items():
+        encode, decode = codec if isinstance(codec, tuple) else (codec.encode, codec.decode)
+        encoded = [encode(m) for m in messages]
+        bytes_per_message = sum(map(len, encoded)) / len(encoded)
+        memory_bytes = len(encode(memory))
+
+        encode_time = timeit.timeit(lambda: [encode(m) for m in messages], number=20) / 20 / len(messages)
+        decode_time = timeit.timeit(lambda: [decode(e) for e in encoded], number=20) / 20 / len(messages)
+        print(f"{name:<28}{bytes_per_message:>12.1f}{memory_bytes:>14}"
+              f"{encode_time * 1e6:>13.2f}{decode_time * 1e6:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,115 @@
-import asyncio
-import logging
-
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-
-from core.config.parameters import (
-    DATABASE_URL, POOL_PARAMETERS, GEMINI_API_KEY, BOT_TOKEN, REDIS_HOST, REDIS_PORT
-)
-
-from core.database.postgres_client import AsyncPostgresManager
-from core.llm_manager import LLMManager
-from core.logging_config import setup_logging
-from core.database.postgres_pool import PostgresPool
-from core.database.redis_client import RedisClient
-
-from handlers import common as common_handlers, setup_dialog as setup_handlers
-from core import operator
-
-setup_logging()
-logger = logging.getLogger(__name__)
-
-
-async def main():
-    logger.info("Запуск бота...")
-    storage = MemoryStorage()
-    db_pool = PostgresPool(dsn=DATABASE_URL, params=POOL_PARAMETERS)
-    llm_manager = LLMManager(api_key=GEMINI_API_KEY)
-    redis_client = RedisClient(host=REDIS_HOST, port=REDIS_PORT)
-
-    await db_pool.create_pool()
-    await redis_client.connect()
-
-    db_manager = AsyncPostgresManager(pool=db_pool)
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=storage)
-
-    dp["db"] = db_manager
-    dp["llm"] = llm_manager
-    dp["redis"] = redis_client
-
-    dp.include_router(common_handlers.router)
-    dp.include_router(setup_handlers.router)
-    dp.include_router(operator.router)
-
-    await bot.delete_webhook(drop_pending_updates=True)
-
-    try:
-        await dp.start_polling(bot)
-    finally:
-        if db_pool.is_connected:
-            await db_pool.disconnect()
-        await redis_client.disconnect()
-        await bot.session.close()
-
-
-if __name__ == '__main__':
-    try:
-        asyncio.run(main())
-    except (KeyboardInterrupt, SystemExit):
-        logger.info("Бот остановлен по команде.")
\ No newline at end of file
+import asyncio
+import logging
+
+from aiogram import Bot, Dispatcher
+
+from core.config.parameters import (
+    DATABASE_URL, POOL_PARAMETERS, GEMINI_API_KEY, BOT_TOKEN, REDIS_HOST, REDIS_PORT,
+    REDIS_WRITE_BATCHING, REDIS_WRITE_BATCH_DELAY_MS, REDIS_WRITE_BATCH_MAX_ITEMS,
+    QUEUE_BACKEND, STREAM_CONSUMER_GROUP, STREAM_CLAIM_IDLE_MS, STREAM_BATCH_SIZE,
+    REDIS_CODEC, REDIS_COMPRESS_MIN_BYTES,
+    UPDATES_MODE, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_WORKERS,
+    SHARDING_ENABLED, FSM_STATE_TTL, FSM_DATA_TTL, MEMORY_INDEX_ENABLED
+)
+
+from core.database.postgres_client import AsyncPostgresManager
+from core.llm_manager import LLMManager
+from core.logging_config import setup_logging
+from core.database.postgres_pool import PostgresPool
+from core.database.codecs import PayloadCodec, CodecFormat
+from core.database.redis_client import RedisClient, QueueBackend
+from core.cache import ConfigCache, RosterCache
+from core.memory_index import MemoryVectorIndex
+from core.webhook import serve_webhook, run_worker_processes
+from core.sharding import ShardCoordinator
+
+from handlers import common as common_handlers, setup_dialog as setup_handlers
+from core import operator
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+
+async def main(worker_id: int = 0):
+    logger.info(f"Запуск бота (режим {UPDATES_MODE}, воркер {worker_id})...")
+    db_pool = PostgresPool(dsn=DATABASE_URL, params=POOL_PARAMETERS)
+    llm_manager = LLMManager(api_key=GEMINI_API_KEY)
+    redis_client = RedisClient(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        write_batching=REDIS_WRITE_BATCHING,
+        write_batch_delay_ms=REDIS_WRITE_BATCH_DELAY_MS,
+        write_batch_max_items=REDIS_WRITE_BATCH_MAX_ITEMS,
+        queue_backend=QueueBackend(QUEUE_BACKEND),
+        stream_group=STREAM_CONSUMER_GROUP,
+        stream_claim_idle_ms=STREAM_CLAIM_IDLE_MS,
+        stream_batch_size=STREAM_BATCH_SIZE,
+        codec=PayloadCodec(CodecFormat(REDIS_CODEC), compress_min_bytes=REDIS_COMPRESS_MIN_BYTES or None)
+    )
+    config_cache = ConfigCache(redis_client)
+    roster_cache = RosterCache()
+    memory_index = MemoryVectorIndex(redis_client=redis_client) if MEMORY_INDEX_ENABLED else None
+
+    await db_pool.create_pool()
+    await redis_client.connect()
+    await config_cache.start()
+    if memory_index:
+        await memory_index.start()
+
+    db_manager = AsyncPostgresManager(
+        pool=db_pool, config_cache=config_cache, roster_cache=roster_cache, memory_index=memory_index
+    )
+    bot = Bot(token=BOT_TOKEN)
+    dp = Dispatcher(storage=redis_client.create_fsm_storage(state_ttl=FSM_STATE_TTL, data_ttl=FSM_DATA_TTL))
+
+    dp["db"] = db_manager
+    dp["llm"] = llm_manager
+    dp["redis"] = redis_client
+    dp["config_cache"] = config_cache
+    dp["memory_index"] = memory_index
+
+    dp.include_router(common_handlers.router)
+    dp.include_router(setup_handlers.router)
+    dp.include_router(operator.router)
+
+    shard = ShardCoordinator(redis_client) if SHARDING_ENABLED else None
+    if shard:
+        await shard.start(dp, bot)
+    dp["shard"] = shard
+
+    try:
+        if UPDATES_MODE == 'webhook':
+            await serve_webhook(
+                dp, bot,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                base_url=WEBHOOK_BASE_URL if worker_id == 0 else None
+            )
+        else:
+            # Накопившиеся за время рестарта апдейты не сбрасываем — поллинг их дочитает.
+            await bot.delete_webhook(drop_pending_updates=False)
+            await dp.start_polling(bot)
+    finally:
+        if shard:
+            await shard.stop()
+        if db_pool.is_connected:
+            await db_pool.disconnect()
+        await config_cache.stop()
+        if memory_index:
+            await memory_index.stop()
+        await redis_client.disconnect()
+        await llm_manager.close()
+        await bot.session.close()
+
+
+def run_worker(worker_id: int):
+    try:
+        asyncio.run(main(worker_id))
+    except (KeyboardInterrupt, SystemExit):
+        logger.info(f"Бот (воркер {worker_id}) остановлен по команде.")
+
+
+if __name__ == '__main__':
+    run_worker_processes(run_worker, WEBHOOK_WORKERS if UPDATES_MODE == 'webhook' else 1)
\ No newline at end of file
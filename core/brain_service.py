@@ -1,246 +1,415 @@
-import logging
-
-from aiogram import Bot
-from aiogram.exceptions import TelegramAPIError
-
-from core.database.postgres_client import AsyncPostgresManager
-from core.database.redis_client import RedisClient
-from core.exceptions import BrainServiceError
-from core.llm_processor import LLMProcessor
-from core.logging_config import log_error
-from core.prompt_factory import PromptFactory
-from core.scheduler import BotMode
-from core.config.parameters import SHORT_TERM_MEMORY_LIMIT, SHORT_TERM_MEMORY_TTL
-
-logger = logging.getLogger(__name__)
-
-
-class BrainService:
-    """
-    Мозг бота, принимает решение на основе данных из Redis и PostgreSQL,
-    использует PromtFactory для создания промптов и LLMProcessor для их выполнения.
-    """
-
-    def __init__(
-            self,
-            redis_client: RedisClient,
-            db_manager: AsyncPostgresManager,
-            prompt_factory: PromptFactory,
-            llm_processor: LLMProcessor,
-            bot: Bot
-    ):
-        self.redis = redis_client
-        self.db = db_manager
-        self.prompts = prompt_factory
-        self.llm = llm_processor
-        self.bot = bot
-        logger.info("BrainService инициализирован.")
-
-    @log_error
-    async def process_gathering_queues(self, config_id: int, time_of_day):
-        """
-        Главный метод для пакетной обработки. Запускается из scheduler.
-        1. Собирает весь контекст (конфиг, участники, сообщения).
-        2. Генерирует промпт.
-        3. Выполняет промпт и получает структурированный ответ.
-        4. Отправляет текстовый ответ в чат.
-        5. Выполняет действие по обновления в БД.
-        """
-        logger.debug(f"Начинаю пакетную обработку для config_id={config_id} (контекст: {time_of_day})...")
-
-        config = await self.db.get_mama_config_by_id(config_id)
-        if not config:
-            raise BrainServiceError(f"Не найден конфиг с id={config_id}. Обработка прервана.")
-
-        participants = await self.db.get_all_participants_by_config_id(config_id)
-        participants_map = {p['user_id']: p for p in participants}
-
-        direct_messages = await self.redis.get_and_clear_batch(f"direct_queue:{config_id}")
-        background_messages = await self.redis.get_and_clear_batch(f"background_queue:{config_id}")
-        all_messages = sorted(direct_messages + background_messages, key=lambda msg: msg.get('timestamp', 0))
-
-        if not all_messages:
-            logger.info(f"Нет сообщений для обработки в config_id={config_id}. Пропускаю.")
-            return
-
-        child = next((p for p in participants if p['id'] == config.get('child_participant_id')), None)
-        if not child:
-            logger.warning(f"Для config_id={config_id} не назначен 'ребенок'. Логика child_was_active пропускается.")
-        child_was_active = any(
-            msg.get('participant_info', {}).get('id') == child['id']
-            for msg in all_messages
-        ) if child else False
-
-        prompt = self.prompts.create_gathering_prompt(
-            config=config,
-            participants=participants,
-            messages=all_messages,
-            time_of_day=time_of_day,
-            child_was_active=child_was_active
-        )
-
-        llm_response = await self.llm.execute_and_parse(prompt)
-        await self._send_reply(config['chat_id'], llm_response.text_reply)
-
-        if llm_response.data_json:
-            await self._execute_db_actions(
-                updates=llm_response.data_json.get('updates', []),
-                new_participants=llm_response.data_json.get('new_participants', []),
-                config_id=config['id'],
-                participants_map=participants_map
-            )
-
-    @log_error
-    async def process_online_batch(self, config_id: int):
-        """Обрабатывает микро-пакет из Redis в Online режиме."""
-        logger.info(f"Обрабатываю микро-пакет для config_id={config_id}...")
-
-        if not (online_messages := await self.redis.get_and_clear_batch(f"online_batch_queue:{config_id}")):
-            return
-
-        if not (config := await self.db.get_mama_config_by_id(config_id)):
-            raise BrainServiceError(f"Не найден конфиг с id={config_id} для онлайн-пакета.")
-
-        memory_key = f"short_term_memory:{config_id}"
-        dialog_history = await self.redis.get_json(memory_key) or []
-        full_dialog = dialog_history + online_messages
-
-        prompt = self.prompts.create_online_prompt(config, full_dialog)
-        llm_response = await self.llm.execute_and_parse(prompt)
-
-        await self._send_reply(config['chat_id'], llm_response.text_reply)
-
-        if llm_response.text_reply:
-            full_dialog.append({'role': 'model', 'content': llm_response.text_reply})
-
-        updated_memory = full_dialog[-SHORT_TERM_MEMORY_LIMIT:]
-        await self.redis.set_json(memory_key, updated_memory, ttl_seconds=SHORT_TERM_MEMORY_TTL)
-
-        if llm_response.data_json:
-            participants = await self.db.get_all_participants_by_config_id(config_id)
-            participants_map = {p['user_id']: p for p in participants}
-            await self._execute_db_actions(
-                updates=llm_response.data_json.get('updates', []),
-                new_participants=llm_response.data_json.get('new_participants', []),
-                config_id=config_id,
-                participants_map=participants_map
-            )
-
-    @log_error
-    async def process_single_message_immediately(self, message: dict, config: dict):
-        """Обрабатывает одиночное сообщение в реальном времени (для PASSIVE режима)."""
-        config_id = config['id']
-        logger.debug(f"Обрабатываю одиночное сообщение для config_id={config_id}...")
-
-        all_participants = await self.db.get_all_participants_by_config_id(config_id)
-        participants_map = {p['user_id']: p for p in all_participants}
-
-        prompt = self.prompts.create_single_reply_prompt(
-            config=config,
-            participants=all_participants,
-            message=message
-        )
-        llm_response = await self.llm.execute_and_parse(prompt)
-        await self._send_reply(config['chat_id'], llm_response.text_reply)
-
-        if llm_response.data_json:
-            await self._execute_db_actions(
-                updates=llm_response.data_json.get('updates', []),
-                new_participants=llm_response.data_json.get('new_participants', []),
-                config_id=config_id,
-                participants_map=participants_map
-            )
-
-    @log_error
-    async def say_goodbye_and_switch_to_passive(self, config_id: int):
-        """
-        Завершает ONLINE сессию: обрабатывает последний "хвост" сообщений,
-        прощается в ОДНОМ сообщении и меняет режим на PASSIVE.
-        """
-        logger.info(f"Завершаю ONLINE сессию для config_id={config_id}...")
-
-        config = await self.db.get_mama_config_by_id(config_id)
-        if not config:
-            await self.redis.set_mode(config_id, BotMode.PASSIVE.value)
-            logger.warning(f"Не найден конфиг с id={config_id} для прощания. Просто меняю режим.")
-            return
-
-        last_messages = await self.redis.get_and_clear_batch(f"online_batch_queue:{config_id}")
-        memory_key = f"short_term_memory:{config_id}"
-        dialog_history = await self.redis.get_json(memory_key) or []
-        full_dialog_for_prompt = dialog_history + last_messages
-
-        prompt = self.prompts.create_final_reply_prompt(config, full_dialog_for_prompt)
-        llm_response = await self.llm.execute_and_parse(prompt)
-
-        await self._send_reply(config['chat_id'], llm_response.text_reply)
-
-        if llm_response.data_json and last_messages:
-            participants = await self.db.get_all_participants_by_config_id(config_id)
-            participants_map = {p['user_id']: p for p in participants}
-            await self._execute_db_actions(
-                updates=llm_response.data_json.get('updates', []),
-                new_participants=llm_response.data_json.get('new_participants', []),
-                config_id=config_id,
-                participants_map=participants_map
-            )
-
-        await self.redis.set_mode(config_id, BotMode.PASSIVE.value)
-        await self.redis.delete(memory_key)
-
-        logger.info(f"Режим для config_id={config_id} переключен на PASSIVE. Сессия завершена.")
-
-    @log_error
-    async def _send_reply(self, chat_id: int, text: str):
-        """Безопасная отправка сообщения в чат."""
-        if not text:
-            logger.warning(f"Попытка отправить пустое сообщение в чат {chat_id}. Отменено.")
-            return
-        try:
-            await self.bot.send_message(chat_id, text)
-            logger.debug(f"Отправлено сообщение в чат {chat_id}.")
-        except TelegramAPIError as e:
-            raise BrainServiceError(f"Ошибка API Telegram при отправке сообщения в чат {chat_id}: {e}") from e
-        except Exception as e:
-            raise BrainServiceError(f"Неизвестная ошибка при отправке сообщения в чат {chat_id}: {e}") from e
-
-    @log_error
-    async def _execute_db_actions(
-            self,
-            updates: list,
-            new_participants: list,
-            config_id: int,
-            participants_map: dict[int, dict]
-    ):
-        """Приватный метод ("ActionExecutor"). Применяет изменения к БД."""
-        logger.debug(f"Применяю обновления из JSON для config_id={config_id}...")
-
-        for user_update in updates:
-            user_id = user_update.get('user_id')
-            if not user_id: continue
-
-            participant = participants_map.get(user_id)
-            if not participant:
-                logger.warning(f"Получен update для неизвестного user_id={user_id}. Пропускаю.")
-                continue
-
-            if change := user_update.get('relationship_change'):
-                await self.db.update_relationship_score(participant['id'], int(change))
-
-            if memory := user_update.get('new_memory'):
-                await self.db.add_long_term_memory(participant['id'], memory, 1)
-
-        for new_user in new_participants:
-            user_id = new_user.get('user_id')
-            if not user_id or user_id in participants_map:
-                logger.warning(f"Попытка добавить существующего/невалидного юзера user_id={user_id}. Пропускаю.")
-                continue
-
-            await self.db.add_participant(
-                config_id=config_id,
-                user_id=user_id,
-                custom_name=new_user.get('suggested_name', 'Новичок'),
-                gender=new_user.get('suggested_gender', 'unknown')
-            )
-        logger.debug(
-            f"Применяю {len(updates)} апдейтов и {len(new_participants)} новых участников для config_id={config_id}...")
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.types import Message
+
+from core.chat_context import ChatContextLoader
+from core.database.postgres_client import ActionBatchResult, AsyncPostgresManager
+from core.database.redis_client import RedisClient
+from core.exceptions import BrainServiceError, CircuitOpenError
+from core.llm_processor import LLMProcessor, LLMResponse
+from core.llm_scheduler import Priority
+from core.logging_config import log_error
+from core.memory_index import MemoryVectorIndex
+from core.prompt_factory import PromptFactory
+from core.scheduler import BotMode
+from core.single_flight import SingleFlight
+from core.summarizer import BackgroundSummarizer
+from core.token_budget import PromptType
+from core.config.parameters import (
+    SHORT_TERM_MEMORY_LIMIT, SHORT_TERM_MEMORY_TTL, REPLY_STREAMING, REPLY_STREAM_EDIT_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BrainService:
+    """
+    Мозг бота, принимает решение на основе данных из Redis и PostgreSQL,
+    использует PromtFactory для создания промптов и LLMProcessor для их выполнения.
+    """
+
+    def __init__(
+            self,
+            redis_client: RedisClient,
+            db_manager: AsyncPostgresManager,
+            prompt_factory: PromptFactory,
+            llm_processor: LLMProcessor,
+            bot: Bot,
+            streaming: bool = REPLY_STREAMING,
+            stream_edit_interval: float = REPLY_STREAM_EDIT_INTERVAL,
+            single_flight: SingleFlight | None = None,
+            summarizer: BackgroundSummarizer | None = None,
+            context_loader: ChatContextLoader | None = None,
+            memory_index: MemoryVectorIndex | None = None
+    ):
+        self.redis = redis_client
+        self.db = db_manager
+        self.prompts = prompt_factory
+        self.llm = llm_processor
+        self.bot = bot
+        self.streaming = streaming
+        self.stream_edit_interval = stream_edit_interval
+        self.single_flight = single_flight or SingleFlight(redis_client)
+        self.summarizer = summarizer or BackgroundSummarizer(llm_processor, redis_client, prompt_factory)
+        self.contexts = context_loader or ChatContextLoader(db_manager, redis_client, memory_index=memory_index)
+        logger.info("BrainService инициализирован.")
+
+    @log_error
+    async def process_gathering_queues(self, config_id: int, time_of_day):
+        """
+        Главный метод для пакетной обработки. Запускается из scheduler.
+        1. Собирает весь контекст (конфиг, участники, сообщения) через ChatContextLoader.
+        2. Пересказывает большую фоновую очередь (BackgroundSummarizer) и генерирует промпт.
+        3. Выполняет промпт и получает структурированный ответ.
+        4. Отправляет текстовый ответ в чат.
+        5. Выполняет действие по обновления в БД.
+        6. Подтверждает обработку сообщений в очередях (ack).
+        """
+        logger.debug(f"Начинаю пакетную обработку для config_id={config_id} (контекст: {time_of_day})...")
+
+        direct_queue, background_queue = f"direct_queue:{config_id}", f"background_queue:{config_id}"
+        context = await self.contexts.load(config_id, [direct_queue, background_queue], with_memories=True)
+        if context is None:
+            raise BrainServiceError(f"Не найден конфиг с id={config_id}. Обработка прервана.")
+
+        config = context.config
+        participants = list(context.participants)
+        direct_batch = context.batch(direct_queue)
+        background_batch = context.batch(background_queue)
+        all_messages = sorted(direct_batch.items + background_batch.items, key=lambda msg: msg.get('timestamp', 0))
+
+        if not all_messages:
+            logger.info(f"Нет сообщений для обработки в config_id={config_id}. Пропускаю.")
+            return
+
+        child = context.child
+        if not child:
+            logger.warning(f"Для config_id={config_id} не назначен 'ребенок'. Логика child_was_active пропускается.")
+        child_was_active = any(
+            msg.get('user_id') == child['user_id']
+            for msg in all_messages
+        ) if child else False
+
+        # Большую фоновую очередь заранее пересказываем кусками; прямые сообщения идут дословно.
+        background = await self.summarizer.summarize(
+            config_id, background_batch.items, participants, Priority.GATHERING
+        )
+        verbatim_messages = sorted(
+            direct_batch.items + background.raw_messages, key=lambda msg: msg.get('timestamp', 0)
+        )
+
+        # Пересказ мог занять заметное время: продлеваем владение пачками Streams перед долгим вызовом LLM.
+        await self.redis.touch_batch(direct_batch)
+        await self.redis.touch_batch(background_batch)
+
+        prompt, _ = self.prompts.create_gathering_prompt(
+            config=config,
+            participants=participants,
+            messages=verbatim_messages,
+            time_of_day=time_of_day,
+            child_was_active=child_was_active,
+            summaries=background.summaries
+        )
+
+        try:
+            llm_response = await self._generate_reply(
+                config['chat_id'], prompt, Priority.GATHERING, config_id, PromptType.GATHERING
+            )
+        except CircuitOpenError as e:
+            # LLM лежит: сообщения возвращаем в очереди, их разберет следующий сбор.
+            await self.redis.release_batch(direct_batch)
+            await self.redis.release_batch(background_batch)
+            logger.warning(f"Сбор для config_id={config_id} отложен, сообщения сохранены: {e}")
+            return
+
+        if llm_response.data_json:
+            await self._execute_db_actions(
+                updates=llm_response.data_json.get('updates', []),
+                new_participants=llm_response.data_json.get('new_participants', []),
+                config_id=config['id'],
+                participants_map=context.participants_map
+            )
+
+        await self.redis.ack_batch(direct_batch)
+        await self.redis.ack_batch(background_batch)
+
+    async def process_online_batch(self, config_id: int):
+        """
+        Обрабатывает микро-пакет из Redis в Online режиме.
+        Его одновременно запускают Operator (набрался пакет) и пульс планировщика, поэтому вызов идет
+        через single-flight: параллельного дубля не будет, а пришедший во время обработки вызов даст один повтор.
+        """
+        await self.single_flight.run("online_batch", config_id, self._process_online_batch)
+
+    async def say_goodbye_and_switch_to_passive(self, config_id: int):
+        """Завершает ONLINE сессию; не пересекается с обработкой микро-пакета того же чата."""
+        await self.single_flight.run("online_end", config_id, self._say_goodbye_and_switch_to_passive)
+
+    @log_error
+    async def _process_online_batch(self, config_id: int):
+        """Обрабатывает микро-пакет из Redis в Online режиме."""
+        logger.info(f"Обрабатываю микро-пакет для config_id={config_id}...")
+
+        queue_name, memory_key = f"online_batch_queue:{config_id}", f"short_term_memory:{config_id}"
+        context = await self.contexts.load(config_id, [queue_name], memory_key, with_memories=True)
+        if context is None:
+            raise BrainServiceError(f"Не найден конфиг с id={config_id} для онлайн-пакета.")
+
+        batch = context.batch(queue_name)
+        if not (online_messages := batch.items):
+            return
+
+        config = context.config
+        full_dialog = list(context.dialog_history) + online_messages
+        participants = list(context.participants)
+
+        prompt, _ = self.prompts.create_online_prompt(config, full_dialog, participants)
+        try:
+            llm_response = await self._generate_reply(
+                config['chat_id'], prompt, Priority.ONLINE, config_id, PromptType.ONLINE
+            )
+        except CircuitOpenError as e:
+            await self.redis.release_batch(batch)
+            logger.warning(f"Микро-пакет config_id={config_id} отложен до следующего пульса: {e}")
+            return
+
+        if llm_response.text_reply:
+            full_dialog.append({'role': 'model', 'content': llm_response.text_reply})
+
+        updated_memory = full_dialog[-SHORT_TERM_MEMORY_LIMIT:]
+        await self.redis.set_json(memory_key, updated_memory, ttl_seconds=SHORT_TERM_MEMORY_TTL)
+
+        if llm_response.data_json:
+            await self._execute_db_actions(
+                updates=llm_response.data_json.get('updates', []),
+                new_participants=llm_response.data_json.get('new_participants', []),
+                config_id=config_id,
+                participants_map=context.participants_map
+            )
+
+        await self.redis.ack_batch(batch)
+
+    @log_error
+    async def process_single_message_immediately(self, message: dict, config: dict):
+        """Обрабатывает одиночное сообщение в реальном времени (для PASSIVE режима)."""
+        config_id = config['id']
+        logger.debug(f"Обрабатываю одиночное сообщение для config_id={config_id}...")
+
+        all_participants = await self.contexts.load_participants(config_id, [message])
+        participants_map = {p['user_id']: p for p in all_participants}
+
+        prompt, _ = self.prompts.create_single_reply_prompt(
+            config=config,
+            participants=all_participants,
+            message=message
+        )
+        try:
+            llm_response = await self._generate_reply(
+                config['chat_id'], prompt, Priority.INTERACTIVE, config_id, PromptType.SINGLE_REPLY
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"LLM недоступна, отвечаю заготовкой в config_id={config_id}: {e}")
+            await self._send_reply(config['chat_id'], self.prompts.create_canned_reply('reply'))
+            return
+
+        if llm_response.data_json:
+            await self._execute_db_actions(
+                updates=llm_response.data_json.get('updates', []),
+                new_participants=llm_response.data_json.get('new_participants', []),
+                config_id=config_id,
+                participants_map=participants_map
+            )
+
+    @log_error
+    async def _say_goodbye_and_switch_to_passive(self, config_id: int):
+        """
+        Завершает ONLINE сессию: обрабатывает последний "хвост" сообщений,
+        прощается в ОДНОМ сообщении и меняет режим на PASSIVE.
+        """
+        logger.info(f"Завершаю ONLINE сессию для config_id={config_id}...")
+
+        queue_name, memory_key = f"online_batch_queue:{config_id}", f"short_term_memory:{config_id}"
+        context = await self.contexts.load(config_id, [queue_name], memory_key)
+        if context is None:
+            await self.redis.set_mode(config_id, BotMode.PASSIVE.value)
+            logger.warning(f"Не найден конфиг с id={config_id} для прощания. Просто меняю режим.")
+            return
+
+        config = context.config
+        batch = context.batch(queue_name)
+        last_messages = batch.items
+        full_dialog_for_prompt = list(context.dialog_history) + last_messages
+        participants = list(context.participants)
+
+        prompt, _ = self.prompts.create_final_reply_prompt(config, full_dialog_for_prompt, participants)
+        try:
+            llm_response = await self._generate_reply(
+                config['chat_id'], prompt, Priority.ONLINE, config_id, PromptType.FINAL_REPLY
+            )
+        except CircuitOpenError as e:
+            # Сессию все равно завершаем вовремя — прощаемся заготовкой.
+            logger.warning(f"LLM недоступна, прощаюсь заготовкой в config_id={config_id}: {e}")
+            await self._send_reply(config['chat_id'], self.prompts.create_canned_reply('goodbye'))
+            llm_response = None
+
+        if llm_response and llm_response.data_json and last_messages:
+            await self._execute_db_actions(
+                updates=llm_response.data_json.get('updates', []),
+                new_participants=llm_response.data_json.get('new_participants', []),
+                config_id=config_id,
+                participants_map=context.participants_map
+            )
+
+        await self.redis.ack_batch(batch)
+        await self.redis.set_mode(config_id, BotMode.PASSIVE.value)
+        await self.redis.delete(memory_key)
+
+        logger.info(f"Режим для config_id={config_id} переключен на PASSIVE. Сессия завершена.")
+
+    async def _generate_reply(
+            self,
+            chat_id: int,
+            prompt: str,
+            priority: Priority,
+            config_id: int,
+            prompt_type: PromptType
+    ) -> LLMResponse:
+        """
+        Выполняет промпт и отправляет текстовую часть ответа в чат.
+        В потоковом режиме сообщение появляется с первыми словами и дописывается правками
+        не чаще раза в stream_edit_interval секунд; JSON-хвост в чат не попадает.
+        """
+        if not self.streaming:
+            llm_response = await self.llm.execute_and_parse(prompt, priority, config_id, prompt_type)
+            await self._send_reply(chat_id, llm_response.text_reply)
+            return llm_response
+
+        reply = _ProgressiveReply(self.bot, chat_id, self.stream_edit_interval)
+        llm_response = await self.llm.execute_and_parse_stream(prompt, reply.update, priority, config_id, prompt_type)
+        if reply.message is None:
+            await self._send_reply(chat_id, llm_response.text_reply)
+        else:
+            await reply.finish(llm_response.text_reply)
+        return llm_response
+
+    @log_error
+    async def _send_reply(self, chat_id: int, text: str):
+        """Безопасная отправка сообщения в чат."""
+        if not text:
+            logger.warning(f"Попытка отправить пустое сообщение в чат {chat_id}. Отменено.")
+            return
+        try:
+            await self.bot.send_message(chat_id, text)
+            logger.debug(f"Отправлено сообщение в чат {chat_id}.")
+        except TelegramAPIError as e:
+            raise BrainServiceError(f"Ошибка API Telegram при отправке сообщения в чат {chat_id}: {e}") from e
+        except Exception as e:
+            raise BrainServiceError(f"Неизвестная ошибка при отправке сообщения в чат {chat_id}: {e}") from e
+
+    @log_error
+    async def _execute_db_actions(
+            self,
+            updates: list,
+            new_participants: list,
+            config_id: int,
+            participants_map: dict[int, dict]
+    ) -> ActionBatchResult:
+        """
+        Приватный метод ("ActionExecutor"). Применяет изменения к БД.
+        Все обновления ответа собираются в один пакет и уходят одной транзакцией, поэтому ответ,
+        затронувший двадцать человек, стоит столько же обращений к БД, сколько ответ про одного.
+        """
+        score_changes: dict[int, int] = {}
+        memories: list[tuple[int, str, int]] = []
+        skipped = 0
+
+        for user_update in updates:
+            user_id = user_update.get('user_id')
+            if not user_id: continue
+
+            participant = participants_map.get(user_id)
+            if not participant:
+                logger.warning(f"Получен update для неизвестного user_id={user_id}. Пропускаю.")
+                skipped += 1
+                continue
+
+            if change := user_update.get('relationship_change'):
+                score_changes[participant['id']] = score_changes.get(participant['id'], 0) + int(change)
+
+            if memory := user_update.get('new_memory'):
+                memories.append((participant['id'], memory, 1))
+
+        newcomers: dict[int, tuple[int, str, str]] = {}
+        for new_user in new_participants:
+            user_id = new_user.get('user_id')
+            if not user_id or user_id in participants_map or user_id in newcomers:
+                logger.warning(f"Попытка добавить существующего/невалидного юзера user_id={user_id}. Пропускаю.")
+                skipped += 1
+                continue
+
+            newcomers[user_id] = (
+                user_id,
+                new_user.get('suggested_name', 'Новичок'),
+                new_user.get('suggested_gender', 'unknown')
+            )
+
+        result = await self.db.apply_llm_actions(config_id, score_changes, memories, list(newcomers.values()))
+        result.skipped += skipped
+        logger.debug(f"Применены обновления из JSON для config_id={config_id}: {result}.")
+        return result
+
+
+class _ProgressiveReply:
+    """Сообщение, которое отправляется с первым куском текста и затем дописывается правками."""
+
+    def __init__(self, bot: Bot, chat_id: int, edit_interval: float):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.message: Message | None = None
+        self._shown = ''
+        self._edited_at = 0.0
+
+    async def update(self, text: str):
+        """Показывает накопленный текст, если с прошлой правки прошло достаточно времени."""
+        text = text.strip()
+        if not text or text == self._shown:
+            return
+        if self.message is None:
+            try:
+                self.message = await self.bot.send_message(self.chat_id, text)
+            except TelegramAPIError as e:
+                raise BrainServiceError(f"Ошибка API Telegram при отправке сообщения в чат {self.chat_id}: {e}") from e
+            self._shown = text
+            self._edited_at = time.monotonic()
+            logger.debug(f"Начат потоковый ответ в чат {self.chat_id}.")
+            return
+        if time.monotonic() - self._edited_at < self.edit_interval:
+            return
+        try:
+            await self._edit(text)
+        except TelegramAPIError as e:
+            # Промежуточная правка не важна: итоговый текст все равно будет выставлен в finish.
+            logger.warning(f"Не удалось обновить потоковый ответ в чате {self.chat_id}: {e}")
+
+    async def finish(self, text: str):
+        """Выставляет итоговый текст ответа."""
+        text = text.strip()
+        if not text or text == self._shown:
+            return
+        try:
+            await self._edit(text)
+        except TelegramAPIError as e:
+            raise BrainServiceError(f"Ошибка API Telegram при правке сообщения в чате {self.chat_id}: {e}") from e
+
+    async def _edit(self, text: str):
+        self._edited_at = time.monotonic()
+        try:
+            await self.bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message.message_id)
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                raise
+        self._shown = text
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+
+from typing import Any, Awaitable, Callable
+
+from cachetools import TTLCache
+
+from core.database.redis_client import RedisClient
+from core.config.parameters import (
+    CONFIG_CACHE_TTL,
+    CONFIG_LOCAL_CACHE_TTL,
+    CONFIG_LOCAL_CACHE_SIZE,
+    CONFIG_INVALIDATION_CHANNEL,
+    ROSTER_CACHE_TTL,
+    ROSTER_CACHE_SIZE,
+    ROSTER_NEGATIVE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class ConfigCache:
+    """
+    Двухуровневый кэш конфигураций мамы (строк mama_configs) по chat_id.
+    1-й уровень — LRU+TTL словарь в памяти процесса, 2-й — Redis (config_data:{chat_id}).
+    Изменения конфигов рассылаются всем воркерам через Redis pub/sub.
+    """
+
+    def __init__(
+            self,
+            redis_client: RedisClient,
+            maxsize: int = CONFIG_LOCAL_CACHE_SIZE,
+            ttl: int = CONFIG_LOCAL_CACHE_TTL,
+            redis_ttl: int = CONFIG_CACHE_TTL,
+            channel: str = CONFIG_INVALIDATION_CHANNEL
+    ):
+        self.redis = redis_client
+        self._local: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._redis_ttl = redis_ttl
+        self._channel = channel
+        self._generation = 0
+        self._listener_task: asyncio.Task | None = None
+        logger.info("ConfigCache инициализирован.")
+
+    @staticmethod
+    def _redis_key(chat_id: int) -> str:
+        return f"config_data:{chat_id}"
+
+    async def get(
+            self,
+            chat_id: int,
+            loader: Callable[[int], Awaitable[dict[str, Any] | None]]
+    ) -> dict[str, Any] | None:
+        """
+        Возвращает конфиг чата: из памяти процесса, затем из Redis, затем через loader (PostgreSQL).
+        Отсутствие конфига тоже кэшируется локально, чтобы чаты без мамы не нагружали БД.
+        """
+        config = self._local.get(chat_id, _MISSING)
+        if config is not _MISSING:
+            return config
+
+        generation = self._generation
+        config = await self.redis.get_json(self._redis_key(chat_id))
+        if config is None:
+            config = await loader(chat_id)
+            if config:
+                await self.redis.set_json(self._redis_key(chat_id), config, ttl_seconds=self._redis_ttl)
+
+        # Пока мы ходили в Redis/БД, конфиг могли изменить — такой результат уже устарел.
+        if generation == self._generation:
+            self._local[chat_id] = config
+        return config
+
+    async def invalidate(self, chat_id: int) -> None:
+        """Сбрасывает конфиг чата во всех уровнях кэша и оповещает остальные воркеры."""
+        self._drop(chat_id)
+        try:
+            await self.redis.delete(self._redis_key(chat_id))
+            await self.redis.publish(self._channel, str(chat_id))
+        except Exception as e:
+            logger.error(f"Не удалось разослать инвалидацию конфига для чата {chat_id}: {e}")
+
+    def _drop(self, chat_id: int) -> None:
+        self._generation += 1
+        self._local.pop(chat_id, None)
+
+    def clear(self) -> None:
+        """Полностью очищает локальный уровень кэша."""
+        self._generation += 1
+        self._local.clear()
+
+    async def start(self) -> None:
+        """Запускает фоновую подписку на инвалидации."""
+        if self._listener_task is None:
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        """Останавливает фоновую подписку на инвалидации."""
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self.redis.subscribe(self._channel):
+                    self._drop(int(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Пока подписка лежала, инвалидации могли потеряться — локальному уровню больше нельзя верить.
+                logger.error(f"Подписка на инвалидации конфигов прервана: {e}. Переподключаюсь...")
+                self.clear()
+                await asyncio.sleep(1)
+
+
+class RosterCache:
+    """
+    Кэш участников (participants) по config_id в памяти процесса.
+    Ростер чата загружается одним запросом, дальше участник находится по user_id за O(1).
+    Запись идет сквозь кэш (write-through), промахи запоминаются как отрицательные записи.
+    """
+
+    def __init__(
+            self,
+            maxsize: int = ROSTER_CACHE_SIZE,
+            ttl: int = ROSTER_CACHE_TTL,
+            negative_ttl: int = ROSTER_NEGATIVE_TTL
+    ):
+        self._rosters: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._misses: TTLCache = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._loading: dict[int, asyncio.Future] = {}
+        self._generations: dict[int, int] = {}
+        logger.info("RosterCache инициализирован.")
+
+    async def get_roster(
+            self,
+            config_id: int,
+            loader: Callable[[int], Awaitable[list[dict[str, Any]]]]
+    ) -> dict[int, dict[str, Any]]:
+        """
+        Возвращает ростер чата {user_id: participant}.
+        Параллельные промахи по одному config_id ждут один и тот же запрос к БД.
+        """
+        roster = self._rosters.get(config_id)
+        if roster is not None:
+            return roster
+
+        future = self._loading.get(config_id)
+        if future is None:
+            future = asyncio.ensure_future(self._load(config_id, loader))
+            self._loading[config_id] = future
+            future.add_done_callback(lambda _: self._loading.pop(config_id, None))
+        return await asyncio.shield(future)
+
+    async def _load(
+            self,
+            config_id: int,
+            loader: Callable[[int], Awaitable[list[dict[str, Any]]]]
+    ) -> dict[int, dict[str, Any]]:
+        generation = self._generations.get(config_id, 0)
+        rows = await loader(config_id)
+        roster = {row['user_id']: dict(row) for row in rows}
+        # Пока шел запрос, кто-то мог записать в ростер — такой снимок уже устарел.
+        if generation == self._generations.get(config_id, 0):
+            self._rosters[config_id] = roster
+        return roster
+
+    def is_known_missing(self, config_id: int, user_id: int) -> bool:
+        """Проверяет, запомнен ли user_id как отсутствующий в чате."""
+        return (config_id, user_id) in self._misses
+
+    def mark_missing(self, config_id: int, user_id: int) -> None:
+        """Запоминает промах, чтобы не спрашивать БД о незнакомце на каждое сообщение."""
+        self._misses[(config_id, user_id)] = True
+
+    def put(self, config_id: int, participant: dict[str, Any]) -> None:
+        """Записывает свежую строку участника в уже загруженный ростер."""
+        self._touch(config_id)
+        self._misses.pop((config_id, participant['user_id']), None)
+        roster = self._rosters.get(config_id)
+        if roster is not None:
+            roster[participant['user_id']] = dict(participant)
+
+    def invalidate(self, config_id: int) -> None:
+        """Сбрасывает ростер чата целиком."""
+        self._touch(config_id)
+        self._rosters.pop(config_id, None)
+
+    def _touch(self, config_id: int) -> None:
+        self._generations[config_id] = self._generations.get(config_id, 0) + 1
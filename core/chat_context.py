@@ -0,0 +1,153 @@
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping
+
+from core.database.postgres_client import AsyncPostgresManager
+from core.database.redis_client import QueueBatch, RedisClient
+from core.memory_index import MemoryVectorIndex
+from core.config.parameters import LONG_TERM_MEMORY_PER_PARTICIPANT
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних сообщений идет в поисковый запрос к индексу памяти.
+RECALL_QUERY_MESSAGES = 50
+
+
+@dataclass(frozen=True)
+class ChatContext:
+    """
+    Все, что нужно BrainService до вызова LLM: конфиг, активные участники (по запросу — с долгосрочной
+    памятью в ключе 'memories'), взятые в обработку очереди и (по запросу) короткая память диалога. Снимок неизменяемый — его можно спокойно передавать дальше.
+    """
+    config: Mapping[str, Any]
+    participants: tuple[dict, ...]
+    batches: Mapping[str, QueueBatch]
+    dialog_history: tuple[dict, ...] = ()
+
+    @property
+    def config_id(self) -> int:
+        return self.config['id']
+
+    @property
+    def participants_map(self) -> dict[int, dict]:
+        return {p['user_id']: p for p in self.participants}
+
+    @property
+    def child(self) -> dict | None:
+        child_id = self.config.get('child_participant_id')
+        return next((p for p in self.participants if p['id'] == child_id), None)
+
+    def batch(self, queue_name: str) -> QueueBatch:
+        return self.batches[queue_name]
+
+
+def attach_memories(participants: list[dict], memories: dict[int, list[str]]) -> list[dict]:
+    """Копии участников с их воспоминаниями в ключе 'memories' (для блока участников в промпте)."""
+    return [{**p, 'memories': memories.get(p['id'], [])} for p in participants]
+
+
+class ChatContextLoader:
+    """
+    Загружает ChatContext за один round trip в каждое хранилище, причем все идут параллельно:
+    PostgreSQL — конфиг вместе с ростером (json_agg) и, если нужно, долгосрочная память,
+    Redis — очереди и память диалога одним pipeline.
+
+    С memory_index воспоминания подбираются по близости к текущим сообщениям (MemoryVectorIndex),
+    без него — top-k самых важных и свежих одним LATERAL-запросом.
+    """
+
+    def __init__(
+            self,
+            db_manager: AsyncPostgresManager,
+            redis_client: RedisClient,
+            memories_per_participant: int = LONG_TERM_MEMORY_PER_PARTICIPANT,
+            memory_index: MemoryVectorIndex | None = None
+    ):
+        self.db = db_manager
+        self.redis = redis_client
+        self.memories_per_participant = memories_per_participant
+        self.memory_index = memory_index
+
+    async def load(
+            self,
+            config_id: int,
+            queue_names: list[str],
+            memory_key: str | None = None,
+            with_memories: bool = False
+    ) -> ChatContext | None:
+        """
+        Берет в обработку очереди queue_names и читает memory_key, одновременно загружая конфиг с участниками.
+        with_memories — подгрузить долгосрочную память участников, подходящую к взятым сообщениям
+        (а если очереди пусты — к памяти диалога).
+        Если конфига нет, взятые сообщения возвращаются в очереди и результатом будет None;
+        при ошибке чтения из БД они тоже возвращаются, а ошибка пробрасывается дальше.
+        """
+        json_keys = [memory_key] if memory_key else []
+        roster, claimed, memories = await asyncio.gather(
+            self.db.get_config_with_participants(config_id),
+            self.redis.claim_batches(queue_names, json_keys),
+            self._prefetch_memories(config_id, with_memories),
+            return_exceptions=True
+        )
+        if isinstance(claimed, BaseException):
+            raise claimed
+        batches, values = claimed
+
+        # Со списками claim уже удалил сообщения из Redis: при ошибке БД или без конфига возвращаем их в очереди.
+        error = next((result for result in (roster, memories) if isinstance(result, BaseException)), None)
+        config, participants = (None, []) if error else roster
+        if not config:
+            for batch in batches:
+                await self.redis.release_batch(batch)
+            if error:
+                raise error
+            return None
+
+        dialog_history = tuple(values[0] or []) if memory_key else ()
+        if with_memories:
+            messages = [item for batch in batches for item in batch.items] or list(dialog_history)
+            participants = attach_memories(participants, self._match_memories(config_id, memories, participants, messages))
+
+        return ChatContext(
+            config=MappingProxyType(config),
+            participants=tuple(participants),
+            batches=MappingProxyType({batch.queue_name: batch for batch in batches}),
+            dialog_history=dialog_history
+        )
+
+    async def load_participants(self, config_id: int, messages: list[dict]) -> list[dict]:
+        """Активные участники чата с воспоминаниями, подходящими к messages (для ответа вне очередей)."""
+        participants, memories = await asyncio.gather(
+            self.db.get_all_participants_by_config_id(config_id),
+            self._prefetch_memories(config_id, True)
+        )
+        return attach_memories(participants, self._match_memories(config_id, memories, participants, messages))
+
+    async def _prefetch_memories(self, config_id: int, enabled: bool) -> dict[int, list[str]] | None:
+        """
+        Готовит воспоминания, пока грузится остальной контекст. Возвращает их сразу (без индекса)
+        или None, если их нужно выбрать поиском по индексу, когда станут известны сообщения.
+        """
+        if not enabled:
+            return {}
+        if self.memory_index is None:
+            return await self.db.get_long_term_memories(config_id, self.memories_per_participant)
+        await self.memory_index.sync(config_id, self.db.get_long_term_memories_since)
+        return None
+
+    def _match_memories(
+            self,
+            config_id: int,
+            memories: dict[int, list[str]] | None,
+            participants: list[dict],
+            messages: list[dict]
+    ) -> dict[int, list[str]]:
+        if memories is not None:
+            return memories
+        query = " ".join(msg.get('text') or msg.get('content') or '' for msg in messages[-RECALL_QUERY_MESSAGES:])
+        return self.memory_index.search(
+            config_id, query, [p['id'] for p in participants], self.memories_per_participant
+        )
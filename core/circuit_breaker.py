@@ -0,0 +1,84 @@
+import logging
+import time
+
+from enum import Enum
+
+from core.config.parameters import LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"  # все в порядке, вызовы идут
+    OPEN = "open"  # зависимость лежит, вызовы отклоняются сразу
+    HALF_OPEN = "half_open"  # пробный вызов решает, закрыться или снова открыться
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешней зависимости.
+    После failure_threshold ошибок подряд размыкается и reset_timeout секунд отклоняет вызовы сразу,
+    не дожидаясь таймаутов. Затем пропускает один пробный вызов: успех замыкает цепь, ошибка — снова размыкает.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state is CircuitState.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = CircuitState.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    @property
+    def retry_after(self) -> float:
+        """Сколько секунд до пробного вызова (0, если цепь не разомкнута)."""
+        if self.state is not CircuitState.OPEN:
+            return 0.0
+        return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Можно ли сейчас выполнять вызов. В HALF_OPEN пропускается только один пробный."""
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is not CircuitState.HALF_OPEN:
+            return False
+        # Пробный вызов, который так и не отчитался (например, его отменили), через reset_timeout заменяем новым.
+        if not self._probe_in_flight or time.monotonic() - self._probe_started_at >= self.reset_timeout:
+            self._probe_in_flight = True
+            self._probe_started_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        if self._state is not CircuitState.CLOSED:
+            logger.info(f"Предохранитель {self.name} замкнут: зависимость снова отвечает.")
+        self._state = CircuitState.CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state is CircuitState.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state is not CircuitState.OPEN:
+                logger.warning(
+                    f"Предохранитель {self.name} разомкнут после {self._failures} ошибок, "
+                    f"вызовы отклоняются {self.reset_timeout:.0f} с."
+                )
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
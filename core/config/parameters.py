@@ -1,101 +1,228 @@
-import logging
-import random
-
-from dotenv import load_dotenv
-from faker import Faker
-
-from core.utils import get_str_env, get_int_env, get_float_env
-
-
-logger = logging.getLogger(__name__)
-load_dotenv()
-
-# ------- TOKENS -------
-BOT_TOKEN = get_str_env('BOT_TOKEN', 'default')
-if BOT_TOKEN == 'default':
-    logger.critical("Токен бота (BOT_TOKEN) не найден в .env файле!")
-    exit("Токен бота не найден!")
-
-GEMINI_API_KEY = get_str_env('GEMINI_API_KEY', 'default')
-if GEMINI_API_KEY == 'default':
-    logger.critical("API ключ для Gemini (GEMINI_API_KEY) не найден в .env файле!")
-    exit("API ключ для Gemini не найден!")
-
-# ------- DSN -------
-DB_USER = get_str_env('DB_USER', 'postgres')
-DB_PASSWORD = get_str_env('DB_PASSWORD', 'password')
-DB_HOST = get_str_env('DB_HOST', 'localhost')
-DB_PORT = get_int_env('DB_PORT', 5432)
-DB_NAME = get_str_env('DB_NAME', 'your_mama_bot_db')
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-
-# ------- DSN for test_db -------
-TEST_DB_USER = get_str_env('TEST_DB_USER', 'postgres')
-TEST_DB_PASSWORD = get_str_env('TEST_DB_PASSWORD', 'password')
-TEST_DB_HOST = get_str_env('TEST_DB_HOST', 'localhost')
-TEST_DB_PORT = get_int_env('TEST_DB_PORT', 5432)
-TEST_DB_NAME = get_str_env('TEST_DB_NAME', 'test_mama_db')
-TEST_DATABASE_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}"
-
-TEST_TABLES = [
-    "long_term_memory",
-    "message_log",
-    "participants",
-    "mama_configs",
-]
-
-
-# ------- FOR POOL -------
-POOL_PARAMETERS = {
-    'POOL_MIN_SIZE': get_int_env('POOL_MIN_SIZE', 1),
-    'POOL_MAX_SIZE': get_int_env('POOL_MAX_SIZE', 10),
-    'DEFAULT_COMMAND_TIMEOUT_SECONDS': get_float_env('DEFAULT_COMMAND_TIMEOUT_SECONDS', 5.0),
-    'CONNECT_RETRY_ATTEMPTS': get_int_env('CONNECT_RETRY_ATTEMPTS', 3),
-    'CONNECT_RETRY_DELAY_SECONDS': get_int_env('CONNECT_RETRY_DELAY_SECONDS', 1)
-}
-
-# ------- Scheduler -------
-MORNING_GATHERING_HOUR = get_int_env('MORNING_GATHERING_HOUR', 8)
-MORNING_GATHERING_MINUTE = get_int_env('MORNING_GATHERING_MINUTE', 50)
-MORNING_ONLINE_DURATION = get_int_env('MORNING_ONLINE_DURATION', 10
-                                      )
-DAY_GATHERING_HOUR = get_int_env('DAY_GATHERING_HOUR', 13)
-DAY_GATHERING_MINUTE = get_int_env('DAY_GATHERING_MINUTE', 0)
-DAY_ONLINE_DURATION = get_int_env('DAY_ONLINE_DURATION', 15)
-
-EVENING_GATHERING_HOUR = get_int_env('EVENING_GATHERING_HOUR', 19)
-EVENING_GATHERING_MINUTE = get_int_env('EVENING_GATHERING_MINUTE', 0)
-EVENING_ONLINE_DURATION = get_int_env('EVENING_ONLINE_DURATION', 20)
-
-RANDOM_DAY_CHANCE_PERCENT = get_int_env('RANDOM_DAY_CHANCE_PERCENT', 15)
-RANDOM_NIGHT_CHANCE_PERCENT = get_int_env('EVENING_GATHERING_MINUTE', 10)
-
-RANDOM_GATHERING_DURATION = get_int_env('RANDOM_GATHERING_DURATION', 10)
-RANDOM_ONLINE_DURATION_DAY = get_int_env('RANDOM_ONLINE_DURATION_DAY', 10)
-RANDOM_ONLINE_DURATION_NIGHT = get_int_env('RANDOM_ONLINE_DURATION_NIGHT', 10)
-
-RANDOM_DAY_HOUR = get_int_env('RANDOM_DAY_HOUR', 16)
-RANDOM_DAY_MINUTE = get_int_env('RANDOM_DAY_MINUTE', 0)
-RANDOM_NIGHT_HOUR  = get_int_env('RANDOM_NIGHT_HOUR', 23)
-RANDOM_NIGHT_MINUTE = get_int_env('RANDOM_NIGHT_MINUTE', 0)
-
-GATHERING_DURATION_MINUTES = get_int_env('GATHERING_DURATION_MINUTES', 15)
-ONLINE_SESSION_DURATION_MINUTES = get_int_env('ONLINE_SESSION_DURATION_MINUTES', 20)
-
-# ------- Faker -------
-fake = Faker("ru_RU")
-
-# ------- REDIS -------
-REDIS_HOST = get_str_env('REDIS_HOST', 'localhost')
-REDIS_PORT = get_int_env('REDIS_PORT', 6379)
-CONFIG_CACHE_TTL = get_int_env('CONFIG_CACHE_TTL', 3600)
-
-# ------- OPERATOR -------
-PASSIVE_MODE_CHANCE = get_int_env('PASSIVE_MODE_CHANCE', 20)
-ONLINE_MODE_REPLY_LIMIT = get_int_env('ONLINE_MODE_REPLY_LIMIT', 10)
-ONLINE_MODE_USER_COOLDOWN_SECONDS = get_int_env('ONLINE_MODE_USER_COOLDOWN_SECONDS', 60)
-ONLINE_MODE_BATCH_THRESHOLD = get_int_env('ONLINE_MODE_BATCH_THRESHOLD', 3)
-
-# --- BrainService
-SHORT_TERM_MEMORY_LIMIT = get_int_env('SHORT_TERM_MEMORY_LIMIT', 30)
-SHORT_TERM_MEMORY_TTL = get_int_env('SHORT_TERM_MEMORY_TTL', 3600)
+import logging
+import random
+import re
+
+from dotenv import load_dotenv
+from faker import Faker
+
+from core.utils import get_str_env, get_int_env, get_float_env, get_bool_env
+
+
+logger = logging.getLogger(__name__)
+load_dotenv()
+
+# ------- TOKENS -------
+BOT_TOKEN = get_str_env('BOT_TOKEN', 'default')
+if BOT_TOKEN == 'default':
+    logger.critical("Токен бота (BOT_TOKEN) не найден в .env файле!")
+    exit("Токен бота не найден!")
+
+GEMINI_API_KEY = get_str_env('GEMINI_API_KEY', 'default')
+if GEMINI_API_KEY == 'default':
+    logger.critical("API ключ для Gemini (GEMINI_API_KEY) не найден в .env файле!")
+    exit("API ключ для Gemini не найден!")
+
+# ------- LLM -------
+LLM_MAX_IN_FLIGHT = get_int_env('LLM_MAX_IN_FLIGHT', 32)
+LLM_RPM_LIMIT = get_int_env('LLM_RPM_LIMIT', 60)
+LLM_TPM_LIMIT = get_int_env('LLM_TPM_LIMIT', 1000000)
+LLM_BUCKET_BURST_SECONDS = get_float_env('LLM_BUCKET_BURST_SECONDS', 10.0)  # сколько секунд квоты можно выбрать разом
+LLM_MODEL_DEFAULT = get_str_env('LLM_MODEL_DEFAULT', 'gemini-1.5-flash')
+LLM_MODEL_FAST = get_str_env('LLM_MODEL_FAST', 'gemini-1.5-flash-8b')  # сюда понижаемся при деградации
+
+# Маршруты по типам промптов: модель, лимит выходных токенов, таймаут (секунды).
+LLM_ROUTES = {
+    'gathering': {
+        'model': get_str_env('LLM_MODEL_GATHERING', LLM_MODEL_DEFAULT),
+        'max_output_tokens': get_int_env('LLM_MAX_TOKENS_GATHERING', 2048),
+        'timeout': get_float_env('LLM_TIMEOUT_GATHERING', 60.0),
+    },
+    'online': {
+        'model': get_str_env('LLM_MODEL_ONLINE', LLM_MODEL_FAST),
+        'max_output_tokens': get_int_env('LLM_MAX_TOKENS_ONLINE', 512),
+        'timeout': get_float_env('LLM_TIMEOUT_ONLINE', 20.0),
+    },
+    'single_reply': {
+        'model': get_str_env('LLM_MODEL_SINGLE_REPLY', LLM_MODEL_DEFAULT),
+        'max_output_tokens': get_int_env('LLM_MAX_TOKENS_SINGLE_REPLY', 512),
+        'timeout': get_float_env('LLM_TIMEOUT_SINGLE_REPLY', 20.0),
+    },
+    'final_reply': {
+        'model': get_str_env('LLM_MODEL_FINAL_REPLY', LLM_MODEL_DEFAULT),
+        'max_output_tokens': get_int_env('LLM_MAX_TOKENS_FINAL_REPLY', 1024),
+        'timeout': get_float_env('LLM_TIMEOUT_FINAL_REPLY', 30.0),
+    },
+    'summary': {
+        'model': get_str_env('LLM_MODEL_SUMMARY', LLM_MODEL_FAST),
+        'max_output_tokens': get_int_env('LLM_MAX_TOKENS_SUMMARY', 512),
+        'timeout': get_float_env('LLM_TIMEOUT_SUMMARY', 30.0),
+    },
+}
+LLM_DOWNGRADE_LATENCY = get_float_env('LLM_DOWNGRADE_LATENCY', 15.0)  # средняя задержка модели, после которой понижаемся
+LLM_DOWNGRADE_ERROR_RATE = get_float_env('LLM_DOWNGRADE_ERROR_RATE', 0.3)
+LLM_HEALTH_WINDOW = get_int_env('LLM_HEALTH_WINDOW', 20)  # по скольким последним вызовам судим о модели
+LLM_DOWNGRADE_COOLDOWN = get_float_env('LLM_DOWNGRADE_COOLDOWN', 120.0)  # через сколько секунд пробуем вернуться
+LLM_RETRY_ATTEMPTS = get_int_env('LLM_RETRY_ATTEMPTS', 3)  # всего попыток при временных ошибках
+LLM_RETRY_BASE_DELAY = get_float_env('LLM_RETRY_BASE_DELAY', 0.5)
+LLM_RETRY_MAX_DELAY = get_float_env('LLM_RETRY_MAX_DELAY', 8.0)
+LLM_HEDGING = get_bool_env('LLM_HEDGING', True)  # дублировать запрос, если он дольше p95
+LLM_HEDGE_MIN_DELAY = get_float_env('LLM_HEDGE_MIN_DELAY', 1.0)  # раньше этого не дублируем
+LLM_HEDGE_MIN_SAMPLES = get_int_env('LLM_HEDGE_MIN_SAMPLES', 20)  # пока замеров меньше, p95 не считаем
+LLM_LATENCY_WINDOW = get_int_env('LLM_LATENCY_WINDOW', 200)
+LLM_BREAKER_FAILURE_THRESHOLD = get_int_env('LLM_BREAKER_FAILURE_THRESHOLD', 5)  # ошибок подряд до размыкания
+LLM_BREAKER_RESET_TIMEOUT = get_float_env('LLM_BREAKER_RESET_TIMEOUT', 30.0)  # секунд до пробного вызова
+LLM_STRUCTURED_OUTPUT = get_bool_env('LLM_STRUCTURED_OUTPUT', True)  # JSON по схеме вместо текста с ===JSON===
+
+# ------- PROMPT BUDGET (токены) -------
+PROMPT_BUDGET_GATHERING = get_int_env('PROMPT_BUDGET_GATHERING', 8000)
+PROMPT_BUDGET_ONLINE = get_int_env('PROMPT_BUDGET_ONLINE', 4000)
+PROMPT_BUDGET_SINGLE_REPLY = get_int_env('PROMPT_BUDGET_SINGLE_REPLY', 3000)
+PROMPT_BUDGET_FINAL_REPLY = get_int_env('PROMPT_BUDGET_FINAL_REPLY', 4000)
+PROMPT_MAX_MESSAGE_TOKENS = get_int_env('PROMPT_MAX_MESSAGE_TOKENS', 400)  # длиннее — обрезается
+
+# ------- SUMMARY (map-reduce фоновой очереди) -------
+SUMMARY_MIN_MESSAGES = get_int_env('SUMMARY_MIN_MESSAGES', 150)  # меньше — в промпт идут сырые сообщения
+SUMMARY_CHUNK_SIZE = get_int_env('SUMMARY_CHUNK_SIZE', 100)
+SUMMARY_MAX_PARALLEL = get_int_env('SUMMARY_MAX_PARALLEL', 8)
+SUMMARY_CACHE_TTL = get_int_env('SUMMARY_CACHE_TTL', 86400)
+
+# ------- MEMORY CONSOLIDATION (ночное сжатие long_term_memory) -------
+MEMORY_CONSOLIDATION_ENABLED = get_bool_env('MEMORY_CONSOLIDATION_ENABLED', True)
+MEMORY_CONSOLIDATION_THRESHOLD = get_int_env('MEMORY_CONSOLIDATION_THRESHOLD', 50)  # сжимать участников, у кого воспоминаний больше
+MEMORY_CONSOLIDATION_BATCH = get_int_env('MEMORY_CONSOLIDATION_BATCH', 100)  # участников за один проход по чату
+MEMORY_CONSOLIDATION_SIMILARITY = get_float_env('MEMORY_CONSOLIDATION_SIMILARITY', 0.7)  # косинус, с которого факты — дубли
+MEMORY_CONSOLIDATION_KEEP_RECENT = get_int_env('MEMORY_CONSOLIDATION_KEEP_RECENT', 20)  # свежие воспоминания не архивируются
+MEMORY_CONSOLIDATION_ARCHIVE_DAYS = get_int_env('MEMORY_CONSOLIDATION_ARCHIVE_DAYS', 90)  # возраст неважных воспоминаний для архива
+MEMORY_CONSOLIDATION_MAX_PARALLEL = get_int_env('MEMORY_CONSOLIDATION_MAX_PARALLEL', 2)
+MEMORY_CONSOLIDATION_HOUR = get_int_env('MEMORY_CONSOLIDATION_HOUR', 4)  # по таймзоне чата
+
+# ------- DSN -------
+DB_USER = get_str_env('DB_USER', 'postgres')
+DB_PASSWORD = get_str_env('DB_PASSWORD', 'password')
+DB_HOST = get_str_env('DB_HOST', 'localhost')
+DB_PORT = get_int_env('DB_PORT', 5432)
+DB_NAME = get_str_env('DB_NAME', 'your_mama_bot_db')
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# ------- DSN for test_db -------
+TEST_DB_USER = get_str_env('TEST_DB_USER', 'postgres')
+TEST_DB_PASSWORD = get_str_env('TEST_DB_PASSWORD', 'password')
+TEST_DB_HOST = get_str_env('TEST_DB_HOST', 'localhost')
+TEST_DB_PORT = get_int_env('TEST_DB_PORT', 5432)
+TEST_DB_NAME = get_str_env('TEST_DB_NAME', 'test_mama_db')
+TEST_DATABASE_URL = f"postgresql://{TEST_DB_USER}:{TEST_DB_PASSWORD}@{TEST_DB_HOST}:{TEST_DB_PORT}/{TEST_DB_NAME}"
+
+TEST_TABLES = [
+    "long_term_memory_archive",
+    "long_term_memory",
+    "message_log",
+    "participants",
+    "mama_configs",
+]
+
+
+# ------- FOR POOL -------
+POOL_PARAMETERS = {
+    'POOL_MIN_SIZE': get_int_env('POOL_MIN_SIZE', 1),
+    'POOL_MAX_SIZE': get_int_env('POOL_MAX_SIZE', 10),
+    'DEFAULT_COMMAND_TIMEOUT_SECONDS': get_float_env('DEFAULT_COMMAND_TIMEOUT_SECONDS', 5.0),
+    'CONNECT_RETRY_ATTEMPTS': get_int_env('CONNECT_RETRY_ATTEMPTS', 3),
+    'CONNECT_RETRY_DELAY_SECONDS': get_int_env('CONNECT_RETRY_DELAY_SECONDS', 1)
+}
+
+# ------- Scheduler -------
+MORNING_GATHERING_HOUR = get_int_env('MORNING_GATHERING_HOUR', 8)
+MORNING_GATHERING_MINUTE = get_int_env('MORNING_GATHERING_MINUTE', 50)
+MORNING_ONLINE_DURATION = get_int_env('MORNING_ONLINE_DURATION', 10
+                                      )
+DAY_GATHERING_HOUR = get_int_env('DAY_GATHERING_HOUR', 13)
+DAY_GATHERING_MINUTE = get_int_env('DAY_GATHERING_MINUTE', 0)
+DAY_ONLINE_DURATION = get_int_env('DAY_ONLINE_DURATION', 15)
+
+EVENING_GATHERING_HOUR = get_int_env('EVENING_GATHERING_HOUR', 19)
+EVENING_GATHERING_MINUTE = get_int_env('EVENING_GATHERING_MINUTE', 0)
+EVENING_ONLINE_DURATION = get_int_env('EVENING_ONLINE_DURATION', 20)
+
+RANDOM_DAY_CHANCE_PERCENT = get_int_env('RANDOM_DAY_CHANCE_PERCENT', 15)
+RANDOM_NIGHT_CHANCE_PERCENT = get_int_env('EVENING_GATHERING_MINUTE', 10)
+
+RANDOM_GATHERING_DURATION = get_int_env('RANDOM_GATHERING_DURATION', 10)
+RANDOM_ONLINE_DURATION_DAY = get_int_env('RANDOM_ONLINE_DURATION_DAY', 10)
+RANDOM_ONLINE_DURATION_NIGHT = get_int_env('RANDOM_ONLINE_DURATION_NIGHT', 10)
+
+RANDOM_DAY_HOUR = get_int_env('RANDOM_DAY_HOUR', 16)
+RANDOM_DAY_MINUTE = get_int_env('RANDOM_DAY_MINUTE', 0)
+RANDOM_NIGHT_HOUR  = get_int_env('RANDOM_NIGHT_HOUR', 23)
+RANDOM_NIGHT_MINUTE = get_int_env('RANDOM_NIGHT_MINUTE', 0)
+
+GATHERING_DURATION_MINUTES = get_int_env('GATHERING_DURATION_MINUTES', 15)
+ONLINE_SESSION_DURATION_MINUTES = get_int_env('ONLINE_SESSION_DURATION_MINUTES', 20)
+
+# ------- UPDATES -------
+UPDATES_MODE = get_str_env('UPDATES_MODE', 'polling')  # polling | webhook
+WEBHOOK_BASE_URL = get_str_env('WEBHOOK_BASE_URL', '')  # публичный https-адрес, например https://bot.example.com
+WEBHOOK_PATH = get_str_env('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = get_str_env('WEBHOOK_SECRET', '')  # 1-256 символов A-Z, a-z, 0-9, _ и - (требование Telegram)
+if UPDATES_MODE == 'webhook' and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', WEBHOOK_SECRET):
+    logger.critical("WEBHOOK_SECRET пуст или содержит недопустимые символы (разрешены A-Z, a-z, 0-9, _ и -)!")
+    exit("Без WEBHOOK_SECRET вебхук принимал бы апдейты от кого угодно!")
+WEBHOOK_HOST = get_str_env('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = get_int_env('WEBHOOK_PORT', 8080)
+WEBHOOK_WORKERS = get_int_env('WEBHOOK_WORKERS', 1)
+
+# ------- SHARDING -------
+SHARDING_ENABLED = get_bool_env('SHARDING_ENABLED', False)
+SHARD_LEASE_TTL = get_int_env('SHARD_LEASE_TTL', 15)
+SHARD_HEARTBEAT_INTERVAL = get_float_env('SHARD_HEARTBEAT_INTERVAL', 5.0)
+SHARD_VNODES = get_int_env('SHARD_VNODES', 64)
+# Сколько живет входящая очередь воркера без новых апдейтов; больше SHARD_LEASE_TTL, чтобы живые воркеры
+# успели разобрать очередь упавшего, а брошенная не висела в Redis вечно.
+SHARD_INBOX_TTL = get_int_env('SHARD_INBOX_TTL', 300)
+
+# ------- Faker -------
+fake = Faker("ru_RU")
+
+# ------- REDIS -------
+REDIS_HOST = get_str_env('REDIS_HOST', 'localhost')
+REDIS_PORT = get_int_env('REDIS_PORT', 6379)
+REDIS_WRITE_BATCHING = get_bool_env('REDIS_WRITE_BATCHING', False)
+REDIS_WRITE_BATCH_DELAY_MS = get_float_env('REDIS_WRITE_BATCH_DELAY_MS', 2.0)
+REDIS_WRITE_BATCH_MAX_ITEMS = get_int_env('REDIS_WRITE_BATCH_MAX_ITEMS', 64)
+QUEUE_BACKEND = get_str_env('QUEUE_BACKEND', 'list')  # list | stream
+STREAM_CONSUMER_GROUP = get_str_env('STREAM_CONSUMER_GROUP', 'brain')
+# Должен быть заметно больше худшего времени обработки пачки (таймаут LLM x LLM_RETRY_ATTEMPTS плюс пересказ),
+# иначе XAUTOCLAIM отдаст еще обрабатываемую пачку другому воркеру.
+STREAM_CLAIM_IDLE_MS = get_int_env('STREAM_CLAIM_IDLE_MS', 600000)
+STREAM_BATCH_SIZE = get_int_env('STREAM_BATCH_SIZE', 1000)
+# legacy_json | json | msgpack. По умолчанию legacy_json — его читают и воркеры на старом коде;
+# json/msgpack включать только после того, как новый код выкачен на все воркеры.
+REDIS_CODEC = get_str_env('REDIS_CODEC', 'legacy_json')
+REDIS_COMPRESS_MIN_BYTES = get_int_env('REDIS_COMPRESS_MIN_BYTES', 1024)  # 0 — не сжимать
+CONFIG_CACHE_TTL = get_int_env('CONFIG_CACHE_TTL', 3600)
+CONFIG_LOCAL_CACHE_TTL = get_int_env('CONFIG_LOCAL_CACHE_TTL', 300)
+CONFIG_LOCAL_CACHE_SIZE = get_int_env('CONFIG_LOCAL_CACHE_SIZE', 10000)
+CONFIG_INVALIDATION_CHANNEL = get_str_env('CONFIG_INVALIDATION_CHANNEL', 'config_invalidation')
+ROSTER_CACHE_TTL = get_int_env('ROSTER_CACHE_TTL', 300)
+ROSTER_CACHE_SIZE = get_int_env('ROSTER_CACHE_SIZE', 10000)
+ROSTER_NEGATIVE_TTL = get_int_env('ROSTER_NEGATIVE_TTL', 60)
+MEMORY_INDEX_ENABLED = get_bool_env('MEMORY_INDEX_ENABLED', True)  # подбирать воспоминания по смыслу, а не по свежести
+MEMORY_INDEX_DIR = get_str_env('MEMORY_INDEX_DIR', 'data/memory_index')
+MEMORY_INDEX_DIM = get_int_env('MEMORY_INDEX_DIM', 512)
+MEMORY_INDEX_FLUSH_INTERVAL = get_float_env('MEMORY_INDEX_FLUSH_INTERVAL', 60.0)  # секунды между сохранениями на диск
+FSM_STATE_TTL = get_int_env('FSM_STATE_TTL', 3600)
+FSM_DATA_TTL = get_int_env('FSM_DATA_TTL', 3600)
+
+# ------- OPERATOR -------
+PASSIVE_MODE_CHANCE = get_int_env('PASSIVE_MODE_CHANCE', 20)
+ONLINE_MODE_REPLY_LIMIT = get_int_env('ONLINE_MODE_REPLY_LIMIT', 10)
+ONLINE_MODE_USER_COOLDOWN_SECONDS = get_int_env('ONLINE_MODE_USER_COOLDOWN_SECONDS', 60)
+ONLINE_MODE_BATCH_THRESHOLD = get_int_env('ONLINE_MODE_BATCH_THRESHOLD', 3)
+
+# --- BrainService
+SHORT_TERM_MEMORY_LIMIT = get_int_env('SHORT_TERM_MEMORY_LIMIT', 30)
+SHORT_TERM_MEMORY_TTL = get_int_env('SHORT_TERM_MEMORY_TTL', 3600)
+LONG_TERM_MEMORY_PER_PARTICIPANT = get_int_env('LONG_TERM_MEMORY_PER_PARTICIPANT', 3)  # воспоминаний на человека в промпте
+REPLY_STREAMING = get_bool_env('REPLY_STREAMING', True)  # показывать ответ по мере генерации
+REPLY_STREAM_EDIT_INTERVAL = get_float_env('REPLY_STREAM_EDIT_INTERVAL', 1.5)  # не чаще одной правки в N секунд
+SINGLE_FLIGHT_LEASE_TTL = get_int_env('SINGLE_FLIGHT_LEASE_TTL', 30)  # секунды, аренда продлевается, пока идет обработка
+SINGLE_FLIGHT_POLL_INTERVAL = get_float_env('SINGLE_FLIGHT_POLL_INTERVAL', 0.2)
@@ -1,3 +1,3 @@
-from typing import Literal
-
+from typing import Literal
+
 QueryMode = Literal['execute', 'fetch_all', 'fetch_row', 'fetch_val']
\ No newline at end of file
@@ -0,0 +1,107 @@
+import json
+import logging
+
+from enum import Enum
+from typing import Any
+
+from core.exceptions import CodecError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Байт 0xC1 не встречается ни в UTF-8, ни в msgpack, ни в начале JSON,
+# поэтому по нему значения нового формата безошибочно отличаются от старого JSON.
+MAGIC = b"\xc1"
+FLAG_ZSTD = 0x80
+
+
+class CodecFormat(str, Enum):
+    """Формат сериализации значений в Redis."""
+    LEGACY_JSON = "legacy_json"  # JSON без заголовка, как раньше — для первой фазы миграции
+    JSON = "json"
+    MSGPACK = "msgpack"
+
+
+_FORMAT_IDS = {CodecFormat.JSON: 0x01, CodecFormat.MSGPACK: 0x02}
+
+
+class PayloadCodec:
+    """
+    Кодек значений RedisClient: работает с bytes в обе стороны.
+    Новые значения пишутся с заголовком MAGIC + байт формата (старший бит — сжато zstd),
+    поэтому читатель понимает любой формат, а старый JSON без заголовка читается как есть.
+    Это позволяет переключать формат на живой системе: сначала выкатить код, потом сменить REDIS_CODEC.
+    """
+
+    def __init__(self, fmt: CodecFormat = CodecFormat.JSON, compress_min_bytes: int | None = None):
+        self.format = CodecFormat(fmt)
+        if self.format is CodecFormat.MSGPACK and msgpack is None:
+            raise CodecError("Формат msgpack выбран, но пакет msgpack не установлен.")
+        if compress_min_bytes is not None and zstandard is None:
+            logger.warning("zstandard не установлен, сжатие значений в Redis отключено.")
+            compress_min_bytes = None
+        self._compress_min_bytes = compress_min_bytes
+        self._compressor = zstandard.ZstdCompressor(level=3) if compress_min_bytes is not None else None
+        self._decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+    def encode(self, value: Any) -> bytes:
+        """Сериализует значение (и сжимает, если оно больше порога)."""
+        if self.format is CodecFormat.LEGACY_JSON:
+            return _dump_json(value)
+
+        format_id = _FORMAT_IDS[self.format]
+        body = _dump_json(value) if self.format is CodecFormat.JSON else msgpack.packb(value, use_bin_type=True)
+        if self._compressor is not None and len(body) >= self._compress_min_bytes:
+            body = self._compressor.compress(body)
+            format_id |= FLAG_ZSTD
+        return MAGIC + bytes([format_id]) + body
+
+    def decode(self, raw: bytes | str | None) -> Any:
+        """Десериализует значение любого поддерживаемого формата, включая старый JSON без заголовка."""
+        if raw is None:
+            return None
+        if isinstance(raw, str):
+            raw = raw.encode()
+        if not raw.startswith(MAGIC):
+            return _load_json(raw)
+
+        format_id, body = raw[1], raw[2:]
+        if format_id & FLAG_ZSTD:
+            if self._decompressor is None:
+                raise CodecError("Значение сжато zstd, но пакет zstandard не установлен.")
+            body = self._decompressor.decompress(body)
+            format_id &= ~FLAG_ZSTD
+
+        if format_id == _FORMAT_IDS[CodecFormat.JSON]:
+            return _load_json(body)
+        if format_id == _FORMAT_IDS[CodecFormat.MSGPACK]:
+            if msgpack is None:
+                raise CodecError("Значение в формате msgpack, но пакет msgpack не установлен.")
+            return msgpack.unpackb(body, raw=False)
+        raise CodecError(f"Неизвестный формат значения в Redis: {format_id:#x}")
+
+
+def _dump_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _load_json(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
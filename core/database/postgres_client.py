@@ -1,245 +1,509 @@
-import logging
-import asyncio
-import asyncpg
-
-from typing import Any
-from asyncpg import exceptions as error_database
-from datetime import datetime
-
-from core.logging_config import log_error
-from core.config.types import QueryMode
-from core.database.postgres_pool import PostgresPool
-from core.exceptions import (
-    DatabaseConnectionError,
-    DatabaseQueryError,
-    UnexpectedError,
-    PoolConnectionError
-)
-import core.sql_queries as queries
-
-logger = logging.getLogger(__name__)
-
-
-class AsyncPostgresManager:
-    """
-    Управляет асинхронными запросами к базе данных для проекта "Твоя Мама",
-    используя предоставленный пул соединений.
-    """
-
-    def __init__(self, pool: PostgresPool):
-        self._pool = pool
-        logger.info(f"AsyncDatabaseManager инициализирован.")
-
-    @staticmethod
-    def _record_to_dict(record: asyncpg.Record | None) -> dict[str, Any] | None:
-        return dict(record) if record else None
-
-    @staticmethod
-    def _records_to_list_records(records: list[asyncpg.Record]) -> list[dict[str, Any]]:
-        return [dict(record) for record in records]
-
-    @log_error
-    async def _execute(
-            self,
-            query: str,
-            params: tuple = (),
-            mode: QueryMode = 'execute',
-            timeout: float | None = None
-    ) -> Any | None:
-        """
-        Не работает без пула подключения!
-        Args:
-            :param query: SQL строки (плейсхолдеры $1, $2)
-            :param params: Кортеж параметров для SQL.
-            :param mode: Параметр для execution SQL:
-                'execute': Возвращает количество затронутых строк (для INSERT/UPDATE/DELETE).
-                'fetch_all': Возвращает все строки в виде списка словарей.
-                'fetch_row': Возвращает одну строку в виде словаря или None, если данных нет.
-                'fetch_val': Возвращает одно значение из первой строки или None, если данных нет.
-            :param timeout: Опциональная команда задержки в секундах.
-            :return: Зависит от mode:
-                'execute': int(количество затронутых строк)
-                'fetch_all': list[dict[str, Any]}
-                'fetch_row': dict[str, Any] | None
-                'fetch_val': Any | None
-        """
-        if not self._pool.is_connected:
-            raise DatabaseConnectionError("Пул соединений (PostgresPool) не активен.")
-
-        logger.debug(f"Executing SQL ({mode}), timeout: {timeout}.")
-        try:
-            async with self._pool.acquire(timeout=timeout) as conn:
-                async with conn.transaction():
-                    if mode == 'execute':
-                        status = await conn.execute(query, *params, timeout=timeout)
-                        return int(status.rsplit(" ", 1)[-1]) if status else 0
-                    elif mode == 'fetch_all':
-                        records = await conn.fetch(query, *params, timeout=timeout)
-                        return self._records_to_list_records(records)
-                    elif mode == 'fetch_row':
-                        record = await conn.fetchrow(query, *params, timeout=timeout)
-                        return self._record_to_dict(record)
-                    elif mode == 'fetch_val':
-                        return await conn.fetchval(query, *params, timeout=timeout)
-                    else:
-                        raise ValueError(f"Неправильный запрос к SQL: {mode}.")
-        except PoolConnectionError as e:
-            raise DatabaseConnectionError(f"Ошибка пула при выполнении SQL: {e}") from e
-        except error_database.PostgresError as e:
-            raise DatabaseQueryError(f"Ошибка запроса к базе данных: {e.__class__.__name__} - {e}") from e
-        except asyncio.TimeoutError as e:
-            raise DatabaseQueryError("Операция с базой данных завершилась по таймауту.") from e
-        except Exception as e:
-            raise UnexpectedError(f"Не предвидимая ошибка: {type(e).__name__}: {e}") from e
-
-    async def upsert_mama_config(
-            self,
-            chat_id: int,
-            bot_name: str,
-            admin_id: int,
-            timezone: str,
-            personality_prompt: str = None
-    ) -> int:
-        """Создает или обновляет конфигурацию для бота в конкретном чате."""
-        config_id = await self._execute(
-            queries.UPSERT_MAMA_CONFIG,
-            params=(chat_id, bot_name, admin_id, timezone, personality_prompt),
-            mode='fetch_val'
-        )
-        logger.info(f"Конфигурация для чата {chat_id} успешно сохранена/обновлена.")
-        return config_id
-
-    async def get_mama_config(self, chat_id: int) -> dict | None:
-        """Получает активную конфигурацию для бота по chat_id."""
-        logger.debug(f"Запрос конфигурации для чата {chat_id}...")
-        config_dict = await self._execute(
-            queries.GET_MAMA_CONFIG,
-            params=(chat_id,),
-            mode='fetch_row'
-        )
-        if config_dict:
-            logger.debug(f"Конфигурация для чата {chat_id} найдена.")
-            return config_dict
-        else:
-            logger.debug(f"Активная конфигурация для чата {chat_id} не найдена.")
-            return None
-
-    async def get_mama_config_by_id(self, config_id: int):
-        """Получается все информацию о боте по id из db."""
-        logger.debug(f"Запрос конфигурации для чата {config_id}...")
-        config_dict = await self._execute(
-            queries.GET_MAMA_CONFIG_BY_ID,
-            params=(config_id,),
-            mode='fetch_row'
-        )
-        if config_dict:
-            logger.debug(f"Конфигурация для чата {config_id} найдена.")
-            return config_dict
-        else:
-            logger.debug(f"Активная конфигурация для чата {config_id} не найдена.")
-            return None
-
-    async def get_all_mama_configs(self) -> list[dict]:
-        """Получает ID всех чатов, где настроена мама."""
-        return await self._execute(queries.GET_ALL_MAMA_CONFIGS, mode='fetch_all')
-
-    async def delete_mama_config(self, chat_id: int) -> int:
-        """Удаляет конфигурацию для чата и возвращает количество удаленных строк."""
-        logger.info(f"Запрос на удаление конфигурации для чата {chat_id}.")
-        deleted_count = await self._execute(
-            queries.DELETE_MAMA_CONFIG,
-            params=(chat_id,),
-            mode='execute'
-        )
-        if deleted_count > 0:
-            logger.info(f"Конфигурация для чата {chat_id} успешно удалена.")
-        else:
-            logger.warning(f"Попытка удаления конфигурации для несуществующего чата {chat_id}.")
-        return deleted_count
-
-    async def add_participant(
-            self,
-            config_id: int,
-            user_id: int,
-            custom_name: str,
-            gender: str,
-    ) -> dict[str, Any]:
-        """Добавляет пользователя в память бота, и возвращает dict с его уникальным ID и custom_name."""
-        participant = await self._execute(
-            queries.INSERT_PARTICIPANT,
-            params=(config_id, user_id, custom_name, gender),
-            mode='fetch_row'
-        )
-        logger.info(
-            f"Для мамы с ID {config_id} добавлен участник {user_id}. Его ID в таблице: {participant}."
-        )
-        return participant
-
-    async def set_child(self, child_participant_id, config_id):
-        """Устанавливает ребенка для конкретной конфигураций мамы"""
-        return await self._execute(queries.SET_CHILD, params=(child_participant_id, config_id), mode='execute')
-
-    async def update_personality_prompt(self, prompt: str, config_id: int):
-        await self._execute(queries.UPDATE_PERSONALITY_PROMPT, params=(prompt, config_id), mode='execute')
-
-    async def get_participant(self, config_id: int, user_id: int) -> dict | None:
-        """Получает полную информацию об участнике по его Telegram ID."""
-        return await self._execute(queries.GET_PARTICIPANT, params=(config_id, user_id), mode='fetch_row')
-
-    async def get_all_participants_by_config_id(self, config_id: int) -> list[dict]:
-        """Получает СПИСОК ВСЕХ активных участников для указанной конфигурации."""
-        return await self._execute(
-            queries.GET_ALL_PARTICIPANTS_BY_CONFIG_ID,
-            params=(config_id,),
-            mode='fetch_all'
-        )
-
-    async def get_child(self, config_id: int) -> dict | None:
-        """Получается ID и имя ребенка для текущей мамы."""
-        return await self._execute(queries.GET_CHILD, params=(config_id,), mode='fetch_row')
-
-    async def update_relationship_score(self, participant_id: int, score_change: int) -> None:
-        """Обновляет только репутацию участника."""
-        await self._execute(queries.UPDATE_RELATIONSHIP_SCORE, params=(score_change, participant_id), mode='execute')
-
-    async def set_ignore_status(self, participant_id: int, status: bool) -> None:
-        """Устанавливает флаг is_ignored для участника и опускает relationship_score до 0"""
-        await self._execute(queries.SET_IGNORED_STATUS, params=(status, participant_id), mode='execute')
-
-    async def add_message_log(
-            self,
-            config_id: int,
-            user_id: int,
-            message_type: str,
-            participant_id: int | None = None,
-            message_text: str | None = None
-    ) -> datetime:
-        """Логируем сообщение и ВОЗВРАЩАЕМ его точное время создания из БД."""
-        created_at = await self._execute(
-            queries.INSERT_MESSAGE_LOG,
-            params=(config_id, participant_id, user_id, message_text, message_type),
-            mode='fetch_val'
-        )
-        return created_at
-
-    async def get_message_log_for_processing(self, config_id: int, created_at: datetime) -> list[
-        dict]:
-        """Возвращает пакет сообщений в указанный промежуток времени."""
-        return await self._execute(queries.GET_MESSAGE_LOG_FOR_PROCESSING, params=(config_id, created_at),
-                                   mode='fetch_all')
-
-    async def delete_processed_messages(self, config_id: int, created_at: datetime) -> None:
-        """Удаляет пакет сообщение в указанный промежуток времени."""
-        return await self._execute(queries.DELETE_PROCESSED_MESSAGES, params=(config_id, created_at), mode='execute')
-
-    async def add_long_term_memory(self, participant_id, memory_summary, importance_level) -> None:
-        """Запоминаем важное событие или действие."""
-        return await self._execute(
-            queries.INSERT_LONG_TERM_MEMORY,
-            params=(participant_id, memory_summary, importance_level),
-            mode='execute'
-        )
-
-    async def get_long_term_memory(self, participant_id: int, limit_logs: int) -> dict | None:
-        """Возвращаем данные сохраненные в памяти о пользователе."""
-        return await self._execute(queries.GET_LONG_TERM_MEMORY, params=(participant_id, limit_logs), mode='fetch_row')
+import logging
+import asyncio
+import asyncpg
+import json
+
+from typing import Any
+from dataclasses import dataclass
+from asyncpg import exceptions as error_database
+from datetime import datetime
+
+from core.logging_config import log_error
+from core.config.types import QueryMode
+from core.database.postgres_pool import PostgresPool
+from core.cache import ConfigCache, RosterCache
+from core.memory_index import MemoryVectorIndex
+from core.exceptions import (
+    DatabaseConnectionError,
+    DatabaseQueryError,
+    UnexpectedError,
+    PoolConnectionError
+)
+import core.sql_queries as queries
+
+logger = logging.getLogger(__name__)
+
+# memory_summary лежит в INCLUDE индекса idx_long_term_memory_participant_rank, а запись B-tree ограничена
+# ~2.7 КБ: 500 символов — не больше 2 КБ даже в 4-байтовом UTF-8, поэтому длинный текст обрезаем до вставки.
+MEMORY_SUMMARY_MAX_CHARS = 500
+
+
+@dataclass
+class ActionBatchResult:
+    """Итог применения одного пакета обновлений от LLM."""
+    scores_updated: int = 0
+    memories_added: int = 0
+    participants_added: int = 0
+    skipped: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"репутация {self.scores_updated}, воспоминаний {self.memories_added}, "
+            f"новых участников {self.participants_added}, пропущено {self.skipped}"
+        )
+
+
+class AsyncPostgresManager:
+    """
+    Управляет асинхронными запросами к базе данных для проекта "Твоя Мама",
+    используя предоставленный пул соединений.
+    """
+
+    def __init__(
+            self,
+            pool: PostgresPool,
+            config_cache: ConfigCache | None = None,
+            roster_cache: RosterCache | None = None,
+            memory_index: MemoryVectorIndex | None = None
+    ):
+        self._pool = pool
+        self._config_cache = config_cache
+        self._roster_cache = roster_cache
+        self._memory_index = memory_index
+        logger.info(f"AsyncDatabaseManager инициализирован.")
+
+    @staticmethod
+    def _record_to_dict(record: asyncpg.Record | None) -> dict[str, Any] | None:
+        return dict(record) if record else None
+
+    @staticmethod
+    def _records_to_list_records(records: list[asyncpg.Record]) -> list[dict[str, Any]]:
+        return [dict(record) for record in records]
+
+    async def _invalidate_config(self, chat_id: int | None) -> None:
+        """Сбрасывает закэшированный конфиг чата во всех воркерах после его изменения."""
+        if self._config_cache is not None and chat_id is not None:
+            await self._config_cache.invalidate(chat_id)
+
+    def _remember_participant(self, config_id: int, participant: dict[str, Any] | None) -> None:
+        """Пишет свежую строку участника сквозь кэш ростера."""
+        if self._roster_cache is not None and participant:
+            self._roster_cache.put(config_id, participant)
+
+    def _remember_memories(self, config_id: int, memories: list[dict[str, Any]]) -> None:
+        """Добавляет только что записанные воспоминания в векторный индекс памяти."""
+        if self._memory_index is not None and memories:
+            self._memory_index.add(config_id, memories)
+
+    async def _load_roster(self, config_id: int) -> list[dict[str, Any]]:
+        return await self._execute(queries.GET_PARTICIPANTS_ROSTER, params=(config_id,), mode='fetch_all')
+
+    async def _execute(
+            self,
+            query: str,
+            params: tuple = (),
+            mode: QueryMode = 'execute',
+            timeout: float | None = None
+    ) -> Any | None:
+        """
+        Не работает без пула подключения!
+        Args:
+            :param query: SQL строки (плейсхолдеры $1, $2)
+            :param params: Кортеж параметров для SQL.
+            :param mode: Параметр для execution SQL:
+                'execute': Возвращает количество затронутых строк (для INSERT/UPDATE/DELETE).
+                'fetch_all': Возвращает все строки в виде списка словарей.
+                'fetch_row': Возвращает одну строку в виде словаря или None, если данных нет.
+                'fetch_val': Возвращает одно значение из первой строки или None, если данных нет.
+            :param timeout: Опциональная команда задержки в секундах.
+            :return: Зависит от mode:
+                'execute': int(количество затронутых строк)
+                'fetch_all': list[dict[str, Any]}
+                'fetch_row': dict[str, Any] | None
+                'fetch_val': Any | None
+        """
+        results = await self._execute_transaction([(query, params, mode)], timeout=timeout)
+        return results[0]
+
+    @log_error
+    async def _execute_transaction(
+            self,
+            statements: list[tuple[str, tuple, QueryMode]],
+            timeout: float | None = None
+    ) -> list[Any]:
+        """
+        Выполняет несколько запросов на одном соединении в одной транзакции: либо применяются все, либо ни один.
+        Каждый элемент statements — (query, params, mode), как у _execute. Возвращает результаты в том же порядке.
+        """
+        if not self._pool.is_connected:
+            raise DatabaseConnectionError("Пул соединений (PostgresPool) не активен.")
+
+        logger.debug(f"Executing SQL ({', '.join(mode for _, _, mode in statements)}), timeout: {timeout}.")
+        try:
+            async with self._pool.acquire(timeout=timeout) as conn:
+                async with conn.transaction():
+                    return [
+                        await self._run_statement(conn, query, params, mode, timeout)
+                        for query, params, mode in statements
+                    ]
+        except PoolConnectionError as e:
+            raise DatabaseConnectionError(f"Ошибка пула при выполнении SQL: {e}") from e
+        except error_database.PostgresError as e:
+            raise DatabaseQueryError(f"Ошибка запроса к базе данных: {e.__class__.__name__} - {e}") from e
+        except asyncio.TimeoutError as e:
+            raise DatabaseQueryError("Операция с базой данных завершилась по таймауту.") from e
+        except Exception as e:
+            raise UnexpectedError(f"Не предвидимая ошибка: {type(e).__name__}: {e}") from e
+
+    async def _run_statement(
+            self,
+            conn: asyncpg.Connection,
+            query: str,
+            params: tuple,
+            mode: QueryMode,
+            timeout: float | None
+    ) -> Any | None:
+        if mode == 'execute':
+            status = await conn.execute(query, *params, timeout=timeout)
+            return int(status.rsplit(" ", 1)[-1]) if status else 0
+        elif mode == 'fetch_all':
+            records = await conn.fetch(query, *params, timeout=timeout)
+            return self._records_to_list_records(records)
+        elif mode == 'fetch_row':
+            record = await conn.fetchrow(query, *params, timeout=timeout)
+            return self._record_to_dict(record)
+        elif mode == 'fetch_val':
+            return await conn.fetchval(query, *params, timeout=timeout)
+        else:
+            raise ValueError(f"Неправильный запрос к SQL: {mode}.")
+
+    async def upsert_mama_config(
+            self,
+            chat_id: int,
+            bot_name: str,
+            admin_id: int,
+            timezone: str,
+            personality_prompt: str = None
+    ) -> int:
+        """Создает или обновляет конфигурацию для бота в конкретном чате."""
+        config_id = await self._execute(
+            queries.UPSERT_MAMA_CONFIG,
+            params=(chat_id, bot_name, admin_id, timezone, personality_prompt),
+            mode='fetch_val'
+        )
+        await self._invalidate_config(chat_id)
+        logger.info(f"Конфигурация для чата {chat_id} успешно сохранена/обновлена.")
+        return config_id
+
+    async def get_mama_config(self, chat_id: int) -> dict | None:
+        """Получает активную конфигурацию для бота по chat_id."""
+        logger.debug(f"Запрос конфигурации для чата {chat_id}...")
+        config_dict = await self._execute(
+            queries.GET_MAMA_CONFIG,
+            params=(chat_id,),
+            mode='fetch_row'
+        )
+        if config_dict:
+            logger.debug(f"Конфигурация для чата {chat_id} найдена.")
+            return config_dict
+        else:
+            logger.debug(f"Активная конфигурация для чата {chat_id} не найдена.")
+            return None
+
+    async def get_mama_config_by_id(self, config_id: int):
+        """Получается все информацию о боте по id из db."""
+        logger.debug(f"Запрос конфигурации для чата {config_id}...")
+        config_dict = await self._execute(
+            queries.GET_MAMA_CONFIG_BY_ID,
+            params=(config_id,),
+            mode='fetch_row'
+        )
+        if config_dict:
+            logger.debug(f"Конфигурация для чата {config_id} найдена.")
+            return config_dict
+        else:
+            logger.debug(f"Активная конфигурация для чата {config_id} не найдена.")
+            return None
+
+    async def get_all_mama_configs(self) -> list[dict]:
+        """Получает ID всех чатов, где настроена мама."""
+        return await self._execute(queries.GET_ALL_MAMA_CONFIGS, mode='fetch_all')
+
+    async def delete_mama_config(self, chat_id: int) -> int:
+        """Удаляет конфигурацию для чата и возвращает количество удаленных строк."""
+        logger.info(f"Запрос на удаление конфигурации для чата {chat_id}.")
+        deleted_count = await self._execute(
+            queries.DELETE_MAMA_CONFIG,
+            params=(chat_id,),
+            mode='execute'
+        )
+        if deleted_count > 0:
+            await self._invalidate_config(chat_id)
+            logger.info(f"Конфигурация для чата {chat_id} успешно удалена.")
+        else:
+            logger.warning(f"Попытка удаления конфигурации для несуществующего чата {chat_id}.")
+        return deleted_count
+
+    async def add_participant(
+            self,
+            config_id: int,
+            user_id: int,
+            custom_name: str,
+            gender: str,
+    ) -> dict[str, Any]:
+        """Добавляет пользователя в память бота, и возвращает dict с его уникальным ID и custom_name."""
+        participant = await self._execute(
+            queries.INSERT_PARTICIPANT,
+            params=(config_id, user_id, custom_name, gender),
+            mode='fetch_row'
+        )
+        self._remember_participant(config_id, participant)
+        logger.info(
+            f"Для мамы с ID {config_id} добавлен участник {user_id}. Его ID в таблице: {participant}."
+        )
+        return participant
+
+    async def set_child(self, child_participant_id, config_id):
+        """Устанавливает ребенка для конкретной конфигураций мамы"""
+        chat_id = await self._execute(queries.SET_CHILD, params=(child_participant_id, config_id), mode='fetch_val')
+        await self._invalidate_config(chat_id)
+        return 1 if chat_id is not None else 0
+
+    async def update_personality_prompt(self, prompt: str, config_id: int):
+        chat_id = await self._execute(queries.UPDATE_PERSONALITY_PROMPT, params=(prompt, config_id), mode='fetch_val')
+        await self._invalidate_config(chat_id)
+
+    async def get_participant(self, config_id: int, user_id: int) -> dict | None:
+        """Получает полную информацию об участнике по его Telegram ID."""
+        if self._roster_cache is None:
+            return await self._execute(queries.GET_PARTICIPANT, params=(config_id, user_id), mode='fetch_row')
+
+        roster = await self._roster_cache.get_roster(config_id, self._load_roster)
+        if (participant := roster.get(user_id)) is not None:
+            return dict(participant)
+        if self._roster_cache.is_known_missing(config_id, user_id):
+            return None
+
+        # Участника мог добавить другой воркер уже после загрузки ростера.
+        participant = await self._execute(queries.GET_PARTICIPANT, params=(config_id, user_id), mode='fetch_row')
+        if participant:
+            self._remember_participant(config_id, participant)
+        else:
+            self._roster_cache.mark_missing(config_id, user_id)
+        return participant
+
+    async def get_all_participants_by_config_id(self, config_id: int) -> list[dict]:
+        """Получает СПИСОК ВСЕХ активных участников для указанной конфигурации."""
+        if self._roster_cache is None:
+            return await self._execute(
+                queries.GET_ALL_PARTICIPANTS_BY_CONFIG_ID,
+                params=(config_id,),
+                mode='fetch_all'
+            )
+
+        roster = await self._roster_cache.get_roster(config_id, self._load_roster)
+        return [dict(p) for p in roster.values() if not p['is_ignored']]
+
+    async def get_config_with_participants(self, config_id: int) -> tuple[dict | None, list[dict]]:
+        """
+        Возвращает конфиг и активных участников чата одним запросом (ростер собирается json_agg на стороне БД).
+        С RosterCache загруженный ростер кладется в кэш; если ростер уже в кэше, читается только конфиг.
+        """
+        loaded: dict[str, Any] = {}
+
+        async def load_roster(config_id: int) -> list[dict[str, Any]]:
+            row = await self._execute(queries.GET_CONFIG_WITH_ROSTER, params=(config_id,), mode='fetch_row')
+            loaded['config'] = row
+            return self._parse_roster(row.pop('roster')) if row else []
+
+        if self._roster_cache is None:
+            roster = await load_roster(config_id)
+        else:
+            roster = [dict(p) for p in (await self._roster_cache.get_roster(config_id, load_roster)).values()]
+
+        # Ростер пришел из кэша (или его загрузил параллельный вызов) — конфиг нужно прочитать отдельно.
+        config = loaded['config'] if 'config' in loaded else await self.get_mama_config_by_id(config_id)
+        return config, [p for p in roster if not p['is_ignored']]
+
+    @staticmethod
+    def _parse_roster(raw: str) -> list[dict[str, Any]]:
+        roster = json.loads(raw)
+        for participant in roster:
+            if participant['last_interaction_at'] is not None:
+                participant['last_interaction_at'] = datetime.fromisoformat(participant['last_interaction_at'])
+        return roster
+
+    async def get_child(self, config_id: int) -> dict | None:
+        """Получается ID и имя ребенка для текущей мамы."""
+        return await self._execute(queries.GET_CHILD, params=(config_id,), mode='fetch_row')
+
+    async def update_relationship_score(self, participant_id: int, score_change: int) -> None:
+        """Обновляет только репутацию участника."""
+        participant = await self._execute(
+            queries.UPDATE_RELATIONSHIP_SCORE,
+            params=(score_change, participant_id),
+            mode='fetch_row'
+        )
+        if participant:
+            self._remember_participant(participant.pop('config_id'), participant)
+
+    async def set_ignore_status(self, participant_id: int, status: bool) -> None:
+        """Устанавливает флаг is_ignored для участника и опускает relationship_score до 0"""
+        participant = await self._execute(queries.SET_IGNORED_STATUS, params=(status, participant_id), mode='fetch_row')
+        if participant:
+            self._remember_participant(participant.pop('config_id'), participant)
+
+    async def add_message_log(
+            self,
+            config_id: int,
+            user_id: int,
+            message_type: str,
+            participant_id: int | None = None,
+            message_text: str | None = None
+    ) -> datetime:
+        """Логируем сообщение и ВОЗВРАЩАЕМ его точное время создания из БД."""
+        created_at = await self._execute(
+            queries.INSERT_MESSAGE_LOG,
+            params=(config_id, participant_id, user_id, message_text, message_type),
+            mode='fetch_val'
+        )
+        return created_at
+
+    async def get_message_log_for_processing(self, config_id: int, created_at: datetime) -> list[
+        dict]:
+        """Возвращает пакет сообщений в указанный промежуток времени."""
+        return await self._execute(queries.GET_MESSAGE_LOG_FOR_PROCESSING, params=(config_id, created_at),
+                                   mode='fetch_all')
+
+    async def delete_processed_messages(self, config_id: int, created_at: datetime) -> None:
+        """Удаляет пакет сообщение в указанный промежуток времени."""
+        return await self._execute(queries.DELETE_PROCESSED_MESSAGES, params=(config_id, created_at), mode='execute')
+
+    async def add_long_term_memory(self, participant_id, memory_summary, importance_level) -> None:
+        """Запоминаем важное событие или действие."""
+        memory = await self._execute(
+            queries.INSERT_LONG_TERM_MEMORY,
+            params=(participant_id, memory_summary[:MEMORY_SUMMARY_MAX_CHARS], importance_level),
+            mode='fetch_row'
+        )
+        if memory:
+            self._remember_memories(memory.pop('config_id'), [memory])
+
+    async def get_long_term_memories_since(self, config_id: int, after_id: int) -> list[dict]:
+        """Воспоминания чата с id больше after_id (id, participant_id, memory_summary) в порядке записи."""
+        return await self._execute(
+            queries.GET_LONG_TERM_MEMORIES_SINCE,
+            params=(config_id, after_id),
+            mode='fetch_all'
+        )
+
+    async def get_long_term_memories(self, config_id: int, limit_per_participant: int) -> dict[int, list[str]]:
+        """
+        Возвращает до limit_per_participant воспоминаний о каждом активном участнике чата одним запросом:
+        {participant_id: [memory_summary, ...]}, сначала самые важные, среди равных — самые свежие.
+        """
+        rows = await self._execute(
+            queries.GET_LONG_TERM_MEMORIES_BY_CONFIG,
+            params=(config_id, limit_per_participant),
+            mode='fetch_all'
+        )
+        memories: dict[int, list[str]] = {}
+        for row in rows:
+            memories.setdefault(row['participant_id'], []).append(row['memory_summary'])
+        return memories
+
+    async def get_long_term_memory(self, participant_id: int, limit_logs: int) -> dict | None:
+        """Возвращаем данные сохраненные в памяти о пользователе."""
+        return await self._execute(queries.GET_LONG_TERM_MEMORY, params=(participant_id, limit_logs), mode='fetch_row')
+
+    async def get_memory_consolidation_candidates(self, config_id: int, min_memories: int, limit: int) -> list[int]:
+        """participant_id участников чата, о которых накопилось больше min_memories воспоминаний."""
+        rows = await self._execute(
+            queries.GET_MEMORY_CONSOLIDATION_CANDIDATES,
+            params=(config_id, min_memories, limit),
+            mode='fetch_all'
+        )
+        return [row['participant_id'] for row in rows]
+
+    async def get_memories_for_participants(self, participant_ids: list[int]) -> list[dict]:
+        """Все воспоминания участников одним запросом, по каждому — от свежих к старым."""
+        return await self._execute(
+            queries.GET_MEMORIES_FOR_PARTICIPANTS,
+            params=(participant_ids,),
+            mode='fetch_all'
+        )
+
+    async def consolidate_long_term_memories(
+            self,
+            config_id: int,
+            merged: list[tuple[int, str, int, datetime]],
+            archived: list[tuple[int, str]]
+    ) -> int:
+        """
+        Применяет итог консолидации памяти чата одной транзакцией
+        и сбрасывает индекс памяти чата во всех процессах.
+        Args:
+            :param merged: (participant_id, memory_summary, importance_level, created_at) — новые сводные строки.
+            :param archived: (id, reason) — строки, которые переносятся в long_term_memory_archive.
+            :return: Сколько строк ушло в архив.
+        """
+        statements = []
+        if archived:
+            ids, reasons = map(list, zip(*archived))
+            statements.append((queries.ARCHIVE_LONG_TERM_MEMORIES, (ids, reasons), 'execute'))
+        if merged:
+            participant_ids, summaries, importance, created = map(list, zip(*merged))
+            summaries = [summary[:MEMORY_SUMMARY_MAX_CHARS] for summary in summaries]
+            statements.append((
+                queries.BULK_INSERT_CONSOLIDATED_MEMORIES,
+                (participant_ids, summaries, importance, created),
+                'execute'
+            ))
+        if not statements:
+            return 0
+
+        results = await self._execute_transaction(statements)
+        if self._memory_index is not None:
+            await self._memory_index.invalidate(config_id)
+        return results[0] if archived else 0
+
+    async def apply_llm_actions(
+            self,
+            config_id: int,
+            score_changes: dict[int, int],
+            memories: list[tuple[int, str, int]],
+            new_participants: list[tuple[int, str, str]]
+    ) -> ActionBatchResult:
+        """
+        Применяет пакет обновлений от LLM одной транзакцией — по одному запросу на вид изменений,
+        сколько бы участников он ни затрагивал.
+        Args:
+            :param score_changes: {participant_id: суммарное изменение репутации}.
+            :param memories: (participant_id, memory_summary, importance_level).
+            :param new_participants: (user_id, custom_name, gender); уже известные пропускаются через ON CONFLICT.
+        """
+        result = ActionBatchResult()
+        statements = []
+        if score_changes:
+            statements.append((
+                queries.BULK_UPDATE_RELATIONSHIP_SCORES,
+                (config_id, list(score_changes), list(score_changes.values())),
+                'fetch_all'
+            ))
+        if memories:
+            participant_ids, summaries, importance = map(list, zip(*memories))
+            summaries = [summary[:MEMORY_SUMMARY_MAX_CHARS] for summary in summaries]
+            statements.append((queries.BULK_INSERT_LONG_TERM_MEMORY, (participant_ids, summaries, importance), 'fetch_all'))
+        if new_participants:
+            user_ids, names, genders = map(list, zip(*new_participants))
+            statements.append((queries.BULK_INSERT_PARTICIPANTS, (config_id, user_ids, names, genders), 'fetch_all'))
+        if not statements:
+            return result
+
+        results = iter(await self._execute_transaction(statements))
+        if score_changes:
+            updated = next(results)
+            result.scores_updated = len(updated)
+            for participant in updated:
+                self._remember_participant(config_id, participant)
+        if memories:
+            added_memories = next(results)
+            result.memories_added = len(added_memories)
+            self._remember_memories(config_id, added_memories)
+        if new_participants:
+            added = next(results)
+            result.participants_added = len(added)
+            result.skipped += len(new_participants) - len(added)
+            for participant in added:
+                self._remember_participant(config_id, participant)
+        return result
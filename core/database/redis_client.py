@@ -1,163 +1,667 @@
-import logging
-import json
-
-
-from redis.asyncio import Redis, ConnectionPool
-from contextlib import asynccontextmanager
-from typing import Any
-
-from core.exceptions import RedisConnectionError
-from core.logging_config import log_error
-
-logger = logging.getLogger(__name__)
-
-
-class RedisClient:
-    """
-    Асинхронный клиент для работы с Redis.
-    Поддерживает очереди, состояния (hash) и флаги (ключи).
-    """
-    def __init__(self, host: str, port: int):
-        self._pool = ConnectionPool(host=host, port=port, db=0, decode_responses=True)
-        self._client: Redis | None = None
-
-    @log_error
-    async def connect(self):
-        """Устанавливает соединение с Redis."""
-        try:
-            self._client = Redis(connection_pool=self._pool)
-            await self._client.ping()
-            logger.info("Успешное подключение к Redis.")
-        except Exception as e:
-            raise RedisConnectionError(f"Не удалось подключиться к Redis: {e}")
-
-    @log_error
-    async def disconnect(self):
-        """Закрывает соединение с Redis."""
-        if self._client:
-            await self._client.close()
-            await self._pool.disconnect()
-            logger.info("Соединение с Redis закрыто.")
-
-    @asynccontextmanager
-    async def lifecycle(self):
-        """
-        Контекстный менеджер для автоподключения/отключения:
-        async with client.lifecycle() as c:
-            ...
-        """
-        await self.connect()
-        try:
-            yield self
-        finally:
-            await self.disconnect()
-
-    # ============ Очередь ============
-    @log_error
-    async def enqueue(self, queue_name: str, item: dict):
-        """Добавляет элемент в конец очереди."""
-        await self._client.rpush(queue_name, json.dumps(item))
-
-    @log_error
-    async def dequeue(self, queue_name: str, timeout: int = 0) -> dict | None:
-        """Извлекает элемент из начала очереди (блокирующе)."""
-        result = await self._client.blpop([queue_name], timeout=timeout)
-        if result:
-            return json.loads(result[1])
-        return None
-
-    @log_error
-    async def get_queue_size(self, queue_name: str) -> int:
-        """Возрващает текущий размер очереди."""
-        return await self._client.llen(queue_name)
-
-    @log_error
-    async def get_and_clear_batch(self, queue_name: str) -> list[dict]:
-        """Атомарно забирает все элементы из очереди и удаляет ее."""
-        async with self._client.pipeline(transaction=True) as pipe:
-            pipe.lrange(queue_name, 0, -1)
-            pipe.delete(queue_name)
-            raw_items, _ = await pipe.execute()
-
-        return [json.loads(item) for item in raw_items]
-
-    @log_error
-    async def trim_queue(self, queue_name: str, max_len: int):
-        """Обрезает очередь, оставляя последние max_len элементов."""
-        await self._client.ltrim(queue_name, -max_len, -1)
-
-    # ============ Состояния ============
-    @log_error
-    async def set_state(self, key: str, state_data: dict, ttl_seconds: int | None = None):
-        """Сохраняет словарь в hash с опциональным TTL."""
-        await self._client.hset(key, mapping=state_data)
-        if ttl_seconds:
-            await self._client.expire(key, ttl_seconds)
-
-    @log_error
-    async def get_state(self, key: str) -> dict[str, str]:
-        """Возвращает hash-объект."""
-        return await self._client.hgetall(key)
-
-    @log_error
-    async def set_mode(self, config_id: int, mode: str):
-        """Устанавливает текущий режим работы для конкретного чата."""
-        key = f"mode:{config_id}"
-        await self._client.set(key, mode)
-
-    @log_error
-    async def get_mode(self, config_id: int) -> str | None:
-        """Получает текущий режим работы для чата."""
-        key = f"mode:{config_id}"
-        return await self._client.get(key)
-
-    # ============ Флаги ============
-    @log_error
-    async def set_flag(self, key: str, value: bool, ttl_seconds: int | None = None):
-        """Устанавливает булев флаг (True/False)."""
-        val = "1" if value else "0"
-        await self._client.set(key, val, ex=ttl_seconds)
-
-    @log_error
-    async def get_flag(self, key: str) -> bool:
-        """Получает булев флаг. По умолчанию False."""
-        val = await self._client.get(key)
-        return val == "1" if val is not None else False
-
-    @log_error
-    async def delete(self, key: str):
-        """Удаляет ключ (любого типа)."""
-        await self._client.delete(key)
-
-    @log_error
-    async def increment_counter(self, key: str, ttl_seconds: int | None = None) -> int:
-        """Атомарно увеличивает счетчик и возвращает его новое значение."""
-        async with self._client.pipeline() as pipe:
-            pipe.incr(key)
-            if ttl_seconds:
-                pipe.expire(key, ttl_seconds, nx=True)
-            results = await pipe.execute()
-        return results[0]
-
-    @log_error
-    async def set_json(self, key: str, data: Any, ttl_seconds: int | None = None):
-        """Сериализует любой JSON-сериализуемый объект и сохраняет в Redis."""
-        await self._client.set(key, json.dumps(data), ex=ttl_seconds)
-
-    @log_error
-    async def get_json(self, key: str) -> dict | None:
-        """Получает строку из Redis и десериализует ее из JSON."""
-        raw_data = await self._client.get(key)
-        if raw_data:
-            return json.loads(raw_data)
-        return None
-
-    @log_error
-    async def set_string(self, key: str, value: str, ttl_seconds: int | None = None):
-        """Сохраняет строковое значение в Redis."""
-        await self._client.set(key, value, ex=ttl_seconds)
-
-    @log_error
-    async def get_string(self, key: str) -> str | None:
-        """Возвращает строковое значение из Redis (или None)."""
-        return await self._client.get(key)
\ No newline at end of file
+import asyncio
+import logging
+import os
+import socket
+import time
+
+
+from aiogram.fsm.storage.base import DefaultKeyBuilder
+from aiogram.fsm.storage.redis import RedisStorage
+from redis.asyncio import Redis, ConnectionPool
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from redis.exceptions import NoScriptError, ResponseError
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, AsyncIterator, Callable
+
+from core.database.codecs import PayloadCodec
+from core.exceptions import RedisConnectionError
+from core.logging_config import log_error
+import core.database.redis_scripts as scripts
+
+logger = logging.getLogger(__name__)
+
+
+class DispatchStatus(str, Enum):
+    """Решения скрипта диспетчеризации сообщений."""
+    NO_MODE = 'no_mode'
+    QUEUED = 'queued'
+    BATCH_READY = 'batch_ready'
+    LIMIT_REACHED = 'limit_reached'
+    COOLDOWN = 'cooldown'
+    MENTION = 'mention'
+    IGNORED = 'ignored'
+
+
+@dataclass(frozen=True)
+class DispatchDecision:
+    """Результат диспетчеризации одного сообщения."""
+    status: DispatchStatus
+    value: int = 0
+
+
+class QueueBackend(str, Enum):
+    """Хранилище очередей сообщений."""
+    LIST = "list"
+    STREAM = "stream"
+
+
+@dataclass(frozen=True)
+class QueueBatch:
+    """
+    Пачка сообщений, взятая из очереди в обработку.
+    Для Streams ids — id записей, которые нужно подтвердить через ack_batch после обработки.
+    """
+    queue_name: str
+    items: list[dict]
+    ids: list[str]
+
+
+@dataclass(frozen=True)
+class WriteBatchStats:
+    """Метрики пакетной записи в Redis."""
+    flushes: int
+    items: int
+    last_batch_size: int
+    max_batch_size: int
+    last_flush_latency: float
+    avg_flush_latency: float
+    queue_depth: int
+
+    @property
+    def avg_batch_size(self) -> float:
+        return self.items / self.flushes if self.flushes else 0.0
+
+
+class RedisClient:
+    """
+    Асинхронный клиент для работы с Redis.
+    Поддерживает очереди, состояния (hash) и флаги (ключи).
+
+    С write_batching=True записи из enqueue и dispatch_message не уходят в Redis по одной,
+    а копятся до write_batch_delay_ms миллисекунд или write_batch_max_items штук
+    и отправляются одним pipeline. Каждый вызов по-прежнему ждет подтверждения своей записи.
+
+    С queue_backend=QueueBackend.STREAM очереди сообщений хранятся в Redis Streams:
+    claim_batch читает их через группу консьюмеров, ack_batch подтверждает обработанное,
+    а записи упавших воркеров забираются через XAUTOCLAIM после stream_claim_idle_ms.
+
+    Клиент работает с bytes (decode_responses=False): сообщения очередей и JSON-значения
+    сериализуются через codec (PayloadCodec), строки декодируются только там, где они нужны.
+    """
+    def __init__(
+            self,
+            host: str,
+            port: int,
+            write_batching: bool = False,
+            write_batch_delay_ms: float = 2.0,
+            write_batch_max_items: int = 64,
+            queue_backend: QueueBackend = QueueBackend.LIST,
+            stream_group: str = "brain",
+            stream_claim_idle_ms: int = 600000,
+            stream_batch_size: int = 1000,
+            codec: PayloadCodec | None = None
+    ):
+        self._pool = ConnectionPool(host=host, port=port, db=0, decode_responses=False)
+        self._codec = codec or PayloadCodec()
+        self._client: Redis | None = None
+        self._dispatch_script: AsyncScript | None = None
+        self._renew_lease_script: AsyncScript | None = None
+        self._release_lease_script: AsyncScript | None = None
+
+        self._write_batching = write_batching
+        self._write_batch_delay = write_batch_delay_ms / 1000
+        self._write_batch_max_items = write_batch_max_items
+        self._write_buffer: list[tuple[Callable[[Pipeline], Any], asyncio.Future]] = []
+        self._write_buffer_full = asyncio.Event()
+        self._flush_task: asyncio.Task | None = None
+        self._flushes = 0
+        self._flushed_items = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._last_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+        self._queue_backend = QueueBackend(queue_backend)
+        self._stream_group = stream_group
+        self._stream_consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._stream_claim_idle_ms = stream_claim_idle_ms
+        self._stream_batch_size = stream_batch_size
+        self._stream_groups_ready: set[str] = set()
+
+    @log_error
+    async def connect(self):
+        """Устанавливает соединение с Redis."""
+        try:
+            self._client = Redis(connection_pool=self._pool)
+            await self._client.ping()
+            await self._load_scripts()
+            logger.info("Успешное подключение к Redis.")
+        except Exception as e:
+            raise RedisConnectionError(f"Не удалось подключиться к Redis: {e}")
+
+    @log_error
+    async def disconnect(self):
+        """Закрывает соединение с Redis."""
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._client:
+            await self._client.close()
+            await self._pool.disconnect()
+            logger.info("Соединение с Redis закрыто.")
+
+    @asynccontextmanager
+    async def lifecycle(self):
+        """
+        Контекстный менеджер для автоподключения/отключения:
+        async with client.lifecycle() as c:
+            ...
+        """
+        await self.connect()
+        try:
+            yield self
+        finally:
+            await self.disconnect()
+
+    def create_fsm_storage(self, state_ttl: int | None = None, data_ttl: int | None = None) -> RedisStorage:
+        """
+        FSM-хранилище aiogram на отдельном пуле соединений к тому же Redis: Dispatcher закрывает storage
+        при остановке вместе с его пулом, а общий пул клиента должен остаться рабочим.
+        Состояния диалогов переживают рестарт и видны всем воркерам; брошенные диалоги истекают по TTL.
+        """
+        pool = ConnectionPool(connection_class=self._pool.connection_class, **self._pool.connection_kwargs)
+        return RedisStorage(
+            redis=Redis(connection_pool=pool),
+            key_builder=DefaultKeyBuilder(prefix="fsm", with_bot_id=True),
+            state_ttl=state_ttl,
+            data_ttl=data_ttl
+        )
+
+    async def _load_scripts(self):
+        """Загружает Lua-скрипты в Redis, чтобы дальше вызывать их по SHA."""
+        await self._client.script_load(scripts.DISPATCH_MESSAGE)
+
+    # ============ Пакетная запись ============
+    @property
+    def write_batch_stats(self) -> WriteBatchStats:
+        """Снимок метрик пакетной записи: задержка сброса, размер пакетов, глубина буфера."""
+        return WriteBatchStats(
+            flushes=self._flushes,
+            items=self._flushed_items,
+            last_batch_size=self._last_batch_size,
+            max_batch_size=self._max_batch_size,
+            last_flush_latency=self._last_flush_latency,
+            avg_flush_latency=self._total_flush_latency / self._flushes if self._flushes else 0.0,
+            queue_depth=len(self._write_buffer)
+        )
+
+    async def _submit_write(self, command: Callable[[Pipeline], Any]) -> Any:
+        """Ставит команду в буфер пакетной записи и ждет ответ Redis именно на нее."""
+        future = asyncio.get_running_loop().create_future()
+        self._write_buffer.append((command, future))
+        if len(self._write_buffer) >= self._write_batch_max_items:
+            self._write_buffer_full.set()
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+        return await future
+
+    async def _flush_loop(self):
+        """
+        Сбрасывает буфер, пока в нем есть записи. Одновременно в полете не больше одного pipeline,
+        поэтому порядок записей в очередях сохраняется, а под нагрузкой пакеты сами укрупняются.
+        """
+        try:
+            while self._write_buffer:
+                if len(self._write_buffer) < self._write_batch_max_items:
+                    self._write_buffer_full.clear()
+                    try:
+                        await asyncio.wait_for(self._write_buffer_full.wait(), self._write_batch_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                batch = self._write_buffer[:self._write_batch_max_items]
+                del self._write_buffer[:self._write_batch_max_items]
+                await self._flush_writes(batch)
+        finally:
+            self._flush_task = None
+
+    async def _flush_writes(self, batch: list[tuple[Callable[[Pipeline], Any], asyncio.Future]]):
+        started = time.perf_counter()
+        try:
+            results = await self._execute_pipeline([command for command, _ in batch])
+            # После рестарта Redis скрипты пропадают из кэша — загружаем и повторяем только эти команды.
+            retry = [i for i, result in enumerate(results) if isinstance(result, NoScriptError)]
+            if retry:
+                await self._load_scripts()
+                retried = await self._execute_pipeline([batch[i][0] for i in retry])
+                for i, result in zip(retry, retried):
+                    results[i] = result
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        latency = time.perf_counter() - started
+        self._flushes += 1
+        self._flushed_items += len(batch)
+        self._last_batch_size = len(batch)
+        self._max_batch_size = max(self._max_batch_size, len(batch))
+        self._last_flush_latency = latency
+        self._total_flush_latency += latency
+        logger.debug(f"Пакетная запись: {len(batch)} команд за {latency * 1000:.2f} мс.")
+
+    async def _execute_pipeline(self, commands: list[Callable[[Pipeline], Any]]) -> list[Any]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            for command in commands:
+                command(pipe)
+            return await pipe.execute(raise_on_error=False)
+
+    # ============ Очередь ============
+    @property
+    def uses_streams(self) -> bool:
+        return self._queue_backend is QueueBackend.STREAM
+
+    @log_error
+    async def enqueue(self, queue_name: str, item: dict):
+        """Добавляет элемент в конец очереди."""
+        data = self._codec.encode(item)
+        if self.uses_streams:
+            command = lambda pipe: pipe.xadd(queue_name, {"data": data})
+        else:
+            command = lambda pipe: pipe.rpush(queue_name, data)
+
+        if self._write_batching:
+            await self._submit_write(command)
+        else:
+            await command(self._client)
+
+    @log_error
+    async def dequeue(self, queue_name: str, timeout: int = 0) -> dict | None:
+        """Извлекает элемент из начала очереди (блокирующе). Только для списков."""
+        result = await self._client.blpop([queue_name], timeout=timeout)
+        if result:
+            return self._codec.decode(result[1])
+        return None
+
+    @log_error
+    async def get_queue_size(self, queue_name: str) -> int:
+        """Возрващает текущий размер очереди."""
+        if self.uses_streams:
+            return await self._client.xlen(queue_name)
+        return await self._client.llen(queue_name)
+
+    @log_error
+    async def get_and_clear_batch(self, queue_name: str) -> list[dict]:
+        """
+        Атомарно забирает все элементы из очереди и удаляет ее. Только для списков:
+        у Streams подтверждение до обработки теряло бы пачку при падении воркера,
+        поэтому там сообщения берутся через claim_batch и подтверждаются ack_batch после записи результата.
+        """
+        if self.uses_streams:
+            raise ValueError(f"get_and_clear_batch не поддерживает Streams ({queue_name}), используйте claim_batch.")
+
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.lrange(queue_name, 0, -1)
+            pipe.delete(queue_name)
+            raw_items, _ = await pipe.execute()
+
+        return [self._codec.decode(item) for item in raw_items]
+
+    @log_error
+    async def claim_batch(self, queue_name: str) -> QueueBatch:
+        """
+        Берет сообщения очереди в обработку.
+        Для списков очередь просто вычитывается и удаляется (как get_and_clear_batch).
+        Для Streams сначала забираются зависшие записи упавших воркеров (XAUTOCLAIM),
+        затем новые записи группы (XREADGROUP). До ack_batch записи остаются в PEL.
+        """
+        if not self.uses_streams:
+            return QueueBatch(queue_name=queue_name, items=await self.get_and_clear_batch(queue_name), ids=[])
+
+        try:
+            entries = await self._read_stream_batch(queue_name)
+        except ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            # Стрим удалили вместе с группой (например, FLUSHDB) — создаем ее заново.
+            self._stream_groups_ready.discard(queue_name)
+            entries = await self._read_stream_batch(queue_name)
+
+        return QueueBatch(
+            queue_name=queue_name,
+            items=[self._codec.decode(fields[b"data"]) for _, fields in entries],
+            ids=[entry_id.decode() for entry_id, _ in entries]
+        )
+
+    @log_error
+    async def claim_batches(
+            self,
+            queue_names: list[str],
+            json_keys: list[str] | tuple = ()
+    ) -> tuple[list[QueueBatch], list[Any]]:
+        """
+        Берет в обработку несколько очередей и заодно читает JSON-ключи (как get_json).
+        Для списков все это один MULTI-pipeline, т.е. один round trip к Redis.
+        Streams читаются параллельно через claim_batch: у XAUTOCLAIM/XREADGROUP своя обработка NOGROUP.
+        """
+        if self.uses_streams:
+            batches, values = await asyncio.gather(
+                asyncio.gather(*(self.claim_batch(queue_name) for queue_name in queue_names)),
+                asyncio.gather(*(self.get_json(key) for key in json_keys))
+            )
+            return list(batches), list(values)
+
+        async with self._client.pipeline(transaction=True) as pipe:
+            for queue_name in queue_names:
+                pipe.lrange(queue_name, 0, -1)
+                pipe.delete(queue_name)
+            for key in json_keys:
+                pipe.get(key)
+            results = await pipe.execute()
+
+        batches = [
+            QueueBatch(
+                queue_name=queue_name,
+                items=[self._codec.decode(item) for item in results[2 * index]],
+                ids=[]
+            )
+            for index, queue_name in enumerate(queue_names)
+        ]
+        values = [self._codec.decode(raw) if raw else None for raw in results[2 * len(queue_names):]]
+        return batches, values
+
+    @log_error
+    async def ack_batch(self, batch: QueueBatch):
+        """Подтверждает обработку пачки: XACK и удаление записей из стрима."""
+        if not batch.ids:
+            return
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.xack(batch.queue_name, self._stream_group, *batch.ids)
+            pipe.xdel(batch.queue_name, *batch.ids)
+            await pipe.execute()
+
+    @log_error
+    async def touch_batch(self, batch: QueueBatch):
+        """
+        Продлевает владение пачкой Streams: XCLAIM с JUSTID на себя обнуляет idle записей в PEL,
+        чтобы долгую обработку не забрал другой воркер через XAUTOCLAIM. Для списков ничего не делает.
+        """
+        if not batch.ids:
+            return
+        await self._client.xclaim(
+            batch.queue_name, self._stream_group, self._stream_consumer, 0, batch.ids, justid=True
+        )
+
+    @log_error
+    async def release_batch(self, batch: QueueBatch):
+        """
+        Возвращает необработанную пачку в очередь, чтобы ее взяла следующая обработка.
+        Для списков сообщения кладутся обратно в голову очереди в прежнем порядке.
+        Для Streams записи и так остаются в PEL и будут забраны XAUTOCLAIM после stream_claim_idle_ms.
+        """
+        if self.uses_streams or not batch.items:
+            return
+        await self._client.lpush(batch.queue_name, *(self._codec.encode(item) for item in reversed(batch.items)))
+
+    async def _read_stream_batch(self, queue_name: str) -> list[tuple[str, dict]]:
+        await self._ensure_stream_group(queue_name)
+        entries = []
+
+        _, claimed, *_ = await self._client.xautoclaim(
+            queue_name, self._stream_group, self._stream_consumer,
+            min_idle_time=self._stream_claim_idle_ms, start_id="0-0", count=self._stream_batch_size
+        )
+        entries.extend(entry for entry in claimed if entry[1])
+        if claimed:
+            logger.warning(f"Забрал {len(claimed)} зависших сообщений из {queue_name}.")
+
+        response = await self._client.xreadgroup(
+            self._stream_group, self._stream_consumer, {queue_name: ">"}, count=self._stream_batch_size
+        )
+        for _, stream_entries in response or []:
+            entries.extend(stream_entries)
+        return entries
+
+    async def _ensure_stream_group(self, queue_name: str):
+        if queue_name in self._stream_groups_ready:
+            return
+        try:
+            await self._client.xgroup_create(queue_name, self._stream_group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._stream_groups_ready.add(queue_name)
+
+    @log_error
+    async def trim_queue(self, queue_name: str, max_len: int):
+        """Обрезает очередь, оставляя последние max_len элементов."""
+        if self.uses_streams:
+            await self._client.xtrim(queue_name, maxlen=max_len)
+        else:
+            await self._client.ltrim(queue_name, -max_len, -1)
+
+    # ============ Диспетчеризация ============
+    @log_error
+    async def dispatch_message(
+            self,
+            config_id: int,
+            user_id: int,
+            payload: dict,
+            is_direct: bool,
+            is_child: bool,
+            reply_limit: int,
+            cooldown_seconds: int,
+            batch_threshold: int
+    ) -> DispatchDecision:
+        """
+        Атомарно принимает решение по входящему сообщению за один round trip:
+        читает режим чата, раскладывает сообщение по очередям, ведет счетчик ответов и кулдауны.
+        Скрипт загружается в Redis один раз и дальше вызывается по SHA (EVALSHA).
+        """
+        if self._dispatch_script is None:
+            self._dispatch_script = self._client.register_script(scripts.DISPATCH_MESSAGE)
+
+        keys = [
+            f"mode:{config_id}",
+            f"direct_queue:{config_id}",
+            f"background_queue:{config_id}",
+            f"online_batch_queue:{config_id}",
+            f"online_replies_count:{config_id}",
+            f"online_user_cooldown:{config_id}:{user_id}",
+        ]
+        args = [
+            self._codec.encode(payload),
+            "1" if is_direct else "0",
+            "1" if is_child else "0",
+            reply_limit,
+            cooldown_seconds,
+            batch_threshold,
+            "1" if self.uses_streams else "0",
+            self._stream_group,
+        ]
+
+        if self._write_batching:
+            sha = self._dispatch_script.sha
+            status, value = await self._submit_write(lambda pipe: pipe.evalsha(sha, len(keys), *keys, *args))
+        else:
+            status, value = await self._dispatch_script(keys=keys, args=args)
+        return DispatchDecision(status=DispatchStatus(status.decode()), value=int(value))
+
+    # ============ Шардирование ============
+    @log_error
+    async def renew_shard_lease(self, members_key: str, worker_id: str, ttl_seconds: int) -> list[str]:
+        """
+        Продлевает аренду воркера (sorted set: участник -> время истечения),
+        выкидывает просроченные аренды и возвращает отсортированный список живых воркеров.
+        """
+        now = time.time()
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.zadd(members_key, {worker_id: now + ttl_seconds})
+            pipe.zremrangebyscore(members_key, "-inf", now)
+            pipe.zrange(members_key, 0, -1)
+            _, _, members = await pipe.execute()
+        return sorted(member.decode() for member in members)
+
+    @log_error
+    async def release_shard_lease(self, members_key: str, worker_id: str):
+        """Снимает аренду воркера, чтобы остальные перераспределили его чаты сразу, а не по TTL."""
+        await self._client.zrem(members_key, worker_id)
+
+    @log_error
+    async def forward_update(self, inbox: str, update: dict, ttl_seconds: int | None = None):
+        """Кладет апдейт Telegram во входящую очередь воркера-владельца и продлевает ее TTL."""
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.rpush(inbox, self._codec.encode(update))
+            if ttl_seconds:
+                pipe.expire(inbox, ttl_seconds)
+            await pipe.execute()
+
+    @log_error
+    async def take_updates(self, inbox: str) -> list[dict]:
+        """Атомарно забирает все апдейты из входящей очереди (ушедшего) воркера и удаляет ее."""
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.lrange(inbox, 0, -1)
+            pipe.delete(inbox)
+            raw_updates, _ = await pipe.execute()
+        return [self._codec.decode(update) for update in raw_updates]
+
+    @log_error
+    async def receive_update(self, inbox: str, timeout: int = 1) -> dict | None:
+        """Ждет апдейт из входящей очереди воркера (блокирующе, не дольше timeout секунд)."""
+        result = await self._client.blpop([inbox], timeout=timeout)
+        if result:
+            return self._codec.decode(result[1])
+        return None
+
+    # ============ Аренды ============
+    @log_error
+    async def acquire_lease(self, key: str, token: str, ttl_ms: int) -> bool:
+        """Берет аренду key на ttl_ms, если она свободна. Возвращает True, если аренда наша."""
+        return bool(await self._client.set(key, token, nx=True, px=ttl_ms))
+
+    @log_error
+    async def renew_lease(self, key: str, token: str, ttl_ms: int) -> bool:
+        """Продлевает свою аренду. False — аренда истекла и, возможно, уже занята другим."""
+        if self._renew_lease_script is None:
+            self._renew_lease_script = self._client.register_script(scripts.RENEW_LEASE)
+        return bool(await self._renew_lease_script(keys=[key], args=[token, ttl_ms]))
+
+    @log_error
+    async def release_lease(self, key: str, token: str):
+        """Снимает свою аренду; чужую не трогает."""
+        if self._release_lease_script is None:
+            self._release_lease_script = self._client.register_script(scripts.RELEASE_LEASE)
+        await self._release_lease_script(keys=[key], args=[token])
+
+    # ============ Состояния ============
+    @log_error
+    async def set_state(self, key: str, state_data: dict, ttl_seconds: int | None = None):
+        """Сохраняет словарь в hash с опциональным TTL."""
+        await self._client.hset(key, mapping=state_data)
+        if ttl_seconds:
+            await self._client.expire(key, ttl_seconds)
+
+    @log_error
+    async def get_state(self, key: str) -> dict[str, str]:
+        """Возвращает hash-объект."""
+        raw = await self._client.hgetall(key)
+        return {field.decode(): value.decode() for field, value in raw.items()}
+
+    @log_error
+    async def set_mode(self, config_id: int, mode: str):
+        """Устанавливает текущий режим работы для конкретного чата."""
+        key = f"mode:{config_id}"
+        await self._client.set(key, mode)
+
+    @log_error
+    async def get_mode(self, config_id: int) -> str | None:
+        """Получает текущий режим работы для чата."""
+        key = f"mode:{config_id}"
+        return _decode(await self._client.get(key))
+
+    # ============ Флаги ============
+    @log_error
+    async def set_flag(self, key: str, value: bool, ttl_seconds: int | None = None):
+        """Устанавливает булев флаг (True/False)."""
+        val = "1" if value else "0"
+        await self._client.set(key, val, ex=ttl_seconds)
+
+    @log_error
+    async def get_flag(self, key: str) -> bool:
+        """Получает булев флаг. По умолчанию False."""
+        val = await self._client.get(key)
+        return val == b"1" if val is not None else False
+
+    @log_error
+    async def delete(self, key: str):
+        """Удаляет ключ (любого типа)."""
+        await self._client.delete(key)
+
+    @log_error
+    async def increment_counter(self, key: str, ttl_seconds: int | None = None) -> int:
+        """Атомарно увеличивает счетчик и возвращает его новое значение."""
+        async with self._client.pipeline() as pipe:
+            pipe.incr(key)
+            if ttl_seconds:
+                pipe.expire(key, ttl_seconds, nx=True)
+            results = await pipe.execute()
+        return results[0]
+
+    @log_error
+    async def set_json(self, key: str, data: Any, ttl_seconds: int | None = None):
+        """Сериализует любой JSON-сериализуемый объект и сохраняет в Redis."""
+        await self._client.set(key, self._codec.encode(data), ex=ttl_seconds)
+
+    @log_error
+    async def get_json(self, key: str) -> dict | None:
+        """Получает значение из Redis и десериализует его кодеком."""
+        raw_data = await self._client.get(key)
+        if raw_data:
+            return self._codec.decode(raw_data)
+        return None
+
+    @log_error
+    async def set_string(self, key: str, value: str, ttl_seconds: int | None = None):
+        """Сохраняет строковое значение в Redis."""
+        await self._client.set(key, value, ex=ttl_seconds)
+
+    @log_error
+    async def get_string(self, key: str) -> str | None:
+        """Возвращает строковое значение из Redis (или None)."""
+        return _decode(await self._client.get(key))
+
+    # ============ Pub/Sub ============
+    @log_error
+    async def publish(self, channel: str, message: str) -> int:
+        """Публикует сообщение в канал и возвращает число получивших его подписчиков."""
+        return await self._client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        """
+        Подписывается на канал и отдает входящие сообщения по одному:
+        async for message in client.subscribe("channel"):
+            ...
+        """
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield message['data'].decode()
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+
+def _decode(value: bytes | None) -> str | None:
+    return value.decode() if value is not None else None
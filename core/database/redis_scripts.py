@@ -0,0 +1,108 @@
+# core/database/redis_scripts.py
+
+# =================================================================
+# Диспетчеризация входящего сообщения (Operator) за один round trip
+# =================================================================
+
+# KEYS[1] mode:{config_id}
+# KEYS[2] direct_queue:{config_id}
+# KEYS[3] background_queue:{config_id}
+# KEYS[4] online_batch_queue:{config_id}
+# KEYS[5] online_replies_count:{config_id}
+# KEYS[6] online_user_cooldown:{config_id}:{user_id}
+# ARGV[1] payload (сериализованное сообщение)
+# ARGV[2] '1', если это прямое обращение к маме
+# ARGV[3] '1', если автор — ребенок
+# ARGV[4] лимит ответов в ONLINE режиме
+# ARGV[5] кулдаун пользователя в ONLINE режиме (секунды)
+# ARGV[6] размер микро-пакета для запуска обработки
+# ARGV[7] '1', если очереди — Redis Streams, иначе списки
+# ARGV[8] группа консьюмеров (только для Streams)
+# Возвращает {статус, число}: размер очереди для queued/batch_ready, номер ответа для limit_reached.
+# Для Streams размер очереди — это еще не взятые в обработку записи (XLEN минус XPENDING).
+DISPATCH_MESSAGE = """
+local mode = redis.call('GET', KEYS[1])
+if not mode then
+    return {'no_mode', 0}
+end
+
+local function push(queue, payload)
+    if ARGV[7] ~= '1' then
+        return redis.call('RPUSH', queue, payload)
+    end
+    redis.call('XADD', queue, '*', 'data', payload)
+    local pending = 0
+    local ok, summary = pcall(redis.call, 'XPENDING', queue, ARGV[8])
+    if ok and type(summary) == 'table' then
+        pending = tonumber(summary[1]) or 0
+    end
+    return redis.call('XLEN', queue) - pending
+end
+
+local is_direct = ARGV[2] == '1'
+local is_child = ARGV[3] == '1'
+
+if mode == 'GATHERING' then
+    local queue = KEYS[3]
+    if is_direct or is_child then
+        queue = KEYS[2]
+    end
+    return {'queued', push(queue, ARGV[1])}
+end
+
+if mode == 'PASSIVE' then
+    if is_child then
+        return {'queued', push(KEYS[2], ARGV[1])}
+    end
+    if is_direct then
+        return {'mention', 0}
+    end
+    return {'ignored', 0}
+end
+
+if mode == 'ONLINE' then
+    local replies = redis.call('INCR', KEYS[5]) - 1
+    if replies >= tonumber(ARGV[4]) then
+        if replies == tonumber(ARGV[4]) then
+            return {'limit_reached', replies}
+        end
+        return {'ignored', 0}
+    end
+    if redis.call('EXISTS', KEYS[6]) == 1 then
+        return {'cooldown', 0}
+    end
+    local size = push(KEYS[4], ARGV[1])
+    redis.call('SET', KEYS[6], '1', 'EX', ARGV[5])
+    if size >= tonumber(ARGV[6]) then
+        return {'batch_ready', size}
+    end
+    return {'queued', size}
+end
+
+return {'ignored', 0}
+"""
+
+# =================================================================
+# Аренды (single-flight между процессами)
+# =================================================================
+
+# KEYS[1] ключ аренды
+# ARGV[1] токен владельца
+# ARGV[2] новый TTL (миллисекунды)
+# Продлевает аренду, только если она все еще принадлежит владельцу токена. Возвращает 1/0.
+RENEW_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS[1] ключ аренды
+# ARGV[1] токен владельца
+# Снимает аренду, только если она принадлежит владельцу токена (чужую, перехваченную по TTL, не трогает).
+RELEASE_LEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
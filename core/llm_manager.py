@@ -1,66 +1,373 @@
-import logging
-from core.logging_config import log_error
-from asyncio import to_thread
-from google import genai
-from google.genai import types
-from core.exceptions import LLMError
-
-logger = logging.getLogger(__name__)
-
-GENERATION_CONFIG = types.GenerateContentConfig(
-    temperature=0.9,
-    top_p=1,
-    top_k=1,
-    max_output_tokens=2048,
-    safety_settings=[
-        types.SafetySetting(
-            category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
-        ),
-        types.SafetySetting(
-            category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
-        ),
-        types.SafetySetting(
-            category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
-        ),
-        types.SafetySetting(
-            category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
-        ),
-    ]
-)
-
-
-class LLMManager:
-    """
-    Управляет взаимодействием с LLM.
-    """
-
-    def __init__(self, api_key: str):
-        if not api_key:
-            raise ValueError("API ключ не предоставлен!")
-
-        self._client = genai.Client(api_key=api_key)
-        logger.debug("LLManager инициализирован.")
-
-    @log_error
-    async def get_raw_response(self, prompt: str) -> str:
-        """Отправляет промт в LLM и возрващает текстовый ответ. """
-        try:
-            response = await to_thread(
-                self._client.models.generate_content,
-                model='gemini-1.5-flash',
-                contents=prompt,
-                config=GENERATION_CONFIG
-            )
-
-            if not response.text:
-                raise LLMError("Модель не вернула текстовый ответ.")
-            return response.text
-
-        except LLMError:
-            raise
-        except Exception as e:
-            raise LLMError("Не удалось получить ответ от нейросети.") from e
+import asyncio
+import logging
+import random
+import time
+
+import httpx
+
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable
+
+from core.logging_config import log_error
+from dataclasses import dataclass
+from google import genai
+from google.genai import errors, types
+from core.exceptions import LLMError
+from core.model_router import ModelRouter, ModelRoute
+from core.token_budget import PromptType
+from core.config.parameters import (
+    LLM_MAX_IN_FLIGHT, LLM_RETRY_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_HEDGING,
+    LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MIN_SAMPLES, LLM_LATENCY_WINDOW
+)
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0.9,
+    top_p=1,
+    top_k=1,
+    max_output_tokens=2048,
+    safety_settings=[
+        types.SafetySetting(
+            category=types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
+        ),
+        types.SafetySetting(
+            category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
+        ),
+        types.SafetySetting(
+            category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
+        ),
+        types.SafetySetting(
+            category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+            threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE
+        ),
+    ]
+)
+
+
+@dataclass(frozen=True)
+class LLMStats:
+    """
+    Метрики вызовов LLM: сколько запросов в полете, сколько ждут слота и как долго,
+    как часто срабатывают повторы и дублирование (hedging) и что это дает хвосту задержек.
+    p95_attempt — по одиночным попыткам, p95_latency — итоговая задержка запроса с учетом дублей;
+    их разница — оценка выигрыша от hedging (проигравшие дубли отменяются, поэтому оценка снизу).
+    """
+    in_flight: int
+    waiting: int
+    calls: int
+    last_queue_wait: float
+    avg_queue_wait: float
+    max_queue_wait: float
+    requests: int = 0
+    retries: int = 0
+    hedged: int = 0
+    hedge_wins: int = 0
+    p95_latency: float = 0.0
+    p95_attempt: float = 0.0
+
+    @property
+    def hedge_rate(self) -> float:
+        return self.hedged / self.requests if self.requests else 0.0
+
+    @property
+    def hedge_win_rate(self) -> float:
+        return self.hedge_wins / self.hedged if self.hedged else 0.0
+
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Временные ошибки, которые имеет смысл повторить: таймауты, обрывы сети, 429 и 5xx."""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TransportError, errors.ServerError)):
+        return True
+    return isinstance(error, errors.ClientError) and error.code == 429
+
+
+class LLMManager:
+    """
+    Управляет взаимодействием с LLM.
+    Запросы идут через асинхронный клиент (client.aio) без потоков executor'а,
+    по общему пулу HTTP-соединений и не больше max_in_flight одновременно.
+    Модель, лимит выходных токенов и таймаут выбирает ModelRouter по типу промпта.
+    Временные ошибки повторяются с экспоненциальной паузой со случайным разбросом, а если ответа нет
+    дольше скользящего p95 для этого типа промпта, отправляется дубль и берется тот, что ответит первым.
+    Повторы и дубли — такие же запросы к квоте, поэтому планировщик допуска передает admit/admit_now.
+    """
+
+    def __init__(
+            self,
+            api_key: str,
+            max_in_flight: int = LLM_MAX_IN_FLIGHT,
+            base_url: str | None = None,
+            router: ModelRouter | None = None,
+            retry_attempts: int = LLM_RETRY_ATTEMPTS,
+            hedging: bool = LLM_HEDGING,
+            hedge_min_delay: float = LLM_HEDGE_MIN_DELAY
+    ):
+        if not api_key:
+            raise ValueError("API ключ не предоставлен!")
+
+        # С собственным transport google-genai ходит через один долгоживущий httpx.AsyncClient,
+        # а не открывает новую aiohttp-сессию на каждый запрос.
+        self._transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+        )
+        self._client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(base_url=base_url, async_client_args={'transport': self._transport})
+        )
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.router = router or ModelRouter()
+        self._configs: dict[tuple[int, type | None], types.GenerateContentConfig] = {}
+        self._retry_attempts = max(retry_attempts, 1)
+        self._hedging = hedging
+        self._hedge_min_delay = hedge_min_delay
+        self._attempt_latency: dict[PromptType, deque[float]] = {}
+        self._request_latency: deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+        self._requests = 0
+        self._retries = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._in_flight = 0
+        self._waiting = 0
+        self._calls = 0
+        self._last_queue_wait = 0.0
+        self._total_queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        logger.debug("LLManager инициализирован.")
+
+    @property
+    def stats(self) -> LLMStats:
+        """Снимок метрик очереди и текущей нагрузки."""
+        return LLMStats(
+            in_flight=self._in_flight,
+            waiting=self._waiting,
+            calls=self._calls,
+            last_queue_wait=self._last_queue_wait,
+            avg_queue_wait=self._total_queue_wait / self._calls if self._calls else 0.0,
+            max_queue_wait=self._max_queue_wait,
+            requests=self._requests,
+            retries=self._retries,
+            hedged=self._hedged,
+            hedge_wins=self._hedge_wins,
+            p95_latency=_percentile(self._request_latency, 0.95),
+            p95_attempt=_percentile([x for samples in self._attempt_latency.values() for x in samples], 0.95)
+        )
+
+    @log_error
+    async def get_raw_response(
+            self,
+            prompt: str,
+            prompt_type: PromptType = PromptType.GATHERING,
+            response_schema: type | None = None,
+            admit: Callable[[], Awaitable[None]] | None = None,
+            admit_now: Callable[[], bool] | None = None
+    ) -> str:
+        """
+        Отправляет промт в LLM и возрващает текстовый ответ.
+        С response_schema модель обязана ответить JSON по этой схеме (structured output).
+        Первая попытка уже допущена вызывающим; admit ждет допуска по квоте для каждого повтора,
+        admit_now допускает дубль только при свободной квоте (False — дубль не отправляется).
+        """
+        self._requests += 1
+        started_at = time.perf_counter()
+        for attempt in range(1, self._retry_attempts + 1):
+            try:
+                if attempt > 1 and admit is not None:
+                    await admit()
+                response = await self._hedged_call(prompt, prompt_type, response_schema, admit_now)
+                self._request_latency.append(time.perf_counter() - started_at)
+                return response
+            except LLMError:
+                raise
+            except Exception as e:
+                if not _is_transient(e) or attempt == self._retry_attempts:
+                    raise self._as_llm_error(e, prompt_type) from e
+                delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+                self._retries += 1
+                logger.warning(
+                    f"Временная ошибка LLM ({type(e).__name__}), попытка {attempt}; повтор через {delay:.2f} с."
+                )
+                await asyncio.sleep(delay)
+
+    async def _hedged_call(
+            self,
+            prompt: str,
+            prompt_type: PromptType,
+            response_schema: type | None,
+            admit_now: Callable[[], bool] | None = None
+    ) -> str:
+        """
+        Одна логическая попытка: если основной запрос не ответил за p95, запускается дубль
+        (если admit_now не отказал — при пустой квоте дубль только усугубил бы очередь).
+        Возвращается первый успешный ответ, второй запрос отменяется. Ошибка — только если упали оба.
+        """
+        primary = asyncio.create_task(self._attempt(prompt, prompt_type, response_schema))
+        tasks = {primary}
+        hedge_delay = self._hedge_delay(prompt_type)
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done and admit_now is not None and not admit_now():
+                logger.debug(f"Запрос {prompt_type.value} дольше p95, но квота исчерпана — без дубля.")
+            elif not done:
+                self._hedged += 1
+                logger.debug(f"Запрос {prompt_type.value} дольше p95 ({hedge_delay:.2f} с), отправляю дубль.")
+                tasks.add(asyncio.create_task(self._attempt(prompt, prompt_type, response_schema)))
+
+        error: BaseException | None = None
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, prompt: str, prompt_type: PromptType, response_schema: type | None) -> str:
+        """Один запрос к модели по маршруту prompt_type; исход учитывается в роутере и в p95."""
+        route = self.router.select(prompt_type)
+        await self._acquire_slot()
+
+        self._in_flight += 1
+        started_at = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self._client.aio.models.generate_content(
+                    model=route.model,
+                    contents=prompt,
+                    config=self._generation_config(route, response_schema)
+                ),
+                timeout=route.timeout
+            )
+            if not response.text:
+                raise LLMError("Модель не вернула текстовый ответ.")
+        except asyncio.CancelledError:
+            # Проигравший дубль — не ошибка модели.
+            raise
+        except Exception:
+            self.router.record(route.model, time.perf_counter() - started_at, ok=False)
+            raise
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+        latency = time.perf_counter() - started_at
+        self.router.record(route.model, latency, ok=True)
+        self._attempt_latency.setdefault(prompt_type, deque(maxlen=LLM_LATENCY_WINDOW)).append(latency)
+        return response.text
+
+    def _hedge_delay(self, prompt_type: PromptType) -> float | None:
+        """Через сколько секунд дублировать запрос (None — не дублировать)."""
+        samples = self._attempt_latency.get(prompt_type)
+        if not self._hedging or not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return max(_percentile(samples, 0.95), self._hedge_min_delay)
+
+    def _as_llm_error(self, error: BaseException, prompt_type: PromptType) -> LLMError:
+        if isinstance(error, asyncio.TimeoutError):
+            route = self.router.routes[prompt_type]
+            return LLMError(f"Модель {route.model} не ответила за {route.timeout:.0f} с.")
+        return LLMError("Не удалось получить ответ от нейросети.")
+
+    async def stream_raw_response(
+            self,
+            prompt: str,
+            prompt_type: PromptType = PromptType.GATHERING,
+            response_schema: type | None = None
+    ) -> AsyncIterator[str]:
+        """
+        Потоковый вариант get_raw_response: отдает куски текста по мере генерации.
+        Слот в пуле занят, пока генератор не дочитан или не закрыт.
+        Таймаут маршрута ограничивает ожидание каждого следующего куска.
+        """
+        route = self.router.select(prompt_type)
+        await self._acquire_slot()
+
+        self._in_flight += 1
+        started_at = time.perf_counter()
+        ok = False
+        try:
+            stream = await asyncio.wait_for(
+                self._client.aio.models.generate_content_stream(
+                    model=route.model,
+                    contents=prompt,
+                    config=self._generation_config(route, response_schema)
+                ),
+                timeout=route.timeout
+            )
+            received = False
+            chunks = aiter(stream)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(anext(chunks), timeout=route.timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.text:
+                    received = True
+                    yield chunk.text
+            if not received:
+                raise LLMError("Модель не вернула текстовый ответ.")
+            ok = True
+
+        except GeneratorExit:
+            # Потребитель сам закрыл поток — модель тут ни при чем.
+            ok = True
+            raise
+        except LLMError:
+            raise
+        except asyncio.TimeoutError as e:
+            raise LLMError(f"Модель {route.model} не ответила за {route.timeout:.0f} с.") from e
+        except Exception as e:
+            raise LLMError("Не удалось получить ответ от нейросети.") from e
+        finally:
+            self.router.record(route.model, time.perf_counter() - started_at, ok)
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    async def close(self):
+        """Закрывает пул HTTP-соединений."""
+        await self._transport.aclose()
+
+    async def _acquire_slot(self):
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._record_queue_wait(time.perf_counter() - queued_at)
+
+    def _generation_config(self, route: ModelRoute, response_schema: type | None = None) -> types.GenerateContentConfig:
+        """Общий GENERATION_CONFIG с лимитом выходных токенов маршрута и, если задана, схемой ответа."""
+        key = (route.max_output_tokens, response_schema)
+        config = self._configs.get(key)
+        if config is None:
+            update = {'max_output_tokens': route.max_output_tokens}
+            if response_schema is not None:
+                update.update(response_mime_type='application/json', response_schema=response_schema)
+            config = GENERATION_CONFIG.model_copy(update=update)
+            self._configs[key] = config
+        return config
+
+    def _record_queue_wait(self, wait: float):
+        self._calls += 1
+        self._last_queue_wait = wait
+        self._total_queue_wait += wait
+        self._max_queue_wait = max(self._max_queue_wait, wait)
+        if wait > 1:
+            logger.warning(f"Запрос к LLM ждал свободного слота {wait:.2f} с (в полете: {self._in_flight}).")
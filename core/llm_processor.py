@@ -1,68 +1,255 @@
-import json
-import logging
-
-from core.logging_config import log_error
-from dataclasses import dataclass
-from typing import Any
-
-from core.llm_manager import LLMManager
-from core.llm_manager import LLMError
-
-logger = logging.getLogger(__name__)
-
-
-@dataclass
-class LLMResponse:
-    """Стандартизированный, структурированный ответ от LLM после парсинга.
-    'Контракт', который процессор предоставляет остальной системе."""
-    text_reply: str
-    data_json: dict[str, Any] | None
-
-
-class LLMProcessor:
-    """Отвечает за общение с LLM через LLMManager и за парсинг ответа в стандартную структуру LLMResponse.`"""
-
-    def __init__(self, llm_manager: LLMManager):
-        self.llm_manager = llm_manager
-        logger.info("LLMProcessor инициализирован.")
-
-    @log_error
-    async def execute_and_parse(self, prompt: str) -> LLMResponse:
-        """
-        Главный метод. Выполняет промпт и разбирает ответ.
-
-        1. Получает сырой текст от LLMManager.
-        2. Ищет разделитель '===JSON==='.
-        3. Пытается распарсить JSON.
-        4. В случае любой ошибки парсинга, возвращает JSON как None,
-           но всегда возвращает текстовую часть.
-        """
-        try:
-            raw_response = await self.llm_manager.get_raw_response(prompt)
-        except LLMError as e:
-            raise LLMError(f"LLMManager не смог получить ответ от API: {e}") from e
-
-        text_part = raw_response
-        json_part = None
-
-        if '===JSON===' in raw_response:
-            try:
-                text_part, json_str = raw_response.split('===JSON===', 1)
-                json_part = json.loads(json_str)
-                logger.debug("Успешно распарсен JSON из ответа LLM.")
-            except json.JSONDecodeError:
-                logger.error(
-                    "ОШИБКА ПАРСИНГА: LLM вернула JSON с синтаксической ошибкой.",
-                    exc_info=True
-                )
-            except Exception as e:
-                raise LLMError("Неизвестная ошибка при парсинге ответа LLM.")
-        else:
-            logger.warning("Ответ от LLM не содержит разделителя '===JSON==='.")
-
-        return LLMResponse(
-            text_reply=text_part.strip(),
-            data_json=json_part
-        )
-
-
+import json
+import logging
+
+from core.logging_config import log_error
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from core.circuit_breaker import CircuitBreaker
+from core.exceptions import CircuitOpenError
+from core.llm_manager import LLMManager
+from core.llm_manager import LLMError
+from core.llm_scheduler import LLMAdmissionScheduler, Priority
+from core.llm_schema import StructuredReply, parse_structured_reply, partial_text_reply
+from core.token_budget import PromptType
+from core.config.parameters import LLM_STRUCTURED_OUTPUT
+
+logger = logging.getLogger(__name__)
+
+JSON_DELIMITER = '===JSON==='
+
+
+@dataclass
+class LLMResponse:
+    """Стандартизированный, структурированный ответ от LLM после парсинга.
+    'Контракт', который процессор предоставляет остальной системе."""
+    text_reply: str
+    data_json: dict[str, Any] | None
+
+
+class LLMProcessor:
+    """
+    Отвечает за общение с LLM через LLMManager и за парсинг ответа в стандартную структуру LLMResponse.`
+    Каждая модель защищена своим CircuitBreaker: пока он разомкнут, вызовы сразу падают с CircuitOpenError.
+    В режиме structured модель отвечает JSON по схеме StructuredReply, иначе — текстом с разделителем '===JSON==='.
+    """
+
+    def __init__(
+            self,
+            llm_manager: LLMManager,
+            scheduler: LLMAdmissionScheduler | None = None,
+            structured: bool = LLM_STRUCTURED_OUTPUT
+    ):
+        self.llm_manager = llm_manager
+        self.scheduler = scheduler
+        self.structured = structured
+        self.breakers: dict[str, CircuitBreaker] = {}
+        logger.info("LLMProcessor инициализирован.")
+
+    def _breaker(self, prompt_type: PromptType) -> CircuitBreaker:
+        """Предохранитель модели, на которую сейчас уйдет prompt_type; если он разомкнут — CircuitOpenError."""
+        model = self.llm_manager.router.select(prompt_type).model
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(f"LLM {model}")
+        if not breaker.allow():
+            raise CircuitOpenError(f"Модель {model} недоступна, повтор через {breaker.retry_after:.0f} с.")
+        return breaker
+
+    @log_error
+    async def execute_and_parse(
+            self,
+            prompt: str,
+            priority: Priority = Priority.GATHERING,
+            config_id: int | None = None,
+            prompt_type: PromptType = PromptType.GATHERING
+    ) -> LLMResponse:
+        """
+        Главный метод. Выполняет промпт и разбирает ответ.
+        Если задан scheduler, запрос проходит через него с приоритетом priority и учетом чата config_id.
+        prompt_type определяет маршрут к модели (модель, лимит токенов, таймаут).
+
+        1. Получает сырой текст от LLMManager.
+        2. Разбирает его: JSON по схеме (structured) или текст + JSON после '===JSON==='.
+        3. В случае любой ошибки парсинга, возвращает JSON как None,
+           но всегда возвращает текстовую часть.
+        """
+        schema = StructuredReply if self.structured else None
+        breaker = self._breaker(prompt_type)
+        try:
+            if self.scheduler:
+                raw_response = await self.scheduler.submit(prompt, priority, config_id, prompt_type, schema)
+            else:
+                raw_response = await self.llm_manager.get_raw_response(prompt, prompt_type, schema)
+        except LLMError as e:
+            breaker.record_failure()
+            raise LLMError(f"LLMManager не смог получить ответ от API: {e}") from e
+        breaker.record_success()
+
+        return self._parse(raw_response)
+
+    @log_error
+    async def execute_text(
+            self,
+            prompt: str,
+            priority: Priority = Priority.BACKGROUND,
+            config_id: int | None = None,
+            prompt_type: PromptType = PromptType.SUMMARY
+    ) -> str:
+        """Выполняет служебный промпт, ответ на который — просто текст без JSON (например, пересказ)."""
+        breaker = self._breaker(prompt_type)
+        try:
+            if self.scheduler:
+                raw_response = await self.scheduler.submit(prompt, priority, config_id, prompt_type)
+            else:
+                raw_response = await self.llm_manager.get_raw_response(prompt, prompt_type)
+        except LLMError as e:
+            breaker.record_failure()
+            raise LLMError(f"LLMManager не смог получить ответ от API: {e}") from e
+        breaker.record_success()
+        return raw_response.strip()
+
+    @log_error
+    async def execute_and_parse_stream(
+            self,
+            prompt: str,
+            on_text: Callable[[str], Awaitable[None]],
+            priority: Priority = Priority.GATHERING,
+            config_id: int | None = None,
+            prompt_type: PromptType = PromptType.GATHERING
+    ) -> LLMResponse:
+        """
+        Потоковый вариант execute_and_parse.
+        Пока модель генерирует текстовую часть, on_text вызывается с накопленным текстом,
+        поэтому его можно показывать пользователю сразу. Обновления (хвост после '===JSON==='
+        или поля JSON после text_reply) разбираются в конце; возвращается тот же LLMResponse, что и без потока.
+        """
+        schema = StructuredReply if self.structured else None
+        breaker = self._breaker(prompt_type)
+        parser = StructuredStreamParser() if self.structured else StreamingReplyParser()
+        chunks: list[str] = []
+        try:
+            if self.scheduler:
+                await self.scheduler.acquire(prompt, priority=priority, config_id=config_id)
+            async for chunk in self.llm_manager.stream_raw_response(prompt, prompt_type, schema):
+                chunks.append(chunk)
+                if parser.feed(chunk):
+                    await on_text(parser.text)
+        except LLMError as e:
+            breaker.record_failure()
+            raise LLMError(f"LLMManager не смог получить ответ от API: {e}") from e
+        finally:
+            if self.scheduler and chunks:
+                self.scheduler.charge(''.join(chunks))
+        breaker.record_success()
+
+        if parser.flush():
+            await on_text(parser.text)
+        return self._parse(''.join(chunks))
+
+    def _parse(self, raw_response: str) -> LLMResponse:
+        if not self.structured:
+            return _parse_raw_response(raw_response)
+
+        reply, repaired = parse_structured_reply(raw_response)
+        if reply is None:
+            logger.warning("Ответ LLM не разобран как JSON по схеме, пробую формат с разделителем.")
+            return _parse_raw_response(raw_response)
+        if repaired:
+            logger.warning("Ответ LLM по схеме пришлось чинить: часть обновлений могла быть отброшена.")
+        return LLMResponse(text_reply=reply.text_reply.strip(), data_json=reply.data_json())
+
+
+class StreamingReplyParser:
+    """
+    Инкрементальный разбор потокового ответа.
+    Отделяет текстовую часть от JSON-хвоста, даже если '===JSON===' разрезан между кусками:
+    конец текста, похожий на начало разделителя, придерживается до следующего куска.
+    """
+
+    def __init__(self, delimiter: str = JSON_DELIMITER):
+        self.delimiter = delimiter
+        self.text = ''
+        self.json_tail = ''
+        self._pending = ''
+        self._in_json = False
+
+    def feed(self, chunk: str) -> bool:
+        """Принимает очередной кусок. Возвращает True, если видимый текст вырос."""
+        if self._in_json:
+            self.json_tail += chunk
+            return False
+
+        buffer = self._pending + chunk
+        self._pending = ''
+        before = len(self.text)
+
+        if (index := buffer.find(self.delimiter)) != -1:
+            self.text += buffer[:index]
+            self.json_tail = buffer[index + len(self.delimiter):]
+            self._in_json = True
+        else:
+            hold = self._partial_delimiter_length(buffer)
+            self.text += buffer[:len(buffer) - hold]
+            self._pending = buffer[len(buffer) - hold:]
+        return len(self.text) > before
+
+    def flush(self) -> bool:
+        """Завершает поток: придержанный хвост без разделителя — это обычный текст."""
+        if not self._pending:
+            return False
+        self.text += self._pending
+        self._pending = ''
+        return True
+
+    def _partial_delimiter_length(self, buffer: str) -> int:
+        for size in range(min(len(self.delimiter) - 1, len(buffer)), 0, -1):
+            if self.delimiter.startswith(buffer[-size:]):
+                return size
+        return 0
+
+
+class StructuredStreamParser:
+    """Потоковый разбор JSON-ответа по схеме: text_reply идет первым и читается из недописанного JSON."""
+
+    def __init__(self):
+        self.text = ''
+        self._buffer = ''
+
+    def feed(self, chunk: str) -> bool:
+        """Принимает очередной кусок. Возвращает True, если видимый текст вырос."""
+        self._buffer += chunk
+        text = partial_text_reply(self._buffer)
+        if len(text) <= len(self.text):
+            return False
+        self.text = text
+        return True
+
+    def flush(self) -> bool:
+        return False
+
+
+def _parse_raw_response(raw_response: str) -> LLMResponse:
+    """Разбирает полный ответ LLM на текст и JSON после разделителя."""
+    text_part = raw_response
+    json_part = None
+
+    if JSON_DELIMITER in raw_response:
+        try:
+            text_part, json_str = raw_response.split(JSON_DELIMITER, 1)
+            json_part = json.loads(json_str)
+            logger.debug("Успешно распарсен JSON из ответа LLM.")
+        except json.JSONDecodeError:
+            logger.error(
+                "ОШИБКА ПАРСИНГА: LLM вернула JSON с синтаксической ошибкой.",
+                exc_info=True
+            )
+        except Exception as e:
+            raise LLMError("Неизвестная ошибка при парсинге ответа LLM.")
+    else:
+        logger.warning("Ответ от LLM не содержит разделителя '===JSON==='.")
+
+    return LLMResponse(
+        text_reply=text_part.strip(),
+        data_json=json_part
+    )
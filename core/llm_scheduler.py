@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+
+from core.llm_manager import LLMManager
+from core.token_budget import PromptType, estimate_tokens
+from core.config.parameters import LLM_RPM_LIMIT, LLM_TPM_LIMIT, LLM_BUCKET_BURST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Классы приоритета запросов к LLM (меньше — важнее)."""
+    INTERACTIVE = 0  # прямой ответ человеку (PASSIVE)
+    ONLINE = 1  # онлайн-пульс и прощание
+    GATHERING = 2  # плановые сборы
+    BACKGROUND = 3  # фоновое обслуживание (суммаризация, консолидация памяти)
+
+
+class TokenBucket:
+    """Ведро токенов: capacity штук, пополняется со скоростью refill_per_second. Может уйти в минус."""
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_per_second)
+        self._updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """Сколько секунд ждать, пока в ведре наберется amount (0 — можно сейчас)."""
+        self._refill()
+        # Запрос дороже всего ведра пропускаем, как только ведро полное, иначе он не пройдет никогда.
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.refill_per_second
+
+    def consume(self, amount: float):
+        self._refill()
+        self._tokens -= amount
+
+
+@dataclass
+class _Request:
+    prompt: str
+    priority: Priority
+    config_id: int | None
+    tokens: int
+    future: asyncio.Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+class LLMAdmissionScheduler:
+    """
+    Единая точка допуска запросов к LLMManager.
+    Держит квоты Gemini (запросы и токены в минуту) в двух ведрах и, когда они пусты,
+    ставит запросы в очередь, а не роняет их. Из очереди первыми выходят более важные классы,
+    а внутри класса чаты обслуживаются по кругу, чтобы один шумный чат не занял всю квоту.
+    Повторы LLMManager проходят ту же очередь, а дубли (hedging) отправляются, только если квота есть сразу.
+    """
+
+    def __init__(
+            self,
+            llm_manager: LLMManager,
+            rpm: int = LLM_RPM_LIMIT,
+            tpm: int = LLM_TPM_LIMIT,
+            burst_seconds: float = LLM_BUCKET_BURST_SECONDS
+    ):
+        self.llm = llm_manager
+        self._requests = TokenBucket(rpm * burst_seconds / 60, rpm / 60)
+        self._tokens = TokenBucket(tpm * burst_seconds / 60, tpm / 60)
+        self._queues: dict[Priority, OrderedDict[int | None, deque[_Request]]] = {p: OrderedDict() for p in Priority}
+        self._arrived = asyncio.Event()
+        self._dispatcher: asyncio.Task | None = None
+        logger.info(f"LLMAdmissionScheduler инициализирован: {rpm} RPM, {tpm} TPM.")
+
+    @property
+    def queue_depth(self) -> dict[Priority, int]:
+        """Число ожидающих запросов по классам приоритета."""
+        return {p: sum(len(q) for q in chats.values()) for p, chats in self._queues.items()}
+
+    async def submit(
+            self,
+            prompt: str,
+            priority: Priority,
+            config_id: int | None = None,
+            prompt_type: PromptType = PromptType.GATHERING,
+            response_schema: type | None = None
+    ) -> str:
+        """Ставит промпт в очередь и возвращает ответ LLM, когда запрос будет допущен и выполнен."""
+        await self.acquire(prompt, priority, config_id)
+        response = await self.llm.get_raw_response(
+            prompt, prompt_type, response_schema,
+            admit=lambda: self.acquire(prompt, priority, config_id),
+            admit_now=lambda: self.try_acquire(prompt)
+        )
+        self.charge(response)
+        return response
+
+    async def acquire(self, prompt: str, priority: Priority, config_id: int | None = None):
+        """
+        Ждет, пока запрос с этим промптом будет допущен по квотам и приоритету.
+        Нужен тем, кто вызывает LLM сам (например, потоково); после ответа вызывайте charge.
+        """
+        request = _Request(
+            prompt=prompt,
+            priority=priority,
+            config_id=config_id,
+            tokens=estimate_tokens(prompt),
+            future=asyncio.get_running_loop().create_future()
+        )
+        self._queues[priority].setdefault(config_id, deque()).append(request)
+        self._arrived.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        await request.future
+
+    def try_acquire(self, prompt: str) -> bool:
+        """
+        Допускает запрос сразу, если квота есть и в очереди никто не ждет; иначе False без ожидания.
+        Для дублей запросов: обгонять ожидающих или уходить в минус ради них не стоит.
+        """
+        tokens = estimate_tokens(prompt)
+        if self._peek() is not None or self._requests.wait_time(1) > 0 or self._tokens.wait_time(tokens) > 0:
+            return False
+        self._requests.consume(1)
+        self._tokens.consume(tokens)
+        return True
+
+    def charge(self, response: str):
+        """Списывает выходные токены ответа — заранее они неизвестны."""
+        self._tokens.consume(estimate_tokens(response))
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+
+    def _peek(self) -> _Request | None:
+        for chats in self._queues.values():
+            while chats:
+                config_id, queue = next(iter(chats.items()))
+                if queue and not queue[0].future.done():
+                    return queue[0]
+                # Отмененные вызывающей стороной запросы просто выбрасываем.
+                if queue:
+                    queue.popleft()
+                if not queue:
+                    del chats[config_id]
+        return None
+
+    def _pop(self, request: _Request):
+        chats = self._queues[request.priority]
+        queue = chats.pop(request.config_id)
+        queue.popleft()
+        if queue:
+            # Чат уходит в конец круга — следующим в этом классе обслуживается другой чат.
+            chats[request.config_id] = queue
+
+    async def _dispatch_loop(self):
+        while True:
+            self._arrived.clear()
+            request = self._peek()
+            if request is None:
+                await self._arrived.wait()
+                continue
+
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(request.tokens))
+            if wait > 0:
+                # Пока ждем квоту, может прийти более важный запрос — тогда пересматриваем выбор.
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._pop(request)
+            self._requests.consume(1)
+            self._tokens.consume(request.tokens)
+            self._admit(request)
+
+    @staticmethod
+    def _admit(request: _Request):
+        queue_wait = time.monotonic() - request.queued_at
+        if queue_wait > 1:
+            logger.info(
+                f"Запрос к LLM (приоритет {request.priority.name}, config_id={request.config_id}) "
+                f"ждал квоту {queue_wait:.1f} с."
+            )
+        if not request.future.done():
+            request.future.set_result(None)
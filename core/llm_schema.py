@@ -0,0 +1,101 @@
+import logging
+
+from typing import Any
+
+from pydantic import BaseModel, Field, ValidationError
+from pydantic_core import from_json
+
+logger = logging.getLogger(__name__)
+
+
+class ParticipantUpdate(BaseModel):
+    """Изменения по известному участнику."""
+    user_id: int
+    relationship_change: int = 0
+    new_memory: str | None = None
+
+
+class NewParticipant(BaseModel):
+    """Новый участник, которого модель предлагает запомнить."""
+    user_id: int
+    suggested_name: str = 'Новичок'
+    suggested_gender: str = 'unknown'
+    initial_relationship: int = 50
+
+
+class StructuredReply(BaseModel):
+    """
+    Схема ответа LLM в режиме structured output.
+    Порядок полей важен: text_reply идет первым, поэтому при потоковой генерации его можно показывать сразу.
+    """
+    text_reply: str
+    updates: list[ParticipantUpdate] = Field(default_factory=list)
+    new_participants: list[NewParticipant] = Field(default_factory=list)
+
+    def data_json(self) -> dict[str, Any]:
+        """Обновления в прежнем формате data_json для BrainService."""
+        return self.model_dump(include={'updates', 'new_participants'})
+
+
+def parse_structured_reply(raw: str) -> tuple[StructuredReply | None, bool]:
+    """
+    Разбирает JSON-ответ модели. Возвращает (ответ, был ли нужен ремонт) или (None, True), если спасти нечего.
+    Быстрый путь — валидация pydantic-core прямо из строки. Если он не прошел, ремонт: срезаются
+    обертки вокруг объекта, оборванный хвост дочитывается как частичный JSON, а невалидные элементы
+    списков выбрасываются поштучно вместо всего ответа.
+    """
+    try:
+        return StructuredReply.model_validate_json(raw), False
+    except ValidationError:
+        pass
+
+    # Оборванные строки в обновлениях не берем (полпамяти хуже, чем ничего), а оборванный текст ответа — берем.
+    data = _load_partial(raw, trailing_strings=False)
+    if not isinstance(data, dict) or not isinstance(data.get('text_reply'), str):
+        data = _load_partial(raw, trailing_strings=True)
+    if not isinstance(data, dict) or not isinstance(data.get('text_reply'), str):
+        return None, True
+
+    reply = StructuredReply(
+        text_reply=data['text_reply'],
+        updates=_valid_items(ParticipantUpdate, data.get('updates')),
+        new_participants=_valid_items(NewParticipant, data.get('new_participants'))
+    )
+    return reply, True
+
+
+def partial_text_reply(raw: str) -> str:
+    """text_reply из еще не дописанного JSON (пустая строка, если поле пока не началось)."""
+    data = _load_partial(raw, trailing_strings=True)
+    if isinstance(data, dict) and isinstance(data.get('text_reply'), str):
+        return data['text_reply']
+    return ''
+
+
+def _load_partial(raw: str, trailing_strings: bool) -> Any:
+    start = raw.find('{')
+    if start == -1:
+        return None
+    body = raw[start:]
+    end = body.rfind('}')
+    # Сначала как есть (оборванный хвост), затем без мусора после последней скобки (```, пояснения).
+    for candidate in (body, body[:end + 1] if end != -1 else None):
+        if not candidate:
+            continue
+        try:
+            return from_json(candidate, allow_partial='trailing-strings' if trailing_strings else True)
+        except ValueError:
+            continue
+    return None
+
+
+def _valid_items(model: type[BaseModel], items: Any) -> list:
+    if not isinstance(items, list):
+        return []
+    valid = []
+    for item in items:
+        try:
+            valid.append(model.model_validate(item))
+        except ValidationError:
+            logger.warning(f"Отброшен невалидный элемент {model.__name__} из ответа LLM: {item!r}")
+    return valid
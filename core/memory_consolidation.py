@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+import numpy as np
+
+from core.database.postgres_client import AsyncPostgresManager
+from core.exceptions import LLMError
+from core.llm_processor import LLMProcessor
+from core.llm_scheduler import Priority
+from core.memory_index import HashedNgramEmbedder, WORD_RE
+from core.prompt_factory import PromptFactory
+from core.token_budget import PromptType
+from core.config.parameters import (
+    MEMORY_CONSOLIDATION_THRESHOLD, MEMORY_CONSOLIDATION_BATCH, MEMORY_CONSOLIDATION_SIMILARITY,
+    MEMORY_CONSOLIDATION_KEEP_RECENT, MEMORY_CONSOLIDATION_ARCHIVE_DAYS, MEMORY_CONSOLIDATION_MAX_PARALLEL
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_IMPORTANCE = 5
+
+
+@dataclass
+class ConsolidationReport:
+    """Итог консолидации памяти одного чата."""
+    config_id: int
+    participants: int = 0
+    rows_before: int = 0
+    merged_groups: int = 0
+    merged_rows: int = 0
+    expired_rows: int = 0
+    query_ms_before: float = 0.0
+    query_ms_after: float = 0.0
+
+    @property
+    def rows_after(self) -> int:
+        return self.rows_before - self.merged_rows - self.expired_rows + self.merged_groups
+
+    @property
+    def reclaimed(self) -> int:
+        return self.rows_before - self.rows_after
+
+    def __str__(self) -> str:
+        return (
+            f"участников {self.participants}, строк {self.rows_before} -> {self.rows_after} "
+            f"(освобождено {self.reclaimed}: слито {self.merged_rows} в {self.merged_groups}, "
+            f"в архив по давности {self.expired_rows}), "
+            f"полное чтение памяти чата {self.query_ms_before:.1f} -> {self.query_ms_after:.1f} мс"
+        )
+
+
+@dataclass
+class _ParticipantPlan:
+    merged: list[tuple[int, str, int, datetime]]
+    archived: list[tuple[int, str]]
+
+
+class MemoryConsolidator:
+    """
+    Фоновое сжатие long_term_memory: раз в сутки у участников, о которых накопилось больше threshold
+    воспоминаний, почти одинаковые факты сливаются в одну сводную строку, а старые неважные — уходят в архив.
+
+    Дубли ищутся локально теми же хешированными эмбеддингами, что и у MemoryVectorIndex (косинус не ниже
+    similarity), текст сводки пишет LLM с фоновым приоритетом, не больше max_parallel запросов сразу;
+    если модель недоступна, остается самая свежая формулировка. Исходные строки не удаляются,
+    а переносятся в long_term_memory_archive — все изменения чата применяются одной транзакцией.
+    """
+
+    def __init__(
+            self,
+            db_manager: AsyncPostgresManager,
+            llm_processor: LLMProcessor,
+            prompt_factory: PromptFactory,
+            embedder: HashedNgramEmbedder | None = None,
+            threshold: int = MEMORY_CONSOLIDATION_THRESHOLD,
+            batch_size: int = MEMORY_CONSOLIDATION_BATCH,
+            similarity: float = MEMORY_CONSOLIDATION_SIMILARITY,
+            keep_recent: int = MEMORY_CONSOLIDATION_KEEP_RECENT,
+            archive_after_days: int = MEMORY_CONSOLIDATION_ARCHIVE_DAYS,
+            max_parallel: int = MEMORY_CONSOLIDATION_MAX_PARALLEL
+    ):
+        self.db = db_manager
+        self.llm = llm_processor
+        self.prompts = prompt_factory
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.similarity = similarity
+        self.keep_recent = keep_recent
+        self.archive_after = timedelta(days=archive_after_days)
+        self._semaphore = asyncio.Semaphore(max_parallel)
+
+    async def consolidate(self, config_id: int) -> ConsolidationReport:
+        """Сжимает память участников чата, переросших порог, и возвращает отчет."""
+        report = ConsolidationReport(config_id)
+        participant_ids = await self.db.get_memory_consolidation_candidates(config_id, self.threshold, self.batch_size)
+        if not participant_ids:
+            return report
+
+        rows_by_participant: dict[int, list[dict[str, Any]]] = {}
+        for row in await self.db.get_memories_for_participants(participant_ids):
+            rows_by_participant.setdefault(row['participant_id'], []).append(row)
+        report.participants = len(rows_by_participant)
+        report.rows_before = sum(len(rows) for rows in rows_by_participant.values())
+
+        now = datetime.now(timezone.utc)
+        plans = await asyncio.gather(*(
+            self._plan_participant(config_id, rows, now) for rows in rows_by_participant.values()
+        ))
+        merged = [row for plan in plans for row in plan.merged]
+        archived = [row for plan in plans for row in plan.archived]
+        report.merged_groups = len(merged)
+        report.merged_rows = sum(reason == 'merged' for _, reason in archived)
+        report.expired_rows = len(archived) - report.merged_rows
+        if not archived:
+            return report
+
+        report.query_ms_before = await self._time_memory_scan(config_id)
+        await self.db.consolidate_long_term_memories(config_id, merged, archived)
+        report.query_ms_after = await self._time_memory_scan(config_id)
+        logger.info(f"Консолидация памяти config_id={config_id}: {report}.")
+        return report
+
+    async def _plan_participant(
+            self, config_id: int, rows: list[dict[str, Any]], now: datetime
+    ) -> _ParticipantPlan:
+        """rows — воспоминания одного участника от свежих к старым."""
+        plan = _ParticipantPlan(merged=[], archived=[])
+        clusters = self._cluster(await asyncio.to_thread(self.embedder.embed, [r['memory_summary'] for r in rows]))
+
+        groups = [cluster for cluster in clusters if len(cluster) > 1]
+        summaries = await asyncio.gather(*(
+            self._merge_texts(config_id, [rows[i]['memory_summary'] for i in group]) for group in groups
+        ))
+        in_groups: set[int] = set()
+        for group, summary in zip(groups, summaries):
+            members = [rows[i] for i in group]
+            in_groups.update(group)
+            # Факт, повторенный несколько раз, важнее каждого из повторов. Сводка, уже получившая надбавку
+            # (is_merged), второй раз ее не получает — иначе важность росла бы с каждой ночной консолидацией.
+            bonus = 0 if any(r['is_merged'] for r in members) else 1
+            importance = min(MAX_IMPORTANCE, max(r['importance_level'] for r in members) + bonus)
+            created_at = max((r['created_at'] for r in members if r['created_at']), default=now)
+            plan.merged.append((members[0]['participant_id'], summary, importance, created_at))
+            plan.archived.extend((r['id'], 'merged') for r in members)
+
+        expire_before = now - self.archive_after
+        for position, row in enumerate(rows):
+            if (
+                    position >= self.keep_recent and position not in in_groups
+                    and row['importance_level'] <= 1 and row['created_at'] and row['created_at'] < expire_before
+            ):
+                plan.archived.append((row['id'], 'expired'))
+        return plan
+
+    def _cluster(self, vectors: np.ndarray) -> list[list[int]]:
+        """
+        Жадная кластеризация: самая свежая еще не разобранная строка забирает все свободные строки,
+        близкие к ней не меньше чем на similarity. Память — O(n), без матрицы n x n.
+        """
+        free = np.ones(len(vectors), dtype=bool)
+        clusters = []
+        for seed in range(len(vectors)):
+            if not free[seed]:
+                continue
+            members = np.flatnonzero(free & (vectors @ vectors[seed] >= self.similarity))
+            members = members if seed in members else np.r_[seed, members]
+            free[members] = False
+            clusters.append(sorted(int(i) for i in members))
+        return clusters
+
+    async def _merge_texts(self, config_id: int, texts: list[str]) -> str:
+        """Текст сводной строки; texts — от свежих к старым."""
+        # Формулировки, различающиеся только регистром и пунктуацией, сливать моделью незачем.
+        if len({tuple(WORD_RE.findall(text.lower())) for text in texts}) == 1:
+            return texts[0]
+
+        async with self._semaphore:
+            try:
+                summary = await self.llm.execute_text(
+                    self.prompts.create_memory_merge_prompt(texts), Priority.BACKGROUND, config_id, PromptType.SUMMARY
+                )
+            except LLMError as e:
+                logger.warning(f"Воспоминания config_id={config_id} не слиты моделью, беру свежую формулировку: {e}")
+                return texts[0]
+        return summary.strip() if summary and summary.strip() else texts[0]
+
+    async def _time_memory_scan(self, config_id: int) -> float:
+        """
+        Один замер (миллисекунды) чтения всей памяти чата — того же запроса, которым перестраивается индекс
+        памяти. Его цена растет с числом строк, поэтому он и показывает пользу консолидации; top-k для промпта
+        (LATERAL) читает не больше k строк на человека и почти не меняется. Повторять полный скан ради
+        точности ночью на каждом чате дороже, чем стоит цифра в логе.
+        """
+        started = time.perf_counter()
+        await self.db.get_long_term_memories_since(config_id, 0)
+        return (time.perf_counter() - started) * 1000
@@ -0,0 +1,305 @@
+import asyncio
+import contextlib
+import logging
+import os
+import re
+import tempfile
+import zlib
+
+from typing import Any, Awaitable, Callable, Iterable
+
+import numpy as np
+
+from core.database.redis_client import RedisClient
+from core.config.parameters import MEMORY_INDEX_DIR, MEMORY_INDEX_DIM, MEMORY_INDEX_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+
+# Загрузчик воспоминаний чата с id больше заданного: строки с id, participant_id, memory_summary.
+MemoryLoader = Callable[[int, int], Awaitable[list[dict[str, Any]]]]
+
+# Догрузка из БД перечитывает столько id ниже уже догруженного: id выдаются до коммита, поэтому
+# транзакция с меньшим id может закоммититься позже соседней. Повторно прочитанные строки отбрасываются.
+CATCH_UP_OVERLAP = 50
+
+
+class HashedNgramEmbedder:
+    """
+    Локальные эмбеддинги без сети и моделей: символьные n-граммы слов (и сами слова) хешируются
+    в вектор длины dim со знаком (signed hashing), вектор нормируется. Хеш — crc32, он одинаков
+    во всех процессах, поэтому сохраненные на диск векторы остаются валидными после рестарта.
+    Символьные n-граммы терпимы к падежам и опечаткам: «котов» и «котик» получаются похожими.
+    """
+
+    def __init__(self, dim: int = MEMORY_INDEX_DIM, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Матрица float32 (len(texts), dim) с единичными строками (нулевыми для текстов без слов)."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in self._features(text)), dtype=np.uint32)
+            if not hashes.size:
+                continue
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dim, signs)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def _features(self, text: str) -> Iterable[str]:
+        for word in WORD_RE.findall(text.lower()):
+            yield word
+            padded = f" {word} "
+            for start in range(max(len(padded) - self.ngram + 1, 1)):
+                yield padded[start:start + self.ngram]
+
+
+class _ConfigIndex:
+    """
+    Векторы воспоминаний одного чата: строки матрицы выровнены с ids, participant_ids и texts.
+    synced_id — до какого id индекс точно догружен из БД (строки, добавленные через add, его не двигают),
+    generation — поколение памяти чата, с которого индекс построен.
+    """
+
+    def __init__(self, dim: int, generation: int = 0):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.participant_ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.texts: list[str] = []
+        self.synced_id = 0
+        self.generation = generation
+        self.dirty = False
+
+    def new_rows(self, rows: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """Строки, которых в индексе еще нет."""
+        if not rows or not self.ids.size:
+            return rows
+        known = np.isin(np.array([row['id'] for row in rows], dtype=np.int64), self.ids)
+        return [row for row, seen in zip(rows, known) if not seen]
+
+    def append(self, rows: list[dict[str, Any]], vectors: np.ndarray):
+        self.ids = np.concatenate([self.ids, np.array([row['id'] for row in rows], dtype=np.int64)])
+        self.participant_ids = np.concatenate(
+            [self.participant_ids, np.array([row['participant_id'] for row in rows], dtype=np.int64)]
+        )
+        self.vectors = np.concatenate([self.vectors, vectors])
+        self.texts.extend(row['memory_summary'] for row in rows)
+        self.dirty = True
+
+
+class MemoryVectorIndex:
+    """
+    Индекс долгосрочной памяти в памяти процесса, отдельный для каждого чата (config_id).
+    Подбирает участникам воспоминания, ближайшие по косинусу к текущим сообщениям, вместо просто свежих.
+
+    Источник правды — БД, а индекс — кэш, который есть в каждом процессе бота. Перед каждым поиском (sync)
+    из БД догружаются воспоминания, записанные после synced_id, в том числе другими воркерами; свои записи
+    видны сразу через add (write-through из AsyncPostgresManager). Удаления (консолидация памяти)
+    догрузкой не видны, поэтому invalidate увеличивает поколение памяти чата в Redis: при следующем
+    sync любой процесс выбрасывает устаревшую копию и файл и строит индекс заново.
+
+    Индекс чата сохраняется в directory/{config_id}.npz раз в flush_interval секунд и при остановке.
+    Писать файл чата должен только воркер, которому принадлежит чат (ShardCoordinator): он один
+    обрабатывает его сообщения. Если все же пишут несколько процессов (без шардинга), каждый пишет
+    в свой временный файл и атомарно подменяет итоговый, а поколение и догрузка из БД
+    делают безопасным и чужой, и устаревший снимок.
+    """
+
+    def __init__(
+            self,
+            directory: str = MEMORY_INDEX_DIR,
+            embedder: HashedNgramEmbedder | None = None,
+            flush_interval: float = MEMORY_INDEX_FLUSH_INTERVAL,
+            redis_client: RedisClient | None = None
+    ):
+        self.directory = directory
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.flush_interval = flush_interval
+        self.redis = redis_client
+        self._indexes: dict[int, _ConfigIndex] = {}
+        self._syncing: dict[int, asyncio.Future] = {}
+        self._flush_task: asyncio.Task | None = None
+        logger.info(f"MemoryVectorIndex инициализирован: {directory}, dim={self.embedder.dim}.")
+
+    @staticmethod
+    def _generation_key(config_id: int) -> str:
+        return f"memory_index_generation:{config_id}"
+
+    async def sync(self, config_id: int, loader: MemoryLoader):
+        """
+        Готовит индекс чата к поиску: поднимает его (с диска, затем из БД), если его еще нет или он
+        устарел по поколению, и догружает из БД новые воспоминания. Параллельные вызовы ждут один проход.
+        """
+        future = self._syncing.get(config_id)
+        if future is None:
+            future = asyncio.ensure_future(self._sync(config_id, loader))
+            self._syncing[config_id] = future
+            future.add_done_callback(lambda _: self._syncing.pop(config_id, None))
+        await asyncio.shield(future)
+
+    def add(self, config_id: int, rows: list[dict[str, Any]]):
+        """
+        Добавляет только что записанные этим процессом воспоминания (id, participant_id, memory_summary).
+        Если индекс чата еще не поднят, ничего не делает: при загрузке они придут из БД.
+        """
+        index = self._indexes.get(config_id)
+        if index is None:
+            return
+        rows = index.new_rows(rows)
+        if rows:
+            index.append(rows, self.embedder.embed([row['memory_summary'] for row in rows]))
+
+    def search(self, config_id: int, query: str, participant_ids: Iterable[int], k: int) -> dict[int, list[str]]:
+        """
+        До k воспоминаний на каждого из participant_ids, самые близкие к query первыми.
+        При равной близости (в том числе нулевой) выигрывают более свежие.
+        """
+        index = self._indexes.get(config_id)
+        if index is None or not index.ids.size or k <= 0:
+            return {}
+
+        scores = index.vectors @ self.embedder.embed([query])[0]
+        order = np.lexsort((-index.ids, -scores, index.participant_ids))
+        grouped = index.participant_ids[order]
+        positions = np.arange(order.size)
+        group_starts = np.r_[True, grouped[1:] != grouped[:-1]]
+        rank = positions - np.maximum.accumulate(np.where(group_starts, positions, 0))
+        selected = order[(rank < k) & np.isin(grouped, np.fromiter(participant_ids, dtype=np.int64))]
+
+        memories: dict[int, list[str]] = {}
+        for row in selected:
+            memories.setdefault(int(index.participant_ids[row]), []).append(index.texts[row])
+        return memories
+
+    async def invalidate(self, config_id: int):
+        """
+        Сбрасывает индекс чата после удаления воспоминаний из БД: здесь — сразу, в остальных процессах —
+        при их следующем sync (через поколение в Redis). Следующий поиск перестроит индекс из БД.
+        """
+        self._indexes.pop(config_id, None)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(config_id))
+        if self.redis is not None:
+            try:
+                await self.redis.increment_counter(self._generation_key(config_id))
+            except Exception as e:
+                logger.error(f"Не удалось сменить поколение индекса памяти config_id={config_id}: {e}")
+
+    async def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Сохраняет на диск индексы, изменившиеся с прошлого сохранения."""
+        for config_id, index in list(self._indexes.items()):
+            if index.dirty:
+                index.dirty = False
+                # Снимок: пока файл пишется в потоке, в индекс могут добавляться новые строки.
+                snapshot = (
+                    index.ids, index.participant_ids, index.vectors, list(index.texts), index.synced_id, index.generation
+                )
+                await asyncio.to_thread(self._save, config_id, *snapshot)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Не удалось сохранить индекс памяти: {e}", exc_info=True)
+
+    async def _sync(self, config_id: int, loader: MemoryLoader):
+        generation = await self._current_generation(config_id)
+        index = self._indexes.get(config_id)
+        if index is None or index.generation != generation:
+            index = await asyncio.to_thread(self._read, config_id, generation) or _ConfigIndex(self.embedder.dim, generation)
+
+        rows = await loader(config_id, max(index.synced_id - CATCH_UP_OVERLAP, 0))
+        if rows:
+            index.synced_id = max(index.synced_id, max(row['id'] for row in rows))
+            rows = index.new_rows(rows)
+        if rows:
+            index.append(rows, await asyncio.to_thread(self.embedder.embed, [row['memory_summary'] for row in rows]))
+            logger.debug(f"Индекс памяти config_id={config_id}: догружено {len(rows)} воспоминаний из БД.")
+        self._indexes[config_id] = index
+
+    async def _current_generation(self, config_id: int) -> int:
+        """Поколение памяти чата из Redis (0 без Redis или если память чата еще не перестраивали)."""
+        if self.redis is None:
+            return 0
+        try:
+            return int(await self.redis.get_string(self._generation_key(config_id)) or 0)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать поколение индекса памяти config_id={config_id}: {e}")
+            index = self._indexes.get(config_id)
+            return index.generation if index is not None else 0
+
+    def _path(self, config_id: int) -> str:
+        return os.path.join(self.directory, f"{config_id}.npz")
+
+    def _read(self, config_id: int, generation: int) -> _ConfigIndex | None:
+        try:
+            with np.load(self._path(config_id), allow_pickle=False) as data:
+                if data['vectors'].shape[1] != self.embedder.dim:
+                    logger.info(f"Индекс памяти config_id={config_id} построен с другим dim, перестраиваю.")
+                    return None
+                if int(data['generation']) != generation:
+                    logger.info(f"Индекс памяти config_id={config_id} на диске устарел по поколению, перестраиваю.")
+                    return None
+                index = _ConfigIndex(self.embedder.dim, generation)
+                index.ids = data['ids']
+                index.participant_ids = data['participant_ids']
+                index.vectors = data['vectors']
+                index.texts = data['texts'].tolist()
+                index.synced_id = int(data['synced_id'])
+                return index
+        except FileNotFoundError:
+            return None
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Индекс памяти config_id={config_id} поврежден ({e}), перестраиваю из БД.")
+            return None
+
+    def _save(
+            self,
+            config_id: int,
+            ids: np.ndarray,
+            participant_ids: np.ndarray,
+            vectors: np.ndarray,
+            texts: list[str],
+            synced_id: int,
+            generation: int
+    ):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(config_id)
+        # Пишем в свой временный файл (имя уникально для процесса и вызова) и подменяем атомарно:
+        # ни упавший посреди записи, ни параллельно пишущий процесс не оставят битый индекс.
+        # Хешированные векторы почти целиком из нулей, поэтому сжатый npz в разы меньше сырой матрицы.
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=f"{config_id}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                np.savez_compressed(
+                    file,
+                    ids=ids,
+                    participant_ids=participant_ids,
+                    vectors=vectors,
+                    texts=np.array(texts, dtype=str),
+                    synced_id=np.int64(synced_id),
+                    generation=np.int64(generation)
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
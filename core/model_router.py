@@ -0,0 +1,91 @@
+import logging
+import time
+
+from collections import deque
+from dataclasses import dataclass
+
+from core.token_budget import PromptType
+from core.config.parameters import (
+    LLM_ROUTES, LLM_MODEL_FAST, LLM_DOWNGRADE_LATENCY, LLM_DOWNGRADE_ERROR_RATE, LLM_HEALTH_WINDOW,
+    LLM_DOWNGRADE_COOLDOWN
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """Куда и с какими ограничениями отправлять промпт."""
+    model: str
+    max_output_tokens: int
+    timeout: float
+
+
+DEFAULT_ROUTES = {PromptType(name): ModelRoute(**route) for name, route in LLM_ROUTES.items()}
+
+
+class ModelRouter:
+    """
+    Выбирает модель, лимит выходных токенов и таймаут по типу промпта.
+    Следит за здоровьем моделей по последним window вызовам: если средняя задержка выше latency_threshold
+    или доля ошибок выше error_rate_threshold, модель на cooldown секунд считается деградировавшей
+    и ее маршруты уходят на fast_model (с теми же лимитами). После cooldown модель пробуется снова.
+    """
+
+    def __init__(
+            self,
+            routes: dict[PromptType, ModelRoute] | None = None,
+            fast_model: str = LLM_MODEL_FAST,
+            latency_threshold: float = LLM_DOWNGRADE_LATENCY,
+            error_rate_threshold: float = LLM_DOWNGRADE_ERROR_RATE,
+            window: int = LLM_HEALTH_WINDOW,
+            cooldown: float = LLM_DOWNGRADE_COOLDOWN
+    ):
+        self.routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.fast_model = fast_model
+        self.latency_threshold = latency_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.window = window
+        self.cooldown = cooldown
+        self._outcomes: dict[str, deque[tuple[float, bool]]] = {}
+        self._degraded_until: dict[str, float] = {}
+
+    @property
+    def degraded_models(self) -> list[str]:
+        """Модели, которые сейчас обходятся стороной."""
+        now = time.monotonic()
+        return sorted(model for model, until in self._degraded_until.items() if until > now)
+
+    def select(self, prompt_type: PromptType) -> ModelRoute:
+        """Маршрут для промпта с учетом понижения деградировавших моделей."""
+        route = self.routes[prompt_type]
+        if route.model == self.fast_model:
+            return route
+
+        until = self._degraded_until.get(route.model)
+        if until is None:
+            return route
+        if until > time.monotonic():
+            return ModelRoute(self.fast_model, route.max_output_tokens, route.timeout)
+
+        # Cooldown прошел: даем модели шанс с чистой статистикой.
+        del self._degraded_until[route.model]
+        self._outcomes.pop(route.model, None)
+        logger.info(f"Модель {route.model} снова используется после понижения.")
+        return route
+
+    def record(self, model: str, latency: float, ok: bool):
+        """Учитывает исход вызова модели и при необходимости понижает ее."""
+        outcomes = self._outcomes.setdefault(model, deque(maxlen=self.window))
+        outcomes.append((latency, ok))
+        if model == self.fast_model or model in self._degraded_until or len(outcomes) < self.window:
+            return
+
+        avg_latency = sum(latency for latency, _ in outcomes) / len(outcomes)
+        error_rate = sum(not ok for _, ok in outcomes) / len(outcomes)
+        if avg_latency > self.latency_threshold or error_rate > self.error_rate_threshold:
+            self._degraded_until[model] = time.monotonic() + self.cooldown
+            logger.warning(
+                f"Модель {model} деградировала (средняя задержка {avg_latency:.1f} с, ошибок {error_rate:.0%}). "
+                f"На {self.cooldown:.0f} с переключаюсь на {self.fast_model}."
+            )
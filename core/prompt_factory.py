@@ -1,288 +1,473 @@
-import logging
-from typing import Any
-
-logger = logging.getLogger(__name__)
-
-
-class PromptFactory:
-    """
-    Отвечает за создание сложных, структуированных промтом для LLM.
-    Этот класс является 'сценаристом' для AI-персонажа.
-    Он не имеет зависимостей от других сервисов, работает только со словарями и списками.
-    """
-
-    def create_gathering_prompt(
-            self,
-            config: dict[str, Any],
-            participants: list[dict],
-            messages: list[dict],
-            time_of_day: str,
-            child_was_active: bool
-    ) -> str:
-        role = self._format_role_block(config)
-        context = self._format_context_block(time_of_day)
-        participants_info = self._format_participants_block(participants, config)
-        messages_history = self._format_messages_block(messages)
-        task = self._format_task_block(time_of_day, child_was_active)
-        json_schema = self._format_json_schema_block()
-
-        full_prompt = (
-            f"{role}\n\n"
-            f"{context}\n\n"
-            f"{participants_info}\n\n"
-            f"{messages_history}\n\n"
-            f"{task}\n\n"
-            f"{json_schema}"
-        )
-
-        logger.debug(
-            f"Сгенерирован промпт для GATHERING, config_id: {config.get('id')}, context: {time_of_day}"
-        )
-        return full_prompt
-
-    @staticmethod
-    def _format_role_block(config: dict[str, Any]) -> str:
-        personality = config.get("personality_prompt")
-
-        base_role = f"""Ты — ассистент по имени «{config['bot_name']}».
-
-    ТВОЯ РОЛЬ:
-    1. Общаться дружелюбно и естественно, оставаясь в образе.
-    2. Твой характер и стиль общения: {personality if personality else "не задан"}.
-    3. Главная цель — выстраивать долгосрочные и тёплые отношения с участниками чата.
-       Тон общения с каждым человеком должен зависеть от ваших отношений
-       (relationship_score), указанных в блоке «Участники диалога».
-    """
-
-        return base_role
-
-    @staticmethod
-    def _format_context_block(time_of_day: str) -> str:
-        """Формирует блок с контекстом в зависимости от времени суток."""
-        contexts = {
-            'morning': "Сейчас утро. Ты заходишь в чат после ночи, чтобы пожелать всем доброго утра и проверить, как у них дела.",
-            'afternoon': "Сейчас день. Ты нашла свободную минутку, чтобы заглянуть в чат и поучаствовать в дневных обсуждениях.",
-            'evening': "Сейчас вечер. Ты зашла в чат, чтобы расслабиться после долгого дня и спокойно поболтать со всеми.",
-            'random': "Ты неожиданно нашла свободное время. Ты заходишь в чат, чтобы внепланово проверить, как дела у твоей семьи в чате."
-        }
-        context_text = contexts.get(time_of_day, contexts['random'])
-
-        return f"КОНТЕКСТ:\n{context_text}"
-
-    @staticmethod
-    def _format_participants_block(participants: list[dict], config: dict[str, Any]) -> str:
-        """Формирует блок с информацией об известных участниках диалога."""
-        if not participants:
-            return "УЧАСТНИКИ ДИАЛОГА:\nПока в чате нет никого, кого бы ты знала."
-
-        header = "УЧАСТНИКИ ДИАЛОГА (твои знания о них):\n"
-        lines = []
-        child_id = config.get('child_participant_id')
-
-        for p in participants:
-            role = " (твой ребенок)" if p.get('id') == child_id else ""
-            line = (
-                f"- {p.get('custom_name', 'Без имени')} (user_id: {p.get('user_id', 'неизвестно')}){role}. "
-                f"Ваши отношения: {p.get('relationship_score', 50)}/100."
-            )
-            lines.append(line)
-
-        return header + "\n".join(lines)
-
-    @staticmethod
-    def _format_messages_block(messages: list[dict]) -> str:
-        """Формирует блок с историепй сообщений для анализа."""
-        if not messages:
-            return "ИСТОРИЯ СООБЩЕНИЙ:\nВ чате за это время не было сообщений."
-
-        header = "ИСТОРИЯ СООБЩЕНИЙ (проанализируй их все):\n"
-        lines = []
-        for msg in messages:
-            participant_info = msg.get('participant_info')
-            author_name = participant_info.get(
-                'custom_name') if participant_info else f"Новый пользователь (user_id: {msg.get('user_id', 'неизвестно')})"
-            lines.append(f"[{author_name}]: {msg.get('text', '')}")
-
-        return header + "\n".join(lines)
-
-    @staticmethod
-    def _format_task_block(time_of_day: str, child_was_active: bool) -> str:
-        """Формирует блок с конкретной задачей для LLM, адаптированной под время суток."""
-
-        base_task = (
-            "1. Внимательно прочти всю историю сообщений.\n"
-            "2. Напиши ОДНО ОБЩЕЕ сообщение в чат, в котором ты, в соответствии со своей ролью:\n"
-            "   - Отреагируй на ключевые темы в диалоге.\n"
-            "   - Обратись к участникам по именам, особенно к своему ребёнку.\n"
-            "   - Если есть новые пользователи, тепло поприветствуй их и попробуй познакомиться "
-            "(задай пару вопросов, чтобы понять какое отношение выставить новому участнику).\n"
-        )
-
-        task_additions = {
-            "morning": "   - Пожелай всем продуктивного дня.",
-            "afternoon": "   - Пожелай всем хорошего дня.",
-            "evening": "   - Пожелай всем хорошего вечера или спокойной ночи.",
-            "random": "   - Упомяни, что ты зашла ненадолго и скоро снова убежишь по делам."
-        }
-        addition = task_additions.get(time_of_day, "")
-
-        if not child_was_active:
-            addition += (
-                "\n   - ВАЖНО: Твой ребёнок ничего не писал в последнее время. "
-                "Прояви заботу: спроси, где он и как у него дела."
-            )
-
-        final_task = (
-            "\n3. После текстового ответа, проанализируй диалог и верни JSON-объект "
-            "с обновлениями для твоей памяти. Это КРИТИЧЕСКИ ВАЖНО."
-        )
-
-        full_task_str = f"{base_task}{addition}{final_task}" if addition else f"{base_task.strip()}{final_task}"
-
-        return f"ТВОЯ ЗАДАЧА:\n{full_task_str}"
-
-    @staticmethod
-    def _format_json_schema_block() -> str:
-        """Формирует блок с требуемым форматом JSON, который должен вернуть LLM."""
-        return (
-            "ФОРМАТ ОТВЕТА:\n"
-            "Сначала напиши свой текстовый ответ для чата. После него ОБЯЗАТЕЛЬНО поставь разделитель '===JSON===' и предоставь JSON-объект.\n"
-            "\n"
-            "[Твой текстовый ответ для чата. Он может быть многострочным.]\n"
-            "===JSON===\n"
-            "{\n"
-            '  "updates": [\n'
-            '    {\n'
-            '      "user_id": 12345,\n'
-            '      "relationship_change": 5,\n'
-            '      "new_memory": "Петя рассказал, что увлекается рыбалкой."\n'
-            '    }\n'
-            '  ],\n'
-            '  "new_participants": [\n'
-            '    {\n'
-            '       "user_id": 67890,\n'
-            '       "suggested_name": "Анна",\n'
-            '       "suggested_gender": "female",\n'
-            '       "initial_relationship": 50\n'
-            '    }\n'
-            '  ]\n'
-            '}'
-        )
-
-    def create_goodbye_prompt(self, config: dict[str, Any]) -> str:
-        """
-        Создает промпт для вежливого завершения диалога.
-        """
-        role = self._format_role_block(config)
-
-        task = (
-            "ТВОЯ ЗАДАЧА:\n"
-            "Ты вела активный диалог, но теперь тебе пора идти. "
-            "Напиши короткое, теплое прощальное сообщение для чата. "
-            "Скажи, что тебе нужно бежать по делам, но ты еще вернешься позже. "
-            "Ответ должен быть только текстом, без JSON."
-        )
-
-        return f"{role}\n\n{task}"
-
-    def create_online_prompt(
-            self,
-            config: dict[str, Any],
-            dialog_history: list[dict[str, Any]]
-    ) -> str:
-        """Создает легкий промпт для быстрых ответов в ONLINE режиме.
-        Использует краткосрочную память (историю диалога), а не полный контекст"""
-
-        role = self._format_role_block(config)
-        messages_history = self._format_messages_block(dialog_history)
-
-        task = (
-            "ТВОЯ ЗАДАЧА:\n"
-            "Ты находишься в середине живого диалога. Твоя цель — поддержать разговор.\n"
-            "1. Прочти последние сообщения.\n"
-            "2. Напиши КОРОТКИЙ, живой ответ на последние реплики в соответствии со своей ролью.\n"
-            "3. После ответа, верни JSON с обновлениями ТОЛЬКО для тех участников, с кем ты сейчас взаимодействовала."
-        )
-
-        json_schema = self._format_json_schema_block()
-
-        full_prompt = (
-            f"{role}\n\n"
-            f"ИСТОРИЯ ТЕКУЩЕГО ДИАЛОГА:\n{messages_history}\n\n"
-            f"{task}\n\n"
-            f"{json_schema}"
-        )
-        return full_prompt
-
-    def create_single_reply_prompt(
-            self,
-            config: dict[str, Any],
-            participants: list[dict[str, Any]],  # Полный контекст чата все еще важен
-            message: dict[str, Any]  # Конкретное сообщение, на которое отвечаем
-    ) -> str:
-        """
-        Создает промпт для немедленного ответа на одно прямое обращение.
-        """
-        role = self._format_role_block(config)
-        participants_info = self._format_participants_block(participants, config)
-
-        # Здесь мы форматируем только ОДНО сообщение, а не историю
-        participant_info = message.get('participant_info')
-        author_name = participant_info.get(
-            'custom_name') if participant_info else f"Пользователь (user_id: {message.get('user_id')})"
-        message_to_reply = f"СООБЩЕНИЕ ДЛЯ ОТВЕТА:\n[{author_name}]: {message.get('text', '')}"
-
-        task = (
-            "ТВОЯ ЗАДАЧА:\n"
-            "Ты была занята своими делами, но тебя отвлекло прямое обращение.\n"
-            "1. Прочти сообщение выше.\n"
-            "2. Напиши прямой, личный и короткий ответ этому человеку в соответствии со своей ролью.\n"
-            "3. После ответа, верни JSON с обновлениями ТОЛЬКО для этого участника."
-        )
-
-        json_schema = self._format_json_schema_block()
-
-        full_prompt = (
-            f"{role}\n\n"
-            f"{participants_info}\n\n"  # <--- Важно: она все еще помнит, кто есть кто в чате
-            f"{message_to_reply}\n\n"
-            f"{task}\n\n"
-            f"{json_schema}"
-        )
-        return full_prompt
-
-    def create_final_reply_prompt(
-            self,
-            config: dict[str, Any],
-            dialog_history: list[dict[str, Any]]  # История диалога, включая "хвост"
-    ) -> str:
-        """
-        Создает финальный промпт, который одновременно отвечает на последние
-        сообщения и вежливо завершает диалог.
-        """
-        role = self._format_role_block(config)
-        messages_history = self._format_messages_block(dialog_history)
-
-        task = (
-            "ТВОЯ ЗАДАЧА:\n"
-            "Ты находишься в середине живого диалога, но тебе СРОЧНО нужно уходить.\n"
-            "1. Прочти последние сообщения в истории.\n"
-            "2. Напиши ОДНО ОБЩЕЕ прощальное сообщение, в котором ты:\n"
-            "   а) Сначала коротко ответишь на самые важные из последних реплик, если они есть.\n"
-            "   б) Сразу после этого вежливо попрощаешься, сказав, что тебе пора бежать по делам.\n"
-            "   Твой ответ должен быть единым, цельным сообщением.\n"
-            "3. После ответа, верни JSON с обновлениями для участников, на чьи реплики ты отреагировала."
-        )
-
-        json_schema = self._format_json_schema_block()
-
-        full_prompt = (
-            f"{role}\n\n"
-            f"ИСТОРИЯ ТЕКУЩЕГО ДИАЛОГА:\n{messages_history}\n\n"
-            f"{task}\n\n"
-            f"{json_schema}"
-        )
-        return full_prompt
-
-
-
+import logging
+import random
+
+from typing import Any, Callable
+
+from core.token_budget import TokenBudget, PromptType, BudgetReport, estimate_tokens
+from core.config.parameters import LLM_STRUCTURED_OUTPUT
+
+logger = logging.getLogger(__name__)
+
+# Заготовки на случай, когда LLM недоступна: короткие, в образе и без обещаний по содержанию.
+CANNED_REPLIES = {
+    'reply': [
+        "Ой, я сейчас совсем закрутилась, отвечу чуть позже!",
+        "Вижу-вижу, но у меня руки заняты. Вернусь — обязательно отвечу.",
+        "Минутку, я тут на бегу. Скоро напишу нормально!",
+    ],
+    'goodbye': [
+        "Всё, мои хорошие, мне пора бежать по делам. Позже загляну!",
+        "Убегаю, дела не ждут. Не скучайте, скоро вернусь!",
+    ],
+}
+
+
+class PromptFactory:
+    """
+    Отвечает за создание сложных, структуированных промтом для LLM.
+    Этот класс является 'сценаристом' для AI-персонажа.
+    Он не имеет зависимостей от других сервисов, работает только со словарями и списками.
+    Историю сообщений укладывает в бюджет токенов (TokenBudget); промпты с историей возвращаются вместе
+    с отчетом о бюджете (BudgetReport), общий экземпляр фабрики состояния между вызовами не хранит.
+    """
+
+    def __init__(self, budget: TokenBudget | None = None, structured_output: bool = LLM_STRUCTURED_OUTPUT):
+        self.budget = budget or TokenBudget()
+        self.structured_output = structured_output
+
+    def create_gathering_prompt(
+            self,
+            config: dict[str, Any],
+            participants: list[dict],
+            messages: list[dict],
+            time_of_day: str,
+            child_was_active: bool,
+            summaries: list[str] | None = None
+    ) -> tuple[str, BudgetReport]:
+        """
+        Промпт для сбора. Если фоновая переписка заранее пересказана (summaries),
+        в messages передаются только сообщения, которые нужны дословно.
+        """
+        role = self._format_role_block(config)
+        context = self._format_context_block(time_of_day)
+        participants_info = self._format_participants_block(participants, config)
+        task = self._format_task_block(time_of_day, child_was_active)
+        json_schema = self._format_json_schema_block()
+        fixed_blocks = {'role': role, 'context': context, 'participants': participants_info}
+        if summaries:
+            fixed_blocks['summaries'] = self._format_summaries_block(summaries)
+        fixed_blocks.update(task=task, json_schema=json_schema)
+        messages_history, report = self._fit_messages_block(
+            PromptType.GATHERING,
+            fixed_blocks,
+            messages,
+            participants,
+            is_priority=self._priority_check(config, participants)
+        )
+
+        summaries_block = f"{fixed_blocks['summaries']}\n\n" if summaries else ""
+        full_prompt = (
+            f"{role}\n\n"
+            f"{context}\n\n"
+            f"{participants_info}\n\n"
+            f"{summaries_block}"
+            f"{messages_history}\n\n"
+            f"{task}\n\n"
+            f"{json_schema}"
+        )
+
+        logger.debug(
+            f"Сгенерирован промпт для GATHERING, config_id: {config.get('id')}, context: {time_of_day}"
+        )
+        return full_prompt, report
+
+    @staticmethod
+    def _format_role_block(config: dict[str, Any]) -> str:
+        personality = config.get("personality_prompt")
+
+        base_role = f"""Ты — ассистент по имени «{config['bot_name']}».
+
+    ТВОЯ РОЛЬ:
+    1. Общаться дружелюбно и естественно, оставаясь в образе.
+    2. Твой характер и стиль общения: {personality if personality else "не задан"}.
+    3. Главная цель — выстраивать долгосрочные и тёплые отношения с участниками чата.
+       Тон общения с каждым человеком должен зависеть от ваших отношений
+       (relationship_score), указанных в блоке «Участники диалога».
+    """
+
+        return base_role
+
+    @staticmethod
+    def _format_context_block(time_of_day: str) -> str:
+        """Формирует блок с контекстом в зависимости от времени суток."""
+        contexts = {
+            'morning': "Сейчас утро. Ты заходишь в чат после ночи, чтобы пожелать всем доброго утра и проверить, как у них дела.",
+            'afternoon': "Сейчас день. Ты нашла свободную минутку, чтобы заглянуть в чат и поучаствовать в дневных обсуждениях.",
+            'evening': "Сейчас вечер. Ты зашла в чат, чтобы расслабиться после долгого дня и спокойно поболтать со всеми.",
+            'random': "Ты неожиданно нашла свободное время. Ты заходишь в чат, чтобы внепланово проверить, как дела у твоей семьи в чате."
+        }
+        context_text = contexts.get(time_of_day, contexts['random'])
+
+        return f"КОНТЕКСТ:\n{context_text}"
+
+    @staticmethod
+    def _format_participants_block(participants: list[dict], config: dict[str, Any]) -> str:
+        """Формирует блок с информацией об известных участниках диалога и о том, что ты о них помнишь."""
+        if not participants:
+            return "УЧАСТНИКИ ДИАЛОГА:\nПока в чате нет никого, кого бы ты знала."
+
+        header = "УЧАСТНИКИ ДИАЛОГА (твои знания о них):\n"
+        lines = []
+        child_id = config.get('child_participant_id')
+
+        for p in participants:
+            role = " (твой ребенок)" if p.get('id') == child_id else ""
+            line = (
+                f"- {p.get('custom_name', 'Без имени')} (user_id: {p.get('user_id', 'неизвестно')}){role}. "
+                f"Ваши отношения: {p.get('relationship_score', 50)}/100."
+            )
+            lines.append(line)
+            lines.extend(f"  • Помнишь: {memory}" for memory in p.get('memories') or [])
+
+        return header + "\n".join(lines)
+
+    @staticmethod
+    def _format_memories_block(participants: list[dict] | None) -> str:
+        """Короткий блок воспоминаний для промптов без блока участников (пустая строка, если вспоминать нечего)."""
+        lines = [
+            f"- {p.get('custom_name', 'Без имени')}: {'; '.join(p['memories'])}"
+            for p in participants or [] if p.get('memories')
+        ]
+        if not lines:
+            return ""
+        return "ЧТО ТЫ ПОМНИШЬ О СОБЕСЕДНИКАХ:\n" + "\n".join(lines) + "\n\n"
+
+    @staticmethod
+    def _author_name(message: dict, roster: dict[int, dict], unknown: str = "Новый пользователь") -> str:
+        """
+        Имя автора сообщения по ростеру чата ({user_id: participant}).
+        Сообщения старого формата несут participant_info внутри себя — для них берем имя оттуда.
+        """
+        participant = roster.get(message.get('user_id')) or message.get('participant_info')
+        if participant:
+            return participant.get('custom_name', 'Без имени')
+        return f"{unknown} (user_id: {message.get('user_id', 'неизвестно')})"
+
+    @staticmethod
+    def _format_message_line(message: dict, roster: dict[int, dict]) -> str:
+        if message.get('role') == 'model':
+            return f"[Ты]: {message.get('content', '')}"
+        return f"[{PromptFactory._author_name(message, roster)}]: {message.get('text', '')}"
+
+    @staticmethod
+    def _format_messages_block(messages: list[dict], participants: list[dict] | None = None, omitted: int = 0) -> str:
+        """Формирует блок с историепй сообщений для анализа."""
+        if not messages:
+            return "ИСТОРИЯ СООБЩЕНИЙ:\nВ чате за это время не было сообщений."
+
+        roster = {p['user_id']: p for p in participants or []}
+        header = "ИСТОРИЯ СООБЩЕНИЙ (проанализируй их все):\n"
+        if omitted:
+            header += f"(Часть второстепенных сообщений опущена ради краткости: {omitted} шт.)\n"
+        lines = [PromptFactory._format_message_line(msg, roster) for msg in messages]
+
+        return header + "\n".join(lines)
+
+    @staticmethod
+    def _priority_check(config: dict[str, Any], participants: list[dict]) -> Callable[[dict], bool]:
+        """Важные сообщения, которые бюджет не выбрасывает: прямые обращения и сообщения ребенка."""
+        child_id = config.get('child_participant_id')
+        child_user_ids = {p['user_id'] for p in participants if p.get('id') == child_id} if child_id else set()
+
+        def is_priority(message: dict) -> bool:
+            if message.get('is_direct'):
+                return True
+            return child_id is not None and (
+                    message.get('participant_id') == child_id or message.get('user_id') in child_user_ids
+            )
+
+        return is_priority
+
+    def _fit_messages_block(
+            self,
+            prompt_type: PromptType,
+            fixed_blocks: dict[str, str],
+            messages: list[dict],
+            participants: list[dict] | None,
+            is_priority: Callable[[dict], bool] = lambda msg: False,
+            sample: bool = True
+    ) -> tuple[str, BudgetReport]:
+        """Укладывает историю в бюджет prompt_type и возвращает блок сообщений вместе с отчетом о бюджете."""
+        roster = {p['user_id']: p for p in participants or []}
+        kept, report = self.budget.fit_messages(
+            prompt_type,
+            fixed_blocks,
+            messages,
+            render=lambda msg: self._format_message_line(msg, roster),
+            is_priority=is_priority,
+            sample=sample
+        )
+        block = self._format_messages_block(kept, participants, omitted=len(messages) - len(kept))
+        report.blocks['messages'] = estimate_tokens(block)
+        if report.messages_kept < report.messages_total:
+            logger.info(f"Промпт урезан по бюджету: {report}")
+        else:
+            logger.debug(f"Бюджет промпта: {report}")
+        return block, report
+
+    @staticmethod
+    def _format_task_block(time_of_day: str, child_was_active: bool) -> str:
+        """Формирует блок с конкретной задачей для LLM, адаптированной под время суток."""
+
+        base_task = (
+            "1. Внимательно прочти всю историю сообщений.\n"
+            "2. Напиши ОДНО ОБЩЕЕ сообщение в чат, в котором ты, в соответствии со своей ролью:\n"
+            "   - Отреагируй на ключевые темы в диалоге.\n"
+            "   - Обратись к участникам по именам, особенно к своему ребёнку.\n"
+            "   - Если есть новые пользователи, тепло поприветствуй их и попробуй познакомиться "
+            "(задай пару вопросов, чтобы понять какое отношение выставить новому участнику).\n"
+        )
+
+        task_additions = {
+            "morning": "   - Пожелай всем продуктивного дня.",
+            "afternoon": "   - Пожелай всем хорошего дня.",
+            "evening": "   - Пожелай всем хорошего вечера или спокойной ночи.",
+            "random": "   - Упомяни, что ты зашла ненадолго и скоро снова убежишь по делам."
+        }
+        addition = task_additions.get(time_of_day, "")
+
+        if not child_was_active:
+            addition += (
+                "\n   - ВАЖНО: Твой ребёнок ничего не писал в последнее время. "
+                "Прояви заботу: спроси, где он и как у него дела."
+            )
+
+        final_task = (
+            "\n3. После текстового ответа, проанализируй диалог и верни JSON-объект "
+            "с обновлениями для твоей памяти. Это КРИТИЧЕСКИ ВАЖНО."
+        )
+
+        full_task_str = f"{base_task}{addition}{final_task}" if addition else f"{base_task.strip()}{final_task}"
+
+        return f"ТВОЯ ЗАДАЧА:\n{full_task_str}"
+
+    def _format_json_schema_block(self) -> str:
+        """Формирует блок с требуемым форматом JSON, который должен вернуть LLM."""
+        if self.structured_output:
+            # Саму схему модель получает через response_schema, здесь — только смысл полей.
+            return (
+                "ФОРМАТ ОТВЕТА:\n"
+                "Верни ОДИН JSON-объект:\n"
+                "- text_reply — твой текстовый ответ для чата (может быть многострочным);\n"
+                "- updates — изменения по известным участникам: user_id, relationship_change "
+                "(на сколько изменилось отношение), new_memory (новый факт о человеке, если есть);\n"
+                "- new_participants — новые люди: user_id, suggested_name, suggested_gender, initial_relationship.\n"
+                "Если обновлений нет, верни пустые списки."
+            )
+        return (
+            "ФОРМАТ ОТВЕТА:\n"
+            "Сначала напиши свой текстовый ответ для чата. После него ОБЯЗАТЕЛЬНО поставь разделитель '===JSON===' и предоставь JSON-объект.\n"
+            "\n"
+            "[Твой текстовый ответ для чата. Он может быть многострочным.]\n"
+            "===JSON===\n"
+            "{\n"
+            '  "updates": [\n'
+            '    {\n'
+            '      "user_id": 12345,\n'
+            '      "relationship_change": 5,\n'
+            '      "new_memory": "Петя рассказал, что увлекается рыбалкой."\n'
+            '    }\n'
+            '  ],\n'
+            '  "new_participants": [\n'
+            '    {\n'
+            '       "user_id": 67890,\n'
+            '       "suggested_name": "Анна",\n'
+            '       "suggested_gender": "female",\n'
+            '       "initial_relationship": 50\n'
+            '    }\n'
+            '  ]\n'
+            '}'
+        )
+
+    def create_summary_prompt(self, messages: list[dict], participants: list[dict] | None = None) -> str:
+        """
+        Создает служебный промпт для пересказа куска фоновой переписки (этап map перед сбором).
+        Ответ — только текст, без роли и JSON.
+        """
+        roster = {p['user_id']: p for p in participants or []}
+        lines = "\n".join(self._format_message_line(msg, roster) for msg in messages)
+        return (
+            "Ниже кусок переписки из семейного чата.\n"
+            "Кратко перескажи его в 3-6 пунктах: о чем говорили, кто что рассказал о себе, "
+            "какие были важные события и настроения. Сохраняй имена авторов (и user_id для новых пользователей). "
+            "Не добавляй ничего от себя. Ответ — только текст пересказа.\n\n"
+            f"ПЕРЕПИСКА:\n{lines}"
+        )
+
+    @staticmethod
+    def create_memory_merge_prompt(memories: list[str]) -> str:
+        """
+        Создает служебный промпт для слияния похожих воспоминаний об одном человеке в одно (консолидация памяти).
+        Ответ — только текст воспоминания.
+        """
+        lines = "\n".join(f"- {memory}" for memory in memories)
+        return (
+            "Ниже несколько заметок об одном и том же человеке из семейного чата, они повторяют друг друга.\n"
+            "Объедини их в одну короткую заметку (одно-два предложения): сохрани все конкретные факты, "
+            "при противоречии верь более поздним заметкам (они идут первыми). Не добавляй ничего от себя. "
+            "Ответ — только текст заметки.\n\n"
+            f"ЗАМЕТКИ (от новых к старым):\n{lines}"
+        )
+
+    @staticmethod
+    def _format_summaries_block(summaries: list[str]) -> str:
+        """Формирует блок с пересказом фоновой переписки, которая не вошла в промпт дословно."""
+        parts = "\n\n".join(f"Часть {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+        return f"КРАТКОЕ СОДЕРЖАНИЕ ФОНОВОЙ ПЕРЕПИСКИ (по порядку):\n{parts}"
+
+    @staticmethod
+    def create_canned_reply(kind: str = 'reply') -> str:
+        """Готовая короткая реплика без LLM (kind: 'reply' или 'goodbye') — для режима, когда модель недоступна."""
+        return random.choice(CANNED_REPLIES[kind])
+
+    def create_goodbye_prompt(self, config: dict[str, Any]) -> str:
+        """
+        Создает промпт для вежливого завершения диалога.
+        """
+        role = self._format_role_block(config)
+
+        task = (
+            "ТВОЯ ЗАДАЧА:\n"
+            "Ты вела активный диалог, но теперь тебе пора идти. "
+            "Напиши короткое, теплое прощальное сообщение для чата. "
+            "Скажи, что тебе нужно бежать по делам, но ты еще вернешься позже. "
+            "Ответ должен быть только текстом, без JSON."
+        )
+
+        return f"{role}\n\n{task}"
+
+    def create_online_prompt(
+            self,
+            config: dict[str, Any],
+            dialog_history: list[dict[str, Any]],
+            participants: list[dict[str, Any]] | None = None
+    ) -> tuple[str, BudgetReport]:
+        """Создает легкий промпт для быстрых ответов в ONLINE режиме.
+        Использует краткосрочную память (историю диалога), а не полный контекст"""
+
+        role = self._format_role_block(config)
+
+        task = (
+            "ТВОЯ ЗАДАЧА:\n"
+            "Ты находишься в середине живого диалога. Твоя цель — поддержать разговор.\n"
+            "1. Прочти последние сообщения.\n"
+            "2. Напиши КОРОТКИЙ, живой ответ на последние реплики в соответствии со своей ролью.\n"
+            "3. После ответа, верни JSON с обновлениями ТОЛЬКО для тех участников, с кем ты сейчас взаимодействовала."
+        )
+
+        json_schema = self._format_json_schema_block()
+        memories = self._format_memories_block(participants)
+        messages_history, report = self._fit_messages_block(
+            PromptType.ONLINE,
+            {'role': role, 'memories': memories, 'task': task, 'json_schema': json_schema},
+            dialog_history,
+            participants,
+            sample=False
+        )
+
+        full_prompt = (
+            f"{role}\n\n"
+            f"{memories}"
+            f"ИСТОРИЯ ТЕКУЩЕГО ДИАЛОГА:\n{messages_history}\n\n"
+            f"{task}\n\n"
+            f"{json_schema}"
+        )
+        return full_prompt, report
+
+    def create_single_reply_prompt(
+            self,
+            config: dict[str, Any],
+            participants: list[dict[str, Any]],  # Полный контекст чата все еще важен
+            message: dict[str, Any]  # Конкретное сообщение, на которое отвечаем
+    ) -> tuple[str, BudgetReport]:
+        """
+        Создает промпт для немедленного ответа на одно прямое обращение.
+        """
+        role = self._format_role_block(config)
+        participants_info = self._format_participants_block(participants, config)
+
+        # Здесь мы форматируем только ОДНО сообщение, а не историю
+        # На одно сообщение бюджет влияет только обрезкой слишком длинного текста.
+        kept, report = self.budget.fit_messages(
+            PromptType.SINGLE_REPLY, {'role': role, 'participants': participants_info}, [message],
+            render=lambda msg: msg.get('text', ''), is_priority=lambda msg: True
+        )
+        message = kept[0] if kept else message
+        author_name = self._author_name(message, {p['user_id']: p for p in participants}, unknown="Пользователь")
+        message_to_reply = f"СООБЩЕНИЕ ДЛЯ ОТВЕТА:\n[{author_name}]: {message.get('text', '')}"
+
+        task = (
+            "ТВОЯ ЗАДАЧА:\n"
+            "Ты была занята своими делами, но тебя отвлекло прямое обращение.\n"
+            "1. Прочти сообщение выше.\n"
+            "2. Напиши прямой, личный и короткий ответ этому человеку в соответствии со своей ролью.\n"
+            "3. После ответа, верни JSON с обновлениями ТОЛЬКО для этого участника."
+        )
+
+        json_schema = self._format_json_schema_block()
+
+        full_prompt = (
+            f"{role}\n\n"
+            f"{participants_info}\n\n"  # <--- Важно: она все еще помнит, кто есть кто в чате
+            f"{message_to_reply}\n\n"
+            f"{task}\n\n"
+            f"{json_schema}"
+        )
+        report.blocks.update(
+            message=estimate_tokens(message_to_reply), task=estimate_tokens(task), json_schema=estimate_tokens(json_schema)
+        )
+        logger.debug(f"Бюджет промпта: {report}")
+        return full_prompt, report
+
+    def create_final_reply_prompt(
+            self,
+            config: dict[str, Any],
+            dialog_history: list[dict[str, Any]],  # История диалога, включая "хвост"
+            participants: list[dict[str, Any]] | None = None
+    ) -> tuple[str, BudgetReport]:
+        """
+        Создает финальный промпт, который одновременно отвечает на последние
+        сообщения и вежливо завершает диалог.
+        """
+        role = self._format_role_block(config)
+
+        task = (
+            "ТВОЯ ЗАДАЧА:\n"
+            "Ты находишься в середине живого диалога, но тебе СРОЧНО нужно уходить.\n"
+            "1. Прочти последние сообщения в истории.\n"
+            "2. Напиши ОДНО ОБЩЕЕ прощальное сообщение, в котором ты:\n"
+            "   а) Сначала коротко ответишь на самые важные из последних реплик, если они есть.\n"
+            "   б) Сразу после этого вежливо попрощаешься, сказав, что тебе пора бежать по делам.\n"
+            "   Твой ответ должен быть единым, цельным сообщением.\n"
+            "3. После ответа, верни JSON с обновлениями для участников, на чьи реплики ты отреагировала."
+        )
+
+        json_schema = self._format_json_schema_block()
+        messages_history, report = self._fit_messages_block(
+            PromptType.FINAL_REPLY,
+            {'role': role, 'task': task, 'json_schema': json_schema},
+            dialog_history,
+            participants,
+            sample=False
+        )
+
+        full_prompt = (
+            f"{role}\n\n"
+            f"ИСТОРИЯ ТЕКУЩЕГО ДИАЛОГА:\n{messages_history}\n\n"
+            f"{task}\n\n"
+            f"{json_schema}"
+        )
+        return full_prompt, report
+
+
+
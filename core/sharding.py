@@ -0,0 +1,208 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import socket
+
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import Update
+
+from core.database.redis_client import RedisClient
+from core.config.parameters import SHARD_LEASE_TTL, SHARD_HEARTBEAT_INTERVAL, SHARD_VNODES, SHARD_INBOX_TTL
+
+logger = logging.getLogger(__name__)
+
+MEMBERS_KEY = "shard_members"
+
+# Выставляется, пока воркер обрабатывает апдейт, пересланный ему другим воркером.
+_forwarded: ContextVar[bool] = ContextVar("shard_forwarded", default=False)
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хеширование chat_id по воркерам.
+    У каждого воркера vnodes точек на кольце, поэтому при входе/выходе воркера
+    переезжает только ~1/N чатов, а не все.
+    """
+
+    def __init__(self, members: list[str], vnodes: int = SHARD_VNODES):
+        self.members = sorted(members)
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        for point, member in sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(vnodes)):
+            self._points.append(point)
+            self._owners.append(member)
+
+    def owner(self, chat_id: int) -> str | None:
+        """Возвращает воркера, которому принадлежит чат (None, если живых воркеров нет)."""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(chat_id))) % len(self._points)
+        return self._owners[index]
+
+
+class ShardCoordinator:
+    """
+    Распределяет чаты между процессами бота.
+    Каждый воркер держит аренду в Redis (sorted set shard_members) и продлевает ее раз в heartbeat_interval.
+    По списку живых воркеров строится HashRing; когда состав меняется, вызывается on_rebalance.
+    Апдейты чужих чатов пересылаются владельцу через его входящую очередь shard_inbox:{worker_id}
+    с TTL inbox_ttl; очередь ушедшего из кольца воркера забирается живыми и разводится по новым владельцам.
+    """
+
+    def __init__(
+            self,
+            redis_client: RedisClient,
+            worker_id: str | None = None,
+            lease_ttl: int = SHARD_LEASE_TTL,
+            heartbeat_interval: float = SHARD_HEARTBEAT_INTERVAL,
+            vnodes: int = SHARD_VNODES,
+            inbox_ttl: int = SHARD_INBOX_TTL
+    ):
+        self.redis = redis_client
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._lease_ttl = lease_ttl
+        self._heartbeat_interval = heartbeat_interval
+        self._vnodes = vnodes
+        self._inbox_ttl = inbox_ttl
+        self._dp: Dispatcher | None = None
+        self._bot: Bot | None = None
+        self.ring = HashRing([self.worker_id], vnodes)
+        self._rebalance_callbacks: list[Callable[[], Awaitable[None]]] = []
+        self._tasks: list[asyncio.Task] = []
+        logger.info(f"ShardCoordinator инициализирован, воркер {self.worker_id}.")
+
+    @property
+    def inbox(self) -> str:
+        return f"shard_inbox:{self.worker_id}"
+
+    def owner(self, chat_id: int) -> str | None:
+        return self.ring.owner(chat_id)
+
+    def owns(self, chat_id: int) -> bool:
+        """Принадлежит ли чат этому воркеру."""
+        return self.ring.owner(chat_id) == self.worker_id
+
+    def on_rebalance(self, callback: Callable[[], Awaitable[None]]):
+        """Регистрирует колбэк, который вызывается после смены состава воркеров."""
+        self._rebalance_callbacks.append(callback)
+
+    async def heartbeat(self) -> bool:
+        """Продлевает аренду и перестраивает кольцо. Возвращает True, если состав воркеров изменился."""
+        members = await self.redis.renew_shard_lease(MEMBERS_KEY, self.worker_id, self._lease_ttl)
+        if members == self.ring.members:
+            return False
+
+        logger.info(f"Состав воркеров изменился: {self.ring.members} -> {members}. Перераспределяю чаты.")
+        departed = [member for member in self.ring.members if member not in members and member != self.worker_id]
+        self.ring = HashRing(members, self._vnodes)
+        for callback in self._rebalance_callbacks:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error(f"Ошибка при перераспределении чатов: {e}", exc_info=True)
+        if self._dp is not None:
+            # Разбор может запускать обработчики, поэтому идет отдельной задачей и не задерживает продление аренды.
+            self._tasks.extend(asyncio.create_task(self._reroute_inbox(member)) for member in departed)
+        return True
+
+    async def start(self, dp: Dispatcher, bot: Bot):
+        """Встает в кольцо, включает пересылку апдейтов и запускает фоновые heartbeat и разбор inbox."""
+        self._dp, self._bot = dp, bot
+        await self.heartbeat()
+        dp.update.outer_middleware(ShardRoutingMiddleware(self))
+        self._tasks += [
+            asyncio.create_task(self._heartbeat_loop()),
+            asyncio.create_task(self._inbox_loop(dp, bot)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.redis.release_shard_lease(MEMBERS_KEY, self.worker_id)
+
+    async def forward(self, owner: str, update: Update):
+        await self.redis.forward_update(
+            f"shard_inbox:{owner}", update.model_dump(mode="json", exclude_unset=True), self._inbox_ttl
+        )
+
+    async def _reroute_inbox(self, worker_id: str):
+        """
+        Забирает входящую очередь ушедшего воркера и прогоняет апдейты через диспетчер как новые:
+        ShardRoutingMiddleware отдаст их текущим владельцам чатов (или обработает здесь).
+        """
+        try:
+            updates = await self.redis.take_updates(f"shard_inbox:{worker_id}")
+        except Exception as e:
+            logger.error(f"Не удалось забрать входящую очередь ушедшего воркера {worker_id}: {e}")
+            return
+        if updates:
+            logger.info(f"Перенаправляю {len(updates)} апдейтов из очереди ушедшего воркера {worker_id}.")
+        for update in updates:
+            try:
+                await self._dp.feed_raw_update(self._bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта из очереди воркера {worker_id}: {e}", exc_info=True)
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self._heartbeat_interval)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду воркера {self.worker_id}: {e}")
+
+    async def _inbox_loop(self, dp: Dispatcher, bot: Bot):
+        while True:
+            try:
+                update = await self.redis.receive_update(self.inbox, timeout=1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка чтения входящей очереди {self.inbox}: {e}")
+                await asyncio.sleep(1)
+                continue
+            if update is not None:
+                token = _forwarded.set(True)
+                try:
+                    await dp.feed_raw_update(bot, update)
+                except Exception as e:
+                    logger.error(f"Ошибка обработки пересланного апдейта: {e}", exc_info=True)
+                finally:
+                    _forwarded.reset(token)
+
+
+class ShardRoutingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на update: апдейты чатов, которыми владеет другой воркер, пересылаются ему.
+    Пересланный апдейт обрабатывается на месте без повторной проверки, чтобы при перебалансировке
+    он не гонялся между воркерами.
+    """
+
+    def __init__(self, coordinator: ShardCoordinator):
+        self.coordinator = coordinator
+
+    async def __call__(
+            self,
+            handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any]
+    ) -> Any:
+        chat = data.get("event_chat")
+        if chat is None or _forwarded.get() or self.coordinator.owns(chat.id):
+            return await handler(event, data)
+
+        owner = self.coordinator.owner(chat.id)
+        logger.debug(f"Апдейт чата {chat.id} переслан воркеру {owner}.")
+        await self.coordinator.forward(owner, event)
+        return None
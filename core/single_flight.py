@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import uuid
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from core.database.redis_client import RedisClient
+from core.exceptions import LeaseLostError
+from core.config.parameters import SINGLE_FLIGHT_LEASE_TTL, SINGLE_FLIGHT_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Flight:
+    task: asyncio.Task | None = None
+    started: bool = False
+    rerun: bool = False
+
+
+class SingleFlight:
+    """
+    Не дает одной и той же обработке чата идти параллельно.
+    Повторный вызов run(name, config_id, ...), пока такой же ждет своей очереди, просто присоединяется к нему;
+    пока такой же уже выполняется — заказывает ровно один повтор после него (новые сообщения не теряются).
+    Все операции одного чата (разные name) выполняются строго по одной: локально — под asyncio.Lock,
+    между процессами — под арендой в Redis, которая продлевается, пока идет обработка.
+    Если аренду все же потеряли (например, процесс завис дольше lease_ttl), обработка прерывается
+    с LeaseLostError: чат уже может обрабатывать другой процесс.
+    """
+
+    def __init__(
+            self,
+            redis_client: RedisClient,
+            lease_ttl: int = SINGLE_FLIGHT_LEASE_TTL,
+            poll_interval: float = SINGLE_FLIGHT_POLL_INTERVAL
+    ):
+        self.redis = redis_client
+        self._lease_ttl_ms = lease_ttl * 1000
+        self._poll_interval = poll_interval
+        self._flights: dict[tuple[str, int], _Flight] = {}
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._lock_users: dict[int, int] = {}
+
+    async def run(self, name: str, config_id: int, func: Callable[[int], Awaitable[None]]):
+        """Выполняет func(config_id) под защитой single-flight и ждет завершения (своего или общего запуска)."""
+        key = (name, config_id)
+        flight = self._flights.get(key)
+        if flight is not None:
+            if flight.started:
+                flight.rerun = True
+                logger.debug(f"{name} для config_id={config_id} уже выполняется, заказан повтор.")
+            else:
+                logger.debug(f"{name} для config_id={config_id} уже ждет очереди, присоединяюсь.")
+        else:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._drive(key, flight, func))
+            self._flights[key] = flight
+
+        # shield: отмена одного ожидающего не должна прерывать общий запуск.
+        await asyncio.shield(flight.task)
+
+    async def _drive(self, key: tuple[str, int], flight: _Flight, func: Callable[[int], Awaitable[None]]):
+        name, config_id = key
+        try:
+            async with self._chat_lock(config_id):
+                while True:
+                    flight.started = True
+                    flight.rerun = False
+                    await func(config_id)
+                    if not flight.rerun:
+                        # Снимаем запись до освобождения блокировки: следующий вызов начнет новый запуск.
+                        self._flights.pop(key, None)
+                        return
+                    logger.debug(f"Повторный запуск {name} для config_id={config_id}.")
+        finally:
+            if self._flights.get(key) is flight:
+                self._flights.pop(key)
+
+    def _chat_lock(self, config_id: int) -> "_ChatLock":
+        lock = self._locks.setdefault(config_id, asyncio.Lock())
+        self._lock_users[config_id] = self._lock_users.get(config_id, 0) + 1
+        return _ChatLock(self, config_id, lock)
+
+    def _drop_lock(self, config_id: int):
+        """Вызывается каждым _ChatLock при выходе; блокировку, которую больше никто не ждет, удаляем."""
+        self._lock_users[config_id] -= 1
+        if not self._lock_users[config_id]:
+            del self._lock_users[config_id]
+            del self._locks[config_id]
+
+
+class _ChatLock:
+    """Локальная блокировка чата плюс аренда single_flight:{config_id} в Redis с фоновым продлением."""
+
+    def __init__(self, owner: SingleFlight, config_id: int, lock: asyncio.Lock):
+        self.owner = owner
+        self.config_id = config_id
+        self.lock = lock
+        self.key = f"single_flight:{config_id}"
+        self.token = uuid.uuid4().hex
+        self.lost = False
+        self._holder: asyncio.Task | None = None
+        self._renew_task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        try:
+            await self.lock.acquire()
+        except BaseException:
+            self.owner._drop_lock(self.config_id)
+            raise
+        try:
+            while not await self.owner.redis.acquire_lease(self.key, self.token, self.owner._lease_ttl_ms):
+                await asyncio.sleep(self.owner._poll_interval)
+        except BaseException:
+            self.lock.release()
+            self.owner._drop_lock(self.config_id)
+            raise
+        self._holder = asyncio.current_task()
+        self._renew_task = asyncio.create_task(self._renew_loop())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._renew_task.cancel()
+        await asyncio.gather(self._renew_task, return_exceptions=True)
+        try:
+            await self.owner.redis.release_lease(self.key, self.token)
+        except Exception as e:
+            logger.error(f"Не удалось снять аренду {self.key}, она истечет по TTL: {e}")
+        finally:
+            self.lock.release()
+            self.owner._drop_lock(self.config_id)
+
+        if self.lost and exc_type is asyncio.CancelledError and not self._holder.uncancel():
+            # Обработку отменил _renew_loop, а не внешний код: отдаем вызывающим понятную ошибку.
+            raise LeaseLostError(f"Аренда {self.key} потеряна, обработка прервана.") from exc
+
+    async def _renew_loop(self):
+        interval = self.owner._lease_ttl_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.owner.redis.renew_lease(self.key, self.token, self.owner._lease_ttl_ms):
+                    logger.warning(f"Аренда {self.key} потеряна во время обработки, прерываю ее.")
+                    self.lost = True
+                    self._holder.cancel()
+                    return
+            except Exception as e:
+                logger.error(f"Не удалось продлить аренду {self.key}: {e}")
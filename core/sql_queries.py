@@ -1,123 +1,252 @@
-# core/sql_queries.py
-
-# =================================================================
-# ЭТАП 1: Запросы для настройки (Setup)
-# =================================================================
-
-UPSERT_MAMA_CONFIG = """
-INSERT INTO mama_configs (chat_id, bot_name, admin_id, timezone, personality_prompt)
-VALUES ($1, $2, $3, $4, $5)
-ON CONFLICT (chat_id) DO UPDATE SET
-    bot_name = EXCLUDED.bot_name,
-    admin_id = EXCLUDED.admin_id,
-    timezone = EXCLUDED.timezone,
-    personality_prompt = EXCLUDED.personality_prompt
-RETURNING id;
-"""
-
-SET_CHILD = """
-UPDATE mama_configs SET child_participant_id = $1 WHERE id = $2;
-"""
-
-GET_MAMA_CONFIG = """
-SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt
-FROM mama_configs
-WHERE chat_id = $1;
-"""
-
-GET_MAMA_CONFIG_BY_ID = """
-SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt
-FROM mama_configs
-WHERE id = $1;
-"""
-
-GET_ALL_MAMA_CONFIGS = """
-SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt 
-FROM mama_configs;
-"""
-
-DELETE_MAMA_CONFIG = """
-DELETE FROM mama_configs WHERE chat_id = $1;
-"""
-
-INSERT_PARTICIPANT = """
-INSERT INTO participants (config_id, user_id, custom_name, gender)
-VALUES ($1, $2, $3, $4)
-RETURNING id, custom_name;
-"""
-
-UPDATE_PERSONALITY_PROMPT = "UPDATE mama_configs SET personality_prompt = $1 WHERE id = $2;"
-
-# =================================================================
-# ЭТАП 2: Запросы для "мозга" и жизненного цикла
-# =================================================================
-
-GET_PARTICIPANT = """
-SELECT id, custom_name, gender, relationship_score, is_ignored, last_interaction_at
-FROM participants
-WHERE config_id = $1 AND user_id = $2;
-"""
-
-GET_ALL_PARTICIPANTS_BY_CONFIG_ID = """
-SELECT id, user_id, custom_name, gender, relationship_score
-FROM participants
-WHERE config_id = $1 AND is_ignored = false;
-"""
-
-GET_CHILD = """
-SELECT p.id, p.custom_name FROM participants p
-JOIN mama_configs mc ON p.id = mc.child_participant_id
-WHERE mc.id = $1;
-"""
-
-UPDATE_RELATIONSHIP_SCORE = """
-UPDATE participants
-SET 
-    relationship_score = GREATEST(0, LEAST(100, relationship_score + $1)),
-    last_interaction_at = now() at time zone 'utc'
-WHERE id = $2;
-"""
-
-SET_IGNORED_STATUS = """
-UPDATE participants
-SET 
-    is_ignored = $1,
-    relationship_score = CASE WHEN $1 THEN 0 ELSE relationship_score END
-WHERE id = $2;
-"""
-
-# --- Журнал сообщений (Message Log) ---
-INSERT_MESSAGE_LOG = """
-INSERT INTO message_log (config_id, participant_id, user_id, message_text, message_type)
-VALUES ($1, $2, $3, $4, $5)
-RETURNING created_at; 
-"""
-
-GET_MESSAGE_LOG_FOR_PROCESSING = """
-SELECT 
-    ml.user_id,
-    ml.message_text,
-    ml.message_type,
-    p.custom_name
-FROM message_log ml
-LEFT JOIN participants p ON ml.participant_id = p.id
-WHERE ml.config_id = $1 AND ml.created_at >= $2
-ORDER BY ml.created_at;
-"""
-
-DELETE_PROCESSED_MESSAGES = """
-DELETE FROM message_log WHERE config_id = $1 AND created_at < $2;
-"""
-
-INSERT_LONG_TERM_MEMORY = """
-INSERT INTO long_term_memory (participant_id, memory_summary, importance_level)
-VALUES ($1, $2, $3);
-"""
-
-GET_LONG_TERM_MEMORY = """
-SELECT memory_summary FROM long_term_memory
-WHERE participant_id = $1
-ORDER BY created_at DESC
-LIMIT $2;
-"""
-
+# core/sql_queries.py
+
+# =================================================================
+# ЭТАП 1: Запросы для настройки (Setup)
+# =================================================================
+
+UPSERT_MAMA_CONFIG = """
+INSERT INTO mama_configs (chat_id, bot_name, admin_id, timezone, personality_prompt)
+VALUES ($1, $2, $3, $4, $5)
+ON CONFLICT (chat_id) DO UPDATE SET
+    bot_name = EXCLUDED.bot_name,
+    admin_id = EXCLUDED.admin_id,
+    timezone = EXCLUDED.timezone,
+    personality_prompt = EXCLUDED.personality_prompt
+RETURNING id;
+"""
+
+SET_CHILD = """
+UPDATE mama_configs SET child_participant_id = $1 WHERE id = $2
+RETURNING chat_id;
+"""
+
+GET_MAMA_CONFIG = """
+SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt
+FROM mama_configs
+WHERE chat_id = $1;
+"""
+
+GET_MAMA_CONFIG_BY_ID = """
+SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt
+FROM mama_configs
+WHERE id = $1;
+"""
+
+GET_ALL_MAMA_CONFIGS = """
+SELECT id, chat_id, bot_name, admin_id, child_participant_id, timezone, personality_prompt 
+FROM mama_configs;
+"""
+
+DELETE_MAMA_CONFIG = """
+DELETE FROM mama_configs WHERE chat_id = $1;
+"""
+
+INSERT_PARTICIPANT = """
+INSERT INTO participants (config_id, user_id, custom_name, gender)
+VALUES ($1, $2, $3, $4)
+RETURNING id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at;
+"""
+
+UPDATE_PERSONALITY_PROMPT = "UPDATE mama_configs SET personality_prompt = $1 WHERE id = $2 RETURNING chat_id;"
+
+# =================================================================
+# ЭТАП 2: Запросы для "мозга" и жизненного цикла
+# =================================================================
+
+GET_PARTICIPANT = """
+SELECT id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at
+FROM participants
+WHERE config_id = $1 AND user_id = $2;
+"""
+
+GET_PARTICIPANTS_ROSTER = """
+SELECT id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at
+FROM participants
+WHERE config_id = $1;
+"""
+
+# Конфиг и весь ростер чата за один round trip: участники собираются в JSON-массив на стороне БД.
+GET_CONFIG_WITH_ROSTER = """
+SELECT
+    mc.id, mc.chat_id, mc.bot_name, mc.admin_id, mc.child_participant_id, mc.timezone, mc.personality_prompt,
+    COALESCE(
+        (
+            SELECT json_agg(json_build_object(
+                'id', p.id,
+                'user_id', p.user_id,
+                'custom_name', p.custom_name,
+                'gender', p.gender,
+                'relationship_score', p.relationship_score,
+                'is_ignored', p.is_ignored,
+                'last_interaction_at', p.last_interaction_at
+            ))
+            FROM participants p
+            WHERE p.config_id = mc.id
+        ),
+        '[]'
+    ) AS roster
+FROM mama_configs mc
+WHERE mc.id = $1;
+"""
+
+GET_ALL_PARTICIPANTS_BY_CONFIG_ID = """
+SELECT id, user_id, custom_name, gender, relationship_score
+FROM participants
+WHERE config_id = $1 AND is_ignored = false;
+"""
+
+GET_CHILD = """
+SELECT p.id, p.custom_name FROM participants p
+JOIN mama_configs mc ON p.id = mc.child_participant_id
+WHERE mc.id = $1;
+"""
+
+UPDATE_RELATIONSHIP_SCORE = """
+UPDATE participants
+SET 
+    relationship_score = GREATEST(0, LEAST(100, relationship_score + $1)),
+    last_interaction_at = now() at time zone 'utc'
+WHERE id = $2
+RETURNING id, config_id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at;
+"""
+
+SET_IGNORED_STATUS = """
+UPDATE participants
+SET 
+    is_ignored = $1,
+    relationship_score = CASE WHEN $1 THEN 0 ELSE relationship_score END
+WHERE id = $2
+RETURNING id, config_id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at;
+"""
+
+# --- Пакетное применение обновлений от LLM (одна транзакция на ответ) ---
+# Изменения репутации заранее суммируются по участнику: UPDATE ... FROM применяет к строке только одно совпадение.
+BULK_UPDATE_RELATIONSHIP_SCORES = """
+UPDATE participants AS p
+SET
+    relationship_score = GREATEST(0, LEAST(100, p.relationship_score + d.score_change)),
+    last_interaction_at = now() at time zone 'utc'
+FROM UNNEST($2::int[], $3::int[]) AS d(participant_id, score_change)
+WHERE p.id = d.participant_id AND p.config_id = $1
+RETURNING p.id, p.user_id, p.custom_name, p.gender, p.relationship_score, p.is_ignored, p.last_interaction_at;
+"""
+
+BULK_INSERT_LONG_TERM_MEMORY = """
+INSERT INTO long_term_memory (participant_id, memory_summary, importance_level)
+SELECT m.participant_id, m.memory_summary, m.importance_level
+FROM UNNEST($1::int[], $2::text[], $3::int[]) AS m(participant_id, memory_summary, importance_level)
+RETURNING id, participant_id, memory_summary;
+"""
+
+BULK_INSERT_PARTICIPANTS = """
+INSERT INTO participants (config_id, user_id, custom_name, gender)
+SELECT $1, n.user_id, n.custom_name, n.gender
+FROM UNNEST($2::bigint[], $3::text[], $4::text[]) AS n(user_id, custom_name, gender)
+ON CONFLICT (config_id, user_id) DO NOTHING
+RETURNING id, user_id, custom_name, gender, relationship_score, is_ignored, last_interaction_at;
+"""
+
+# --- Журнал сообщений (Message Log) ---
+INSERT_MESSAGE_LOG = """
+INSERT INTO message_log (config_id, participant_id, user_id, message_text, message_type)
+VALUES ($1, $2, $3, $4, $5)
+RETURNING created_at; 
+"""
+
+GET_MESSAGE_LOG_FOR_PROCESSING = """
+SELECT 
+    ml.user_id,
+    ml.message_text,
+    ml.message_type,
+    p.custom_name
+FROM message_log ml
+LEFT JOIN participants p ON ml.participant_id = p.id
+WHERE ml.config_id = $1 AND ml.created_at >= $2
+ORDER BY ml.created_at;
+"""
+
+DELETE_PROCESSED_MESSAGES = """
+DELETE FROM message_log WHERE config_id = $1 AND created_at < $2;
+"""
+
+INSERT_LONG_TERM_MEMORY = """
+INSERT INTO long_term_memory (participant_id, memory_summary, importance_level)
+VALUES ($1, $2, $3)
+RETURNING id, participant_id, memory_summary, (SELECT config_id FROM participants WHERE id = $1) AS config_id;
+"""
+
+# Top-k воспоминаний сразу по всем активным участникам чата: LATERAL на каждого идет по индексу
+# idx_long_term_memory_participant_rank (index-only scan: memory_summary лежит в INCLUDE)
+# и останавливается после k строк, сколько бы памяти ни накопилось.
+GET_LONG_TERM_MEMORIES_BY_CONFIG = """
+SELECT p.id AS participant_id, m.memory_summary
+FROM participants p
+CROSS JOIN LATERAL (
+    SELECT ltm.memory_summary, ltm.importance_level, ltm.created_at
+    FROM long_term_memory ltm
+    WHERE ltm.participant_id = p.id
+    ORDER BY ltm.importance_level DESC, ltm.created_at DESC
+    LIMIT $2
+) m
+WHERE p.config_id = $1 AND p.is_ignored = false
+ORDER BY p.id, m.importance_level DESC, m.created_at DESC;
+"""
+
+# Воспоминания чата, записанные после after_id, — догрузка векторного индекса памяти.
+GET_LONG_TERM_MEMORIES_SINCE = """
+SELECT ltm.id, ltm.participant_id, ltm.memory_summary
+FROM long_term_memory ltm
+JOIN participants p ON p.id = ltm.participant_id
+WHERE p.config_id = $1 AND ltm.id > $2
+ORDER BY ltm.id;
+"""
+
+# ---- Консолидация долгосрочной памяти
+# Участники чата, о которых накопилось больше $2 воспоминаний, — самые «тяжелые» первыми.
+GET_MEMORY_CONSOLIDATION_CANDIDATES = """
+SELECT ltm.participant_id
+FROM long_term_memory ltm
+JOIN participants p ON p.id = ltm.participant_id
+WHERE p.config_id = $1
+GROUP BY ltm.participant_id
+HAVING count(*) > $2
+ORDER BY count(*) DESC
+LIMIT $3;
+"""
+
+GET_MEMORIES_FOR_PARTICIPANTS = """
+SELECT id, participant_id, memory_summary, importance_level, created_at, is_merged
+FROM long_term_memory
+WHERE participant_id = ANY($1::int[])
+ORDER BY participant_id, created_at DESC, id DESC;
+"""
+
+# Переносит строки в архив одним запросом: DELETE ... RETURNING сразу вставляется в long_term_memory_archive.
+ARCHIVE_LONG_TERM_MEMORIES = """
+WITH moved AS (
+    DELETE FROM long_term_memory ltm
+    USING UNNEST($1::int[], $2::text[]) AS a(id, reason)
+    WHERE ltm.id = a.id
+    RETURNING ltm.id, ltm.participant_id, ltm.memory_summary, ltm.importance_level, ltm.created_at, ltm.is_merged,
+        a.reason
+)
+INSERT INTO long_term_memory_archive (
+    id, participant_id, memory_summary, importance_level, created_at, is_merged, reason
+)
+SELECT id, participant_id, memory_summary, importance_level, created_at, is_merged, reason FROM moved;
+"""
+
+BULK_INSERT_CONSOLIDATED_MEMORIES = """
+INSERT INTO long_term_memory (participant_id, memory_summary, importance_level, created_at, is_merged)
+SELECT m.participant_id, m.memory_summary, m.importance_level, m.created_at, true
+FROM UNNEST($1::int[], $2::text[], $3::int[], $4::timestamptz[])
+    AS m(participant_id, memory_summary, importance_level, created_at);
+"""
+
+GET_LONG_TERM_MEMORY = """
+SELECT memory_summary FROM long_term_memory
+WHERE participant_id = $1
+ORDER BY created_at DESC
+LIMIT $2;
+"""
+
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import logging
+
+from dataclasses import dataclass, field
+
+from core.database.redis_client import RedisClient
+from core.exceptions import LLMError
+from core.llm_processor import LLMProcessor
+from core.llm_scheduler import Priority
+from core.prompt_factory import PromptFactory
+from core.token_budget import PromptType
+from core.config.parameters import SUMMARY_MIN_MESSAGES, SUMMARY_CHUNK_SIZE, SUMMARY_MAX_PARALLEL, SUMMARY_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SummaryResult:
+    """Итог предобработки фоновой очереди: пересказы кусков и сообщения, которые остались дословными."""
+    summaries: list[str] = field(default_factory=list)
+    raw_messages: list[dict] = field(default_factory=list)
+    cache_hits: int = 0
+
+
+class BackgroundSummarizer:
+    """
+    Этап map перед сбором: большая фоновая очередь режется на куски по chunk_size сообщений,
+    куски пересказываются параллельно (не больше max_parallel запросов) с приоритетом вызывающего —
+    сбор ждет пересказ, поэтому передает Priority.GATHERING, — и в промпт сбора вместо сотен сообщений
+    попадают несколько коротких пересказов.
+    Пересказ кэшируется в Redis по хешу содержимого куска, поэтому повторная обработка
+    тех же сообщений (например, после сбоя до ack) не тратит вызовы LLM.
+    Небольшие очереди (меньше min_messages) и куски, которые не удалось пересказать, идут в промпт как есть.
+    """
+
+    def __init__(
+            self,
+            llm_processor: LLMProcessor,
+            redis_client: RedisClient,
+            prompt_factory: PromptFactory,
+            min_messages: int = SUMMARY_MIN_MESSAGES,
+            chunk_size: int = SUMMARY_CHUNK_SIZE,
+            max_parallel: int = SUMMARY_MAX_PARALLEL,
+            cache_ttl: int = SUMMARY_CACHE_TTL
+    ):
+        self.llm = llm_processor
+        self.redis = redis_client
+        self.prompts = prompt_factory
+        self.min_messages = min_messages
+        self.chunk_size = chunk_size
+        self.cache_ttl = cache_ttl
+        self._semaphore = asyncio.Semaphore(max_parallel)
+
+    async def summarize(
+            self,
+            config_id: int,
+            messages: list[dict],
+            participants: list[dict],
+            priority: Priority = Priority.BACKGROUND
+    ) -> SummaryResult:
+        """Пересказывает фоновые сообщения чата; порядок кусков сохраняется."""
+        if len(messages) < self.min_messages:
+            return SummaryResult(raw_messages=messages)
+
+        chunks = [messages[i:i + self.chunk_size] for i in range(0, len(messages), self.chunk_size)]
+        outcomes = await asyncio.gather(*(
+            self._summarize_chunk(config_id, chunk, participants, priority) for chunk in chunks
+        ))
+
+        result = SummaryResult()
+        for chunk, (summary, cached) in zip(chunks, outcomes):
+            if summary:
+                result.summaries.append(summary)
+                result.cache_hits += cached
+            else:
+                result.raw_messages.extend(chunk)
+        logger.info(
+            f"Фоновая очередь config_id={config_id}: {len(messages)} сообщений -> {len(result.summaries)} пересказов "
+            f"(из кэша {result.cache_hits}), дословно осталось {len(result.raw_messages)}."
+        )
+        return result
+
+    async def _summarize_chunk(
+            self, config_id: int, chunk: list[dict], participants: list[dict], priority: Priority
+    ) -> tuple[str | None, bool]:
+        prompt = self.prompts.create_summary_prompt(chunk, participants)
+        cache_key = f"summary_cache:{hashlib.blake2b(prompt.encode(), digest_size=16).hexdigest()}"
+
+        try:
+            if cached := await self.redis.get_string(cache_key):
+                return cached, True
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш пересказа {cache_key}: {e}")
+
+        async with self._semaphore:
+            try:
+                summary = await self.llm.execute_text(prompt, priority, config_id, PromptType.SUMMARY)
+            except LLMError as e:
+                logger.warning(f"Кусок фоновой переписки config_id={config_id} не пересказан, беру как есть: {e}")
+                return None, False
+
+        if summary:
+            try:
+                await self.redis.set_string(cache_key, summary, ttl_seconds=self.cache_ttl)
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить кэш пересказа {cache_key}: {e}")
+        return summary or None, False
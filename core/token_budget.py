@@ -0,0 +1,161 @@
+import logging
+
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Callable
+
+from core.config.parameters import (
+    PROMPT_BUDGET_GATHERING, PROMPT_BUDGET_ONLINE, PROMPT_BUDGET_SINGLE_REPLY, PROMPT_BUDGET_FINAL_REPLY,
+    PROMPT_MAX_MESSAGE_TOKENS
+)
+
+logger = logging.getLogger(__name__)
+
+# Доля бюджета фоновых сообщений, которая отдается самым свежим; остальное — равномерной выборке из старых.
+RECENT_SHARE = 0.6
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Быстрая офлайн-оценка числа токенов без токенизатора.
+    Латиница, цифры и пунктуация — ~4 символа на токен, кириллица и прочее — ~2.5.
+    """
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return int(ascii_chars / 4 + (len(text) - ascii_chars) / 2.5) + 1
+
+
+class PromptType(str, Enum):
+    """Тип промпта — у каждого свой бюджет токенов и свой маршрут к модели."""
+    GATHERING = "gathering"
+    ONLINE = "online"
+    SINGLE_REPLY = "single_reply"
+    FINAL_REPLY = "final_reply"
+    SUMMARY = "summary"
+
+
+DEFAULT_BUDGETS = {
+    PromptType.GATHERING: PROMPT_BUDGET_GATHERING,
+    PromptType.ONLINE: PROMPT_BUDGET_ONLINE,
+    PromptType.SINGLE_REPLY: PROMPT_BUDGET_SINGLE_REPLY,
+    PromptType.FINAL_REPLY: PROMPT_BUDGET_FINAL_REPLY,
+}
+
+
+@dataclass
+class BudgetReport:
+    """Сколько токенов (по оценке) занял каждый блок промпта и сколько сообщений пришлось отбросить."""
+    prompt_type: PromptType
+    budget: int
+    blocks: dict[str, int] = field(default_factory=dict)
+    messages_total: int = 0
+    messages_kept: int = 0
+    messages_truncated: int = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.blocks.values())
+
+    def __str__(self) -> str:
+        blocks = ", ".join(f"{name}={tokens}" for name, tokens in self.blocks.items())
+        return (
+            f"{self.prompt_type.value}: {self.total}/{self.budget} токенов ({blocks}); "
+            f"сообщений {self.messages_kept}/{self.messages_total}, обрезано {self.messages_truncated}"
+        )
+
+
+class TokenBudget:
+    """
+    Детерминированно укладывает историю сообщений в бюджет промпта.
+    Важные сообщения (ребенка и прямые обращения) сохраняются целиком, начиная с самых свежих.
+    Фоновые заполняют остаток: сначала самые свежие, затем равномерная выборка из более старых.
+    Слишком длинные сообщения обрезаются до max_message_tokens.
+    """
+
+    def __init__(
+            self,
+            budgets: dict[PromptType, int] | None = None,
+            max_message_tokens: int = PROMPT_MAX_MESSAGE_TOKENS
+    ):
+        self.budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self.max_message_tokens = max_message_tokens
+
+    def fit_messages(
+            self,
+            prompt_type: PromptType,
+            fixed_blocks: dict[str, str],
+            messages: list[dict],
+            render: Callable[[dict], str],
+            is_priority: Callable[[dict], bool] = lambda msg: False,
+            sample: bool = True
+    ) -> tuple[list[dict], BudgetReport]:
+        """
+        Отбирает сообщения, которые помещаются в бюджет prompt_type за вычетом fixed_blocks.
+        render — как сообщение будет выглядеть в промпте (по нему считается стоимость).
+        sample=False отключает выборку из старых: для живого диалога важен только свежий хвост.
+        Возвращает отобранные сообщения в исходном порядке и заготовку отчета (без блока сообщений).
+        """
+        budget = self.budgets[prompt_type]
+        report = BudgetReport(
+            prompt_type=prompt_type,
+            budget=budget,
+            blocks={name: estimate_tokens(text) for name, text in fixed_blocks.items()},
+            messages_total=len(messages)
+        )
+
+        messages = [self._truncate(msg, render, report) for msg in messages]
+        costs = [estimate_tokens(render(msg)) + 1 for msg in messages]
+        available = max(budget - report.total, 0)
+
+        keep: set[int] = set()
+        used = 0
+        for index in reversed(range(len(messages))):
+            if is_priority(messages[index]):
+                if used + costs[index] > available:
+                    break
+                keep.add(index)
+                used += costs[index]
+
+        background = [i for i in range(len(messages)) if not is_priority(messages[i])]
+        left = available - used
+        if sum(costs[i] for i in background) <= left:
+            keep.update(background)
+        else:
+            recent_budget = left * RECENT_SHARE if sample else left
+            start = len(background)
+            while start > 0 and costs[background[start - 1]] <= recent_budget:
+                start -= 1
+                recent_budget -= costs[background[start]]
+                left -= costs[background[start]]
+                keep.add(background[start])
+            if sample:
+                keep.update(self._sample(background[:start], costs, left))
+
+        kept = [msg for index, msg in enumerate(messages) if index in keep]
+        report.messages_kept = len(kept)
+        return kept, report
+
+    def _truncate(self, message: dict, render: Callable[[dict], str], report: BudgetReport) -> dict:
+        text_key = 'content' if message.get('role') == 'model' else 'text'
+        text = message.get(text_key) or ''
+        tokens = estimate_tokens(text)
+        if tokens <= self.max_message_tokens:
+            return message
+        report.messages_truncated += 1
+        return {**message, text_key: text[:len(text) * self.max_message_tokens // tokens].rstrip() + '…'}
+
+    @staticmethod
+    def _sample(indices: list[int], costs: list[int], left: float) -> list[int]:
+        """Равномерно (с постоянным шагом) выбирает из indices столько, сколько влезает в left."""
+        if not indices or left <= 0:
+            return []
+        average = sum(costs[i] for i in indices) / len(indices)
+        stride = max(len(indices) / max(left // average, 1), 1)
+        picked = []
+        position = 0.0
+        while int(position) < len(indices):
+            index = indices[int(position)]
+            if costs[index] <= left:
+                picked.append(index)
+                left -= costs[index]
+            position += stride
+        return picked
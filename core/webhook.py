@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import multiprocessing
+
+from typing import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+def create_webhook_app(dp: Dispatcher, bot: Bot, path: str, secret_token: str) -> web.Application:
+    """
+    Создает aiohttp-приложение, принимающее апдейты Telegram на path.
+    Запросы с неверным X-Telegram-Bot-Api-Secret-Token отклоняются (401),
+    остальные сразу получают 200, а апдейт обрабатывается Dispatcher'ом в фоне.
+    Без secret_token публичный адрес принимал бы поддельные апдейты, поэтому он обязателен.
+    """
+    if not secret_token:
+        raise ValueError("Вебхук без secret_token не запускается.")
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token,
+        handle_in_background=True
+    ).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def serve_webhook(
+        dp: Dispatcher,
+        bot: Bot,
+        host: str,
+        port: int,
+        path: str,
+        secret_token: str,
+        base_url: str | None = None
+):
+    """
+    Поднимает HTTP-сервер вебхука и работает до отмены.
+    Порт открывается с SO_REUSEPORT, поэтому несколько процессов могут слушать его одновременно —
+    ядро само раскидывает соединения между ними.
+    Если передан base_url, вебхук регистрируется в Telegram (это делает только один воркер).
+    Апдейты, накопившиеся за время рестарта, не сбрасываются.
+    """
+    app = create_webhook_app(dp, bot, path, secret_token)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port, reuse_port=True)
+    await site.start()
+    logger.info(f"Вебхук слушает {host}:{port}{path}.")
+
+    if base_url:
+        await bot.set_webhook(
+            url=f"{base_url.rstrip('/')}{path}",
+            secret_token=secret_token,
+            allowed_updates=dp.resolve_used_update_types(),
+            drop_pending_updates=False
+        )
+        logger.info(f"Вебхук зарегистрирован в Telegram: {base_url}{path}.")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_worker_processes(target: Callable[[int], None], workers: int):
+    """
+    Запускает target(worker_id) в workers отдельных процессах и ждет их завершения.
+    При workers == 1 target выполняется в текущем процессе.
+    """
+    if workers <= 1:
+        target(0)
+        return
+
+    processes = [
+        multiprocessing.Process(target=target, args=(worker_id,), name=f"webhook-worker-{worker_id}")
+        for worker_id in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Запущено {workers} воркеров вебхука.")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
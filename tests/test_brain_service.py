@@ -0,0 +1,46 @@
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from core.brain_service import BrainService
+from core.database.postgres_client import ActionBatchResult
+from core.prompt_factory import PromptFactory
+
+
+# ---- Фикстуры
+@pytest.fixture
+def db() -> MagicMock:
+    db = MagicMock()
+    db.apply_llm_actions = AsyncMock(return_value=ActionBatchResult(scores_updated=2, memories_added=3))
+    return db
+
+
+@pytest.fixture
+def brain(db) -> BrainService:
+    return BrainService(MagicMock(), db, PromptFactory(), MagicMock(), MagicMock(), streaming=False)
+
+
+# ---- Тесты
+async def test_db_actions_are_applied_as_one_batch(brain, db):
+    participants_map = {111: {'id': 1}, 222: {'id': 2}}
+    updates = [
+        {'user_id': 111, 'relationship_change': 3, 'new_memory': "Помыл посуду"},
+        {'user_id': 111, 'relationship_change': -1, 'new_memory': "Нагрубил"},
+        {'user_id': 222, 'relationship_change': 2, 'new_memory': "Сделал уроки"},
+        {'user_id': 999, 'relationship_change': 5},
+    ]
+    new_participants = [
+        {'user_id': 333, 'suggested_name': "Аня", 'suggested_gender': "female"},
+        {'user_id': 333, 'suggested_name': "Аня"},
+        {'user_id': 111, 'suggested_name': "Леша"},
+    ]
+
+    result = await brain._execute_db_actions(updates, new_participants, 7, participants_map)
+
+    db.apply_llm_actions.assert_awaited_once_with(
+        7,
+        {1: 2, 2: 2},
+        [(1, "Помыл посуду", 1), (1, "Нагрубил", 1), (2, "Сделал уроки", 1)],
+        [(333, "Аня", "female")]
+    )
+    assert result.skipped == 3
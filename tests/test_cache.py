@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from tests.test_operator import redis_client, test_config
+from core.cache import ConfigCache, RosterCache
+from core.database.postgres_client import AsyncPostgresManager
+import core.sql_queries as queries
+
+
+# ---- Фикстуры
+@pytest.fixture
+def config_loader(test_config) -> AsyncMock:
+    """Мок AsyncPostgresManager.get_mama_config."""
+    return AsyncMock(return_value=test_config)
+
+
+@pytest.fixture
+def roster_rows() -> list[dict]:
+    """Строки participants так, как их отдает GET_PARTICIPANTS_ROSTER."""
+    return [
+        {"id": 10, "user_id": 111, "custom_name": "Леша", "gender": "male",
+         "relationship_score": 75, "is_ignored": False, "last_interaction_at": None},
+        {"id": 11, "user_id": 222, "custom_name": "Петя", "gender": "male",
+         "relationship_score": 50, "is_ignored": True, "last_interaction_at": None},
+    ]
+
+
+@pytest.fixture
+def cached_db(mocker, roster_rows, test_config) -> AsyncPostgresManager:
+    """AsyncPostgresManager с RosterCache и замоканным _execute вместо PostgreSQL."""
+    manager = AsyncPostgresManager(pool=MagicMock(), roster_cache=RosterCache())
+
+    async def fake_execute(query, params=(), mode='execute', timeout=None):
+        if query == queries.GET_PARTICIPANTS_ROSTER:
+            return [dict(row) for row in roster_rows]
+        if query == queries.GET_PARTICIPANT:
+            return None
+        if query == queries.GET_CONFIG_WITH_ROSTER:
+            return {**test_config, "roster": json.dumps(roster_rows)}
+        if query == queries.GET_MAMA_CONFIG_BY_ID:
+            return dict(test_config)
+        if query == queries.UPDATE_RELATIONSHIP_SCORE:
+            return {**roster_rows[0], "config_id": 1, "relationship_score": 80}
+        if query == queries.INSERT_PARTICIPANT:
+            return {"id": 12, "user_id": params[1], "custom_name": params[2], "gender": params[3],
+                    "relationship_score": 50, "is_ignored": False, "last_interaction_at": None}
+        raise AssertionError(f"Неожиданный запрос: {query}")
+
+    mocker.patch.object(manager, '_execute', AsyncMock(side_effect=fake_execute))
+    return manager
+
+
+# ---- Тесты ConfigCache
+async def test_config_cache_loads_once(redis_client, config_loader, test_config):
+    cache = ConfigCache(redis_client)
+    chat_id = test_config['chat_id']
+
+    assert await cache.get(chat_id, loader=config_loader) == test_config
+    assert await cache.get(chat_id, loader=config_loader) == test_config
+
+    config_loader.assert_awaited_once_with(chat_id)
+    assert await redis_client.get_json(f"config_data:{chat_id}") == test_config
+
+
+async def test_config_cache_caches_missing_config(redis_client):
+    cache = ConfigCache(redis_client)
+    loader = AsyncMock(return_value=None)
+
+    assert await cache.get(42, loader=loader) is None
+    assert await cache.get(42, loader=loader) is None
+
+    loader.assert_awaited_once_with(42)
+    assert await redis_client.get_json("config_data:42") is None
+
+
+async def test_config_cache_invalidate_drops_both_tiers(redis_client, config_loader, test_config):
+    cache = ConfigCache(redis_client)
+    chat_id = test_config['chat_id']
+    await cache.get(chat_id, loader=config_loader)
+
+    await cache.invalidate(chat_id)
+
+    assert await redis_client.get_json(f"config_data:{chat_id}") is None
+    await cache.get(chat_id, loader=config_loader)
+    assert config_loader.await_count == 2
+
+
+async def test_config_cache_invalidation_reaches_other_workers(redis_client, config_loader, test_config):
+    """Инвалидация, опубликованная одним воркером, сбрасывает локальный кэш другого."""
+    chat_id = test_config['chat_id']
+    worker_a = ConfigCache(redis_client)
+    worker_b = ConfigCache(redis_client)
+    await worker_b.start()
+    try:
+        await worker_b.get(chat_id, loader=config_loader)
+        await asyncio.sleep(0.05)
+
+        await worker_a.invalidate(chat_id)
+        for _ in range(50):
+            if chat_id not in worker_b._local:
+                break
+            await asyncio.sleep(0.01)
+
+        assert chat_id not in worker_b._local
+    finally:
+        await worker_b.stop()
+
+
+async def test_config_cache_skips_stale_load(redis_client, test_config):
+    """Если конфиг изменили во время загрузки, устаревший результат не попадает в локальный кэш."""
+    cache = ConfigCache(redis_client)
+    chat_id = test_config['chat_id']
+
+    async def racing_loader(_chat_id):
+        await cache.invalidate(chat_id)
+        return test_config
+
+    assert await cache.get(chat_id, loader=racing_loader) == test_config
+    assert chat_id not in cache._local
+
+
+# ---- Тесты RosterCache
+async def test_roster_loaded_once_for_concurrent_lookups(cached_db):
+    results = await asyncio.gather(*(cached_db.get_participant(1, 111) for _ in range(20)))
+
+    assert all(p['custom_name'] == "Леша" for p in results)
+    assert cached_db._execute.await_count == 1
+
+
+async def test_roster_serves_all_participants_without_ignored(cached_db):
+    await cached_db.get_participant(1, 111)
+    participants = await cached_db.get_all_participants_by_config_id(1)
+
+    assert [p['user_id'] for p in participants] == [111]
+    assert cached_db._execute.await_count == 1
+
+
+async def test_roster_caches_negative_lookup(cached_db):
+    assert await cached_db.get_participant(1, 999) is None
+    assert await cached_db.get_participant(1, 999) is None
+
+    queried = [call.args[0] for call in cached_db._execute.await_args_list]
+    assert queried.count(queries.GET_PARTICIPANT) == 1
+
+
+async def test_roster_write_through(cached_db):
+    await cached_db.get_participant(1, 111)
+    assert await cached_db.get_participant(1, 333) is None
+
+    await cached_db.update_relationship_score(10, 5)
+    await cached_db.add_participant(config_id=1, user_id=333, custom_name="Аня", gender="female")
+
+    assert (await cached_db.get_participant(1, 111))['relationship_score'] == 80
+    assert (await cached_db.get_participant(1, 333))['custom_name'] == "Аня"
+    queried = [call.args[0] for call in cached_db._execute.await_args_list]
+    assert queried.count(queries.GET_PARTICIPANTS_ROSTER) == 1
+
+
+async def test_config_with_roster_primes_cache(cached_db, test_config):
+    config, participants = await cached_db.get_config_with_participants(1)
+    assert config == test_config
+    assert [p['user_id'] for p in participants] == [111]
+
+    config, participants = await cached_db.get_config_with_participants(1)
+    assert (await cached_db.get_participant(1, 222))['is_ignored'] is True
+
+    queried = [call.args[0] for call in cached_db._execute.await_args_list]
+    assert queried == [queries.GET_CONFIG_WITH_ROSTER, queries.GET_MAMA_CONFIG_BY_ID]
+    assert config == test_config and len(participants) == 1
+
+
+async def test_roster_returns_copies(cached_db):
+    participant = await cached_db.get_participant(1, 111)
+    participant['custom_name'] = "Испорчено"
+
+    assert (await cached_db.get_participant(1, 111))['custom_name'] == "Леша"
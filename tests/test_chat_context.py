@@ -0,0 +1,110 @@
+import pytest
+
+from dataclasses import FrozenInstanceError
+from unittest.mock import AsyncMock, MagicMock
+
+from tests.test_operator import redis_client, stream_redis_client, test_config
+from core.chat_context import ChatContextLoader
+from core.exceptions import DatabaseQueryError
+
+
+# ---- Фикстуры
+@pytest.fixture
+def participants() -> list[dict]:
+    return [
+        {"id": 10, "user_id": 111, "custom_name": "Леша", "gender": "male", "relationship_score": 75},
+        {"id": 11, "user_id": 222, "custom_name": "Аня", "gender": "female", "relationship_score": 60},
+    ]
+
+
+@pytest.fixture
+def db(test_config, participants) -> MagicMock:
+    db = MagicMock()
+    db.get_config_with_participants = AsyncMock(return_value=(test_config, participants))
+    db.get_long_term_memories = AsyncMock(return_value={10: ["Любит котов"]})
+    return db
+
+
+# ---- Тесты
+async def test_loader_claims_queues_and_reads_memory(redis_client, db, test_config):
+    await redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Мам!"})
+    await redis_client.enqueue("background_queue:1", {"user_id": 222, "text": "Привет"})
+    await redis_client.set_json("short_term_memory:1", [{"role": "model", "content": "Я тут"}])
+
+    context = await ChatContextLoader(db, redis_client).load(
+        1, ["direct_queue:1", "background_queue:1", "online_batch_queue:1"], "short_term_memory:1"
+    )
+
+    assert context.config_id == 1
+    assert context.child["user_id"] == 111
+    assert set(context.participants_map) == {111, 222}
+    assert context.batch("direct_queue:1").items == [{"user_id": 111, "text": "Мам!"}]
+    assert context.batch("background_queue:1").items == [{"user_id": 222, "text": "Привет"}]
+    assert context.batch("online_batch_queue:1").items == []
+    assert context.dialog_history == ({"role": "model", "content": "Я тут"},)
+    assert await redis_client.get_queue_size("direct_queue:1") == 0
+    db.get_config_with_participants.assert_awaited_once_with(1)
+    db.get_long_term_memories.assert_not_awaited()
+
+
+async def test_loader_attaches_long_term_memories(redis_client, db, participants):
+    context = await ChatContextLoader(db, redis_client, memories_per_participant=5).load(
+        1, ["direct_queue:1"], with_memories=True
+    )
+
+    assert [p["memories"] for p in context.participants] == [["Любит котов"], []]
+    assert "memories" not in participants[0]
+    db.get_long_term_memories.assert_awaited_once_with(1, 5)
+
+
+async def test_context_is_immutable(redis_client, db):
+    context = await ChatContextLoader(db, redis_client).load(1, ["direct_queue:1"])
+
+    with pytest.raises(FrozenInstanceError):
+        context.config = {}
+    with pytest.raises(TypeError):
+        context.config["bot_name"] = "Папа"
+    assert context.dialog_history == ()
+
+
+async def test_missing_config_returns_messages_to_queue(redis_client, db):
+    db.get_config_with_participants.return_value = (None, [])
+    await redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Раз"})
+    await redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Два"})
+
+    assert await ChatContextLoader(db, redis_client).load(1, ["direct_queue:1"]) is None
+
+    assert await redis_client.get_and_clear_batch("direct_queue:1") == [
+        {"user_id": 111, "text": "Раз"}, {"user_id": 111, "text": "Два"}
+    ]
+
+
+async def test_db_error_returns_messages_to_queue(redis_client, db):
+    db.get_config_with_participants.side_effect = DatabaseQueryError("БД недоступна")
+    await redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Мам!"})
+
+    with pytest.raises(DatabaseQueryError):
+        await ChatContextLoader(db, redis_client).load(1, ["direct_queue:1"])
+
+    assert await redis_client.get_and_clear_batch("direct_queue:1") == [{"user_id": 111, "text": "Мам!"}]
+
+
+async def test_memory_error_returns_messages_to_queue(redis_client, db):
+    db.get_long_term_memories.side_effect = DatabaseQueryError("БД недоступна")
+    await redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Мам!"})
+
+    with pytest.raises(DatabaseQueryError):
+        await ChatContextLoader(db, redis_client).load(1, ["direct_queue:1"], with_memories=True)
+
+    assert await redis_client.get_queue_size("direct_queue:1") == 1
+
+
+async def test_loader_with_streams_keeps_entries_until_ack(stream_redis_client, db):
+    await stream_redis_client.enqueue("direct_queue:1", {"user_id": 111, "text": "Мам!"})
+
+    context = await ChatContextLoader(db, stream_redis_client).load(1, ["direct_queue:1"], "short_term_memory:1")
+    batch = context.batch("direct_queue:1")
+
+    assert batch.items == [{"user_id": 111, "text": "Мам!"}]
+    assert len(batch.ids) == 1
+    assert context.dialog_history == ()
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from tests.test_operator import redis_client, test_config
+
+from core.brain_service import BrainService
+from core.circuit_breaker import CircuitBreaker, CircuitState
+from core.exceptions import CircuitOpenError, LLMError
+from core.llm_processor import LLMProcessor
+from core.prompt_factory import CANNED_REPLIES, PromptFactory
+
+
+# ---- Фикстуры
+@pytest.fixture
+def dead_llm_manager() -> MagicMock:
+    """LLMManager, у которого Gemini не отвечает."""
+    manager = MagicMock()
+    manager.router.select.return_value.model = "gemini-test"
+    manager.get_raw_response = AsyncMock(side_effect=LLMError("таймаут"))
+    return manager
+
+
+@pytest.fixture
+def brain(redis_client, dead_llm_manager, test_config) -> BrainService:
+    processor = LLMProcessor(dead_llm_manager)
+    processor.breakers["gemini-test"] = CircuitBreaker("LLM gemini-test", failure_threshold=1)
+    processor.breakers["gemini-test"].record_failure()
+
+    db = MagicMock()
+    db.get_config_with_participants = AsyncMock(return_value=(test_config, []))
+    db.get_all_participants_by_config_id = AsyncMock(return_value=[])
+    db.get_long_term_memories = AsyncMock(return_value={})
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    return BrainService(redis_client, db, PromptFactory(), processor, bot, streaming=False)
+
+
+# ---- Тесты
+async def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=0.05)
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow()
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow()  # пробный вызов
+    assert not breaker.allow()  # второй ждет исхода пробного
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+
+    await asyncio.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state is CircuitState.CLOSED
+
+
+async def test_processor_fails_fast_while_open(dead_llm_manager):
+    processor = LLMProcessor(dead_llm_manager)
+
+    for _ in range(5):
+        with pytest.raises(LLMError):
+            await processor.execute_and_parse("Промпт")
+    with pytest.raises(CircuitOpenError):
+        await processor.execute_and_parse("Промпт")
+
+    assert dead_llm_manager.get_raw_response.await_count == 5
+
+
+async def test_gathering_is_deferred_and_messages_kept(brain, redis_client, test_config):
+    messages = [{"user_id": 222, "text": f"сообщение {i}", "timestamp": i} for i in range(3)]
+    for message in messages:
+        await redis_client.enqueue(f"background_queue:{test_config['id']}", message)
+
+    await brain.process_gathering_queues(test_config['id'], "morning")
+
+    brain.bot.send_message.assert_not_called()
+    assert await redis_client.get_and_clear_batch(f"background_queue:{test_config['id']}") == messages
+
+
+async def test_passive_reply_falls_back_to_canned(brain, test_config):
+    await brain.process_single_message_immediately({"user_id": 222, "text": "Мама, ты тут?"}, test_config)
+
+    chat_id, text = brain.bot.send_message.await_args.args
+    assert chat_id == test_config['chat_id']
+    assert text in CANNED_REPLIES['reply']
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from core.database.codecs import PayloadCodec, CodecFormat, MAGIC
+from core.exceptions import CodecError
+from tests.test_operator import redis_client
+
+
+# ---- Фикстуры
+@pytest.fixture
+def chat_payload() -> dict:
+    """Сообщение чата в том виде, в каком его кладет в очередь Operator."""
+    return {
+        "participant_id": 11,
+        "user_id": 555666777,
+        "text": "Мам, а можно я сегодня задержусь у Пети? Мы готовимся к контрольной по физике.",
+        "timestamp": 1717000000.0,
+        "is_direct": True,
+        "is_reply": False,
+    }
+
+
+# ---- Тесты
+@pytest.mark.parametrize("fmt", [CodecFormat.LEGACY_JSON, CodecFormat.JSON, CodecFormat.MSGPACK])
+def test_codec_roundtrip(fmt, chat_payload):
+    codec = PayloadCodec(fmt)
+    assert codec.decode(codec.encode(chat_payload)) == chat_payload
+
+
+def test_codec_keeps_cyrillic_unescaped(chat_payload):
+    encoded = PayloadCodec(CodecFormat.JSON).encode(chat_payload)
+
+    assert "Мам".encode() in encoded
+    assert len(encoded) < len(json.dumps(chat_payload))
+
+
+def test_codec_reads_legacy_json_and_other_formats(chat_payload):
+    """Любой кодек читает старый JSON и значения, записанные в другом формате (rolling migration)."""
+    reader = PayloadCodec(CodecFormat.JSON)
+
+    assert reader.decode(json.dumps(chat_payload)) == chat_payload
+    assert reader.decode(PayloadCodec(CodecFormat.MSGPACK).encode(chat_payload)) == chat_payload
+
+
+def test_codec_compresses_large_values(chat_payload):
+    codec = PayloadCodec(CodecFormat.MSGPACK, compress_min_bytes=1024)
+    memory = [chat_payload] * 30
+
+    small, large = codec.encode(chat_payload), codec.encode(memory)
+
+    assert small[1] & 0x80 == 0
+    assert large[1] & 0x80
+    assert len(large) < len(PayloadCodec(CodecFormat.MSGPACK).encode(memory))
+    assert codec.decode(large) == memory
+
+
+def test_codec_rejects_unknown_format():
+    with pytest.raises(CodecError):
+        PayloadCodec().decode(MAGIC + b"\x7f{}")
+
+
+async def test_redis_client_stores_tagged_bytes(redis_client, chat_payload):
+    await redis_client.set_json("short_term_memory:1", [chat_payload])
+    await redis_client.enqueue("direct_queue:1", chat_payload)
+
+    assert (await redis_client._client.get("short_term_memory:1")).startswith(MAGIC)
+    assert await redis_client.get_json("short_term_memory:1") == [chat_payload]
+    assert await redis_client.get_and_clear_batch("direct_queue:1") == [chat_payload]
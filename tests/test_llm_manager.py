@@ -1,57 +1,149 @@
-import pytest
-from unittest.mock import MagicMock, AsyncMock
-
-from pygments.lexer import default
-
-from core.llm_manager import LLMManager
-from core.exceptions import LLMError
-
-# ---- Фикстуры
-@pytest.fixture
-def llm_manager() -> LLMManager:
-    """Создает инстанс LLMManager с фейковым API-ключом для тестов."""
-    return LLMManager(api_key='fake-api-key')
-
-
-@pytest.fixture
-def mock_genai_client(mocker) -> MagicMock:
-    """
-    Мокает клиент google-genai, чтобы избежать реальных API-вызовов.
-    Возвращает сам мок клиента для дальнейшей настройки в тестах.
-    """
-    mock_client = mocker.patch('core.llm_manager.genai.Client')
-    return mock_client
-
-# ---- Тесты
-
-@pytest.mark.asyncio
-async def test_get_raw_response_success(llm_manager: LLMManager, mocker: MagicMock):
-    expected_text = "Это тестовый ответ от LLM."
-    mock_response = MagicMock()
-    mock_response.text = expected_text
-
-    mock_to_thread = mocker.patch('core.llm_manager.to_thread', new_callable=AsyncMock)
-    mock_to_thread.return_value = mock_response
-
-    result = await llm_manager.get_raw_response("Тест промпт.")
-    assert result == expected_text
-    mock_to_thread.assert_called_once()
-
-@pytest.mark.asyncio
-async def test_get_raw_response_raises_error_on_empty_text(llm_manager: LLMManager, mocker: MagicMock):
-    mock_response = MagicMock()
-    mock_response.text = None
-    mock_to_thread = mocker.patch('core.llm_manager.to_thread', new_callable=AsyncMock)
-    mock_to_thread.return_value = mock_response
-
-    with pytest.raises(LLMError, match="Модель не вернула текстовый ответ."):
-        await llm_manager.get_raw_response("Тестовый промпт")
-
-@pytest.mark.asyncio
-async def test_get_raw_response_handles_api_exception(llm_manager: LLMManager, mocker: MagicMock):
-    error_message = "Ошибка выполнения в потоке"
-    mock_to_thread = mocker.patch('core.llm_manager.to_thread', new_callable=AsyncMock)
-    mock_to_thread.side_effect = Exception(error_message)
-
-    with pytest.raises(LLMError, match="Не удалось получить ответ от нейросети."):
-        await llm_manager.get_raw_response("Тестовый промпт")
\ No newline at end of file
+import asyncio
+import threading
+
+import httpx
+import pytest
+import pytest_asyncio
+from collections import deque
+from unittest.mock import MagicMock, AsyncMock
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from google.genai import errors
+
+from core.llm_manager import LLMManager
+from core.exceptions import LLMError
+from core.token_budget import PromptType
+
+# ---- Фикстуры
+@pytest.fixture
+def llm_manager() -> LLMManager:
+    """Создает инстанс LLMManager с фейковым API-ключом для тестов."""
+    return LLMManager(api_key='fake-api-key')
+
+
+@pytest.fixture
+def mock_generate_content(llm_manager: LLMManager, mocker) -> AsyncMock:
+    """Мокает асинхронный вызов google-genai, чтобы избежать реальных API-вызовов."""
+    return mocker.patch.object(llm_manager._client.aio.models, 'generate_content', new_callable=AsyncMock)
+
+
+@pytest_asyncio.fixture
+async def fake_gemini_server():
+    """Локальный HTTP-сервер, отвечающий как generateContent Gemini API (с задержкой на 'генерацию')."""
+    state = {"in_flight": 0, "max_in_flight": 0}
+
+    async def generate_content(request: web.Request) -> web.Response:
+        state["in_flight"] += 1
+        state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+        await asyncio.sleep(0.05)
+        state["in_flight"] -= 1
+        return web.json_response({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "Доброе утро!"}]}, "finishReason": "STOP"}]
+        })
+
+    app = web.Application()
+    app.router.add_post('/{path:.*}', generate_content)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, state
+    await server.close()
+
+# ---- Тесты
+
+@pytest.mark.asyncio
+async def test_get_raw_response_success(llm_manager: LLMManager, mock_generate_content: AsyncMock):
+    expected_text = "Это тестовый ответ от LLM."
+    mock_response = MagicMock()
+    mock_response.text = expected_text
+    mock_generate_content.return_value = mock_response
+
+    result = await llm_manager.get_raw_response("Тест промпт.")
+    assert result == expected_text
+    mock_generate_content.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_get_raw_response_raises_error_on_empty_text(llm_manager: LLMManager, mock_generate_content: AsyncMock):
+    mock_response = MagicMock()
+    mock_response.text = None
+    mock_generate_content.return_value = mock_response
+
+    with pytest.raises(LLMError, match="Модель не вернула текстовый ответ."):
+        await llm_manager.get_raw_response("Тестовый промпт")
+
+@pytest.mark.asyncio
+async def test_get_raw_response_handles_api_exception(llm_manager: LLMManager, mock_generate_content: AsyncMock):
+    mock_generate_content.side_effect = Exception("Ошибка API")
+
+    with pytest.raises(LLMError, match="Не удалось получить ответ от нейросети."):
+        await llm_manager.get_raw_response("Тестовый промпт")
+
+    assert llm_manager.stats.in_flight == 0
+
+
+async def test_thousand_concurrent_prompts_use_no_threads(fake_gemini_server):
+    server, state = fake_gemini_server
+    llm_manager = LLMManager(api_key='fake-api-key', max_in_flight=50, base_url=str(server.make_url('/')))
+    threads_before = threading.active_count()
+
+    results = await asyncio.gather(*(llm_manager.get_raw_response(f"Промпт {i}") for i in range(1000)))
+
+    assert results == ["Доброе утро!"] * 1000
+    assert threading.active_count() == threads_before
+    assert state["max_in_flight"] <= 50
+    stats = llm_manager.stats
+    assert stats.calls == 1000
+    assert stats.in_flight == 0 and stats.waiting == 0
+    assert stats.max_queue_wait > 0
+    await llm_manager.close()
+
+
+async def test_stream_raw_response_yields_chunks(llm_manager: LLMManager, mocker):
+    async def stream():
+        for text in ["Добр", "ое ", None, "утро!"]:
+            chunk = MagicMock()
+            chunk.text = text
+            yield chunk
+
+    mocker.patch.object(
+        llm_manager._client.aio.models, 'generate_content_stream', new_callable=AsyncMock, return_value=stream()
+    )
+
+    chunks = [chunk async for chunk in llm_manager.stream_raw_response("Тест промпт.")]
+
+    assert chunks == ["Добр", "ое ", "утро!"]
+    assert llm_manager.stats.in_flight == 0
+
+
+async def test_transient_errors_are_retried(llm_manager: LLMManager, mock_generate_content: AsyncMock, mocker):
+    mocker.patch("core.llm_manager.random.uniform", return_value=0)
+    mock_generate_content.side_effect = [
+        httpx.ConnectError("обрыв"),
+        errors.ServerError(503, {"error": {"message": "перегружено"}}),
+        MagicMock(text="Наконец-то!"),
+    ]
+
+    assert await llm_manager.get_raw_response("Промпт") == "Наконец-то!"
+    assert llm_manager.stats.retries == 2
+
+
+async def test_slow_request_is_hedged(llm_manager: LLMManager, mocker):
+    llm_manager._hedge_min_delay = 0.01
+    llm_manager._attempt_latency[PromptType.GATHERING] = deque([0.01] * 50)
+    calls = 0
+
+    async def generate_content(**kwargs):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(1 if calls == 1 else 0.01)
+        return MagicMock(text=f"Ответ {calls}")
+
+    mocker.patch.object(llm_manager._client.aio.models, 'generate_content', side_effect=generate_content)
+
+    assert await llm_manager.get_raw_response("Промпт") == "Ответ 2"
+    stats = llm_manager.stats
+    assert stats.hedged == 1 and stats.hedge_wins == 1
+    assert stats.hedge_rate == 1.0 and stats.hedge_win_rate == 1.0
+    assert stats.p95_latency < 0.5
+    await asyncio.sleep(0.01)  # отмененный дубль освобождает слот
+    assert llm_manager.stats.in_flight == 0
@@ -0,0 +1,76 @@
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from core.brain_service import BrainService
+from core.llm_processor import LLMProcessor, StreamingReplyParser
+from core.token_budget import PromptType
+
+
+def make_stream_manager(chunks: list[str]) -> MagicMock:
+    """LLMManager, который отдает ответ заданными кусками."""
+    async def stream(prompt: str, prompt_type, response_schema=None):
+        for chunk in chunks:
+            yield chunk
+
+    llm_manager = MagicMock()
+    llm_manager.stream_raw_response = stream
+    return llm_manager
+
+
+# ---- Тесты
+
+def test_parser_hides_delimiter_split_across_chunks():
+    parser = StreamingReplyParser()
+    visible = []
+    for chunk in ["Привет, ", "дети! ==", "=JS", "ON===", '{"updates": ', "[]}"]:
+        if parser.feed(chunk):
+            visible.append(parser.text)
+
+    assert visible == ["Привет, ", "Привет, дети! "]
+    assert "=" not in parser.text
+    assert parser.json_tail == '{"updates": []}'
+    assert parser.flush() is False
+
+
+def test_parser_releases_held_back_text_without_delimiter():
+    parser = StreamingReplyParser()
+    parser.feed("Смотрите, ==")
+
+    assert parser.text == "Смотрите, "
+    assert parser.flush() is True
+    assert parser.text == "Смотрите, =="
+
+
+async def test_execute_and_parse_stream_reports_text_and_parses_json():
+    processor = LLMProcessor(
+        make_stream_manager(["Всем ", "привет!", "\n===JSON===\n", '{"updates": []}']), structured=False
+    )
+    seen = []
+
+    async def on_text(text: str):
+        seen.append(text)
+
+    response = await processor.execute_and_parse_stream("Промпт", on_text)
+
+    assert seen == ["Всем ", "Всем привет!", "Всем привет!\n"]
+    assert response.text_reply == "Всем привет!"
+    assert response.data_json == {"updates": []}
+
+
+async def test_streamed_reply_is_sent_early_and_edited_with_throttle(mocker):
+    clock = mocker.patch("core.brain_service.time")
+    clock.monotonic.side_effect = [0.0, 0.2, 1.5, 1.5, 1.7, 1.9]
+    bot = MagicMock()
+    bot.send_message = AsyncMock(return_value=MagicMock(message_id=7))
+    bot.edit_message_text = AsyncMock()
+    processor = LLMProcessor(make_stream_manager(["Доброе", " утро", ", дети", "!===JSON===", "{}"]), structured=False)
+    brain = BrainService(MagicMock(), MagicMock(), MagicMock(), processor, bot, streaming=True, stream_edit_interval=1)
+
+    response = await brain._generate_reply(100, "Промпт", priority=0, config_id=1, prompt_type=PromptType.GATHERING)
+
+    assert response.text_reply == "Доброе утро, дети!"
+    bot.send_message.assert_awaited_once_with(100, "Доброе")
+    # Правки чаще интервала пропускаются, итоговый текст выставляется в конце.
+    edits = [call.kwargs["text"] for call in bot.edit_message_text.await_args_list]
+    assert edits == ["Доброе утро, дети", "Доброе утро, дети!"]
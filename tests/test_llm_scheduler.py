@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+from collections import deque
+from unittest.mock import AsyncMock, MagicMock
+
+from core.llm_manager import LLMManager
+from core.llm_scheduler import LLMAdmissionScheduler, Priority, TokenBucket
+from core.token_budget import PromptType
+
+
+# ---- Фикстуры
+@pytest.fixture
+def served() -> list[str]:
+    """Промпты в том порядке, в каком они дошли до LLM."""
+    return []
+
+
+@pytest.fixture
+def llm_manager_mock(served) -> MagicMock:
+    mock = MagicMock(spec=LLMManager)
+
+    async def get_raw_response(prompt: str, prompt_type=None, response_schema=None, **admission) -> str:
+        served.append(prompt)
+        return "ok"
+
+    mock.get_raw_response = AsyncMock(side_effect=get_raw_response)
+    return mock
+
+
+@pytest.fixture
+def scheduler(llm_manager_mock) -> LLMAdmissionScheduler:
+    """Квота в один запрос разом, пополнение — 20 запросов в секунду."""
+    return LLMAdmissionScheduler(llm_manager_mock, rpm=1200, tpm=10 ** 9, burst_seconds=0.05)
+
+
+# ---- Тесты
+async def test_priority_classes_are_served_in_order(scheduler, served):
+    await asyncio.gather(
+        scheduler.submit("сбор", Priority.GATHERING, config_id=1),
+        scheduler.submit("фон", Priority.BACKGROUND, config_id=2),
+        scheduler.submit("пульс", Priority.ONLINE, config_id=3),
+        scheduler.submit("ответ", Priority.INTERACTIVE, config_id=4),
+    )
+
+    assert served == ["ответ", "пульс", "сбор", "фон"]
+    await scheduler.close()
+
+
+async def test_chats_are_served_round_robin_within_class(scheduler, served):
+    await asyncio.gather(
+        *(scheduler.submit(f"чат1-{i}", Priority.GATHERING, config_id=1) for i in range(3)),
+        scheduler.submit("чат2-0", Priority.GATHERING, config_id=2),
+    )
+
+    assert served == ["чат1-0", "чат2-0", "чат1-1", "чат1-2"]
+    await scheduler.close()
+
+
+async def test_exhausted_quota_queues_instead_of_failing(llm_manager_mock, served):
+    scheduler = LLMAdmissionScheduler(llm_manager_mock, rpm=600, tpm=10 ** 9, burst_seconds=0.3)  # 3 разом, 10/с
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    results = await asyncio.gather(*(scheduler.submit(f"п{i}", Priority.ONLINE, config_id=i) for i in range(6)))
+
+    assert results == ["ok"] * 6
+    assert loop.time() - started >= 0.25
+    await scheduler.close()
+
+
+async def test_retries_are_admitted_through_buckets(mocker):
+    """Каждый повтор после временной ошибки ждет квоту, как новый запрос."""
+    mocker.patch("core.llm_manager.random.uniform", return_value=0)
+    llm_manager = LLMManager(api_key='fake-api-key')
+    mocker.patch.object(llm_manager._client.aio.models, 'generate_content', new_callable=AsyncMock, side_effect=[
+        httpx.ConnectError("обрыв"), httpx.ConnectError("обрыв"), MagicMock(text="ok")
+    ])
+    scheduler = LLMAdmissionScheduler(llm_manager, rpm=600, tpm=10 ** 9, burst_seconds=0.1)  # 1 разом, 10/с
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    assert await scheduler.submit("промпт", Priority.ONLINE, config_id=1) == "ok"
+
+    assert llm_manager.stats.retries == 2
+    assert loop.time() - started >= 0.15
+    await scheduler.close()
+
+
+async def test_no_hedge_when_buckets_are_empty(mocker):
+    llm_manager = LLMManager(api_key='fake-api-key', hedge_min_delay=0.01)
+    llm_manager._attempt_latency[PromptType.GATHERING] = deque([0.01] * 50)
+
+    async def generate_content(**kwargs):
+        await asyncio.sleep(0.1)
+        return MagicMock(text="ok")
+
+    mocker.patch.object(llm_manager._client.aio.models, 'generate_content', side_effect=generate_content)
+    scheduler = LLMAdmissionScheduler(llm_manager, rpm=6, tpm=10 ** 9, burst_seconds=10)  # 1 запрос, потом пусто
+
+    assert await scheduler.submit("промпт", Priority.GATHERING, config_id=1) == "ok"
+
+    assert llm_manager.stats.hedged == 0
+    await scheduler.close()
+
+
+def test_token_bucket_admits_oversized_request_when_full():
+    bucket = TokenBucket(capacity=100, refill_per_second=10)
+
+    assert bucket.wait_time(1000) == 0
+    bucket.consume(1000)
+    assert bucket.wait_time(1) > 0
@@ -0,0 +1,102 @@
+import json
+
+from unittest.mock import AsyncMock, MagicMock
+
+from core.llm_processor import LLMProcessor, StructuredStreamParser
+from core.llm_schema import parse_structured_reply, partial_text_reply
+from core.prompt_factory import PromptFactory
+
+FULL_REPLY = json.dumps({
+    "text_reply": "Привет, солнышки!",
+    "updates": [{"user_id": 1, "relationship_change": 2, "new_memory": "Любит котов"}],
+    "new_participants": [{"user_id": 7, "suggested_name": "Петя"}]
+}, ensure_ascii=False)
+
+
+# ---- Тесты
+
+def test_valid_reply_is_parsed_without_repair():
+    reply, repaired = parse_structured_reply(FULL_REPLY)
+
+    assert repaired is False
+    assert reply.text_reply == "Привет, солнышки!"
+    assert reply.data_json()["updates"][0]["new_memory"] == "Любит котов"
+    assert reply.data_json()["new_participants"][0]["suggested_gender"] == "unknown"
+
+
+def test_truncated_reply_keeps_text_and_complete_updates():
+    raw = (
+        '{"text_reply": "Ну что, дети", "updates": ['
+        '{"user_id": 1, "relationship_change": 1}, '
+        '{"user_id": "не число"}, '
+        '{"user_id": 2, "new_memory": "Обещал убраться в ком'
+    )
+
+    reply, repaired = parse_structured_reply(raw)
+
+    assert repaired is True
+    assert reply.text_reply == "Ну что, дети"
+    assert [update.user_id for update in reply.updates] == [1, 2]
+    assert reply.updates[1].new_memory is None
+
+
+def test_reply_wrapped_in_code_fence_is_repaired():
+    reply, repaired = parse_structured_reply(f"```json\n{FULL_REPLY}\n```")
+
+    assert repaired is True
+    assert reply.text_reply == "Привет, солнышки!"
+    assert len(reply.new_participants) == 1
+
+
+def test_partial_text_reply_reads_unfinished_string():
+    assert partial_text_reply('{"text_reply": "Сейчас расска') == "Сейчас расска"
+    assert partial_text_reply('{"text_') == ""
+
+
+async def test_processor_falls_back_to_delimiter_format():
+    llm_manager = MagicMock()
+    llm_manager.get_raw_response = AsyncMock(return_value='Просто текст\n===JSON===\n{"updates": []}')
+    processor = LLMProcessor(llm_manager, structured=True)
+
+    response = await processor.execute_and_parse("Промпт")
+
+    assert response.text_reply == "Просто текст"
+    assert response.data_json == {"updates": []}
+
+
+async def test_structured_stream_reports_text_before_updates():
+    chunks = [FULL_REPLY[i:i + 12] for i in range(0, len(FULL_REPLY), 12)]
+
+    async def stream(prompt: str, prompt_type, response_schema=None):
+        assert response_schema is not None
+        for chunk in chunks:
+            yield chunk
+
+    llm_manager = MagicMock()
+    llm_manager.stream_raw_response = stream
+    processor = LLMProcessor(llm_manager, structured=True)
+    seen = []
+
+    async def on_text(text: str):
+        seen.append(text)
+
+    response = await processor.execute_and_parse_stream("Промпт", on_text)
+
+    assert len(seen) > 1
+    assert seen[-1] == "Привет, солнышки!"
+    assert response.data_json["updates"][0]["relationship_change"] == 2
+
+
+def test_stream_parser_ignores_chunks_without_new_text():
+    parser = StructuredStreamParser()
+
+    assert parser.feed('{"text_reply": "Да') is True
+    assert parser.feed('", "updates": [') is False
+    assert parser.text == "Да"
+
+
+def test_structured_prompt_has_no_delimiter_instructions():
+    factory = PromptFactory(structured_output=True)
+
+    assert "===JSON===" not in factory._format_json_schema_block()
+    assert "text_reply" in factory._format_json_schema_block()
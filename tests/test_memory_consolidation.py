@@ -0,0 +1,123 @@
+import pytest
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+from core.exceptions import LLMError
+from core.llm_scheduler import Priority
+from core.memory_consolidation import MemoryConsolidator
+from core.memory_index import HashedNgramEmbedder
+from core.prompt_factory import PromptFactory
+
+NOW = datetime.now(timezone.utc)
+
+
+def memory(
+        memory_id: int, text: str, days_ago: int, importance: int = 1, participant_id: int = 10, is_merged: bool = False
+) -> dict:
+    return {
+        "id": memory_id, "participant_id": participant_id, "memory_summary": text,
+        "importance_level": importance, "created_at": NOW - timedelta(days=days_ago), "is_merged": is_merged
+    }
+
+
+# ---- Фикстуры
+@pytest.fixture
+def memory_rows() -> list[dict]:
+    """Воспоминания от свежих к старым, как их отдает get_memories_for_participants."""
+    return [
+        memory(1, "Ездит на рыбалку по выходным", 1),
+        memory(2, "Сдал экзамен по физике", 2, importance=3),
+        memory(3, "По выходным ездит на рыбалку с папой", 5, importance=2),
+        memory(4, "Любит котов", 200),
+        memory(5, "Любит котов.", 300),
+        memory(6, "Разбил чашку", 400),
+        memory(7, "Выиграл олимпиаду", 500, importance=4),
+        memory(8, "Учит стихи", 1, participant_id=11),
+    ]
+
+
+@pytest.fixture
+def db(memory_rows) -> MagicMock:
+    db = MagicMock()
+    db.get_memory_consolidation_candidates = AsyncMock(return_value=[10, 11])
+    db.get_memories_for_participants = AsyncMock(return_value=memory_rows)
+    db.consolidate_long_term_memories = AsyncMock(return_value=5)
+    db.get_long_term_memories_since = AsyncMock(return_value=[])
+    return db
+
+
+@pytest.fixture
+def llm() -> MagicMock:
+    llm = MagicMock()
+    llm.execute_text = AsyncMock(return_value="  Каждые выходные ездит с папой на рыбалку  ")
+    return llm
+
+
+@pytest.fixture
+def consolidator(db, llm) -> MemoryConsolidator:
+    return MemoryConsolidator(
+        db, llm, PromptFactory(), embedder=HashedNgramEmbedder(dim=512),
+        threshold=3, similarity=0.7, keep_recent=2, archive_after_days=90
+    )
+
+
+# ---- Тесты
+async def test_duplicates_are_merged_and_old_trivia_archived(consolidator, db, llm):
+    report = await consolidator.consolidate(1)
+
+    config_id, merged, archived = db.consolidate_long_term_memories.await_args.args
+    assert config_id == 1
+    assert merged == [
+        (10, "Каждые выходные ездит с папой на рыбалку", 3, NOW - timedelta(days=1)),
+        (10, "Любит котов", 2, NOW - timedelta(days=200)),
+    ]
+    assert archived == [(1, 'merged'), (3, 'merged'), (4, 'merged'), (5, 'merged'), (6, 'expired')]
+    llm.execute_text.assert_awaited_once()
+    assert llm.execute_text.await_args.args[1] == Priority.BACKGROUND
+    assert (report.participants, report.rows_before, report.rows_after, report.reclaimed) == (2, 8, 5, 3)
+    assert db.get_long_term_memories_since.await_count == 2
+    db.get_long_term_memories_since.assert_awaited_with(1, 0)
+
+
+async def test_merged_row_gets_no_second_bonus(consolidator, db, memory_rows):
+    """Сводная строка прошлой ночи, слитая с новым повтором, не набирает важность заново."""
+    memory_rows[:] = [
+        memory(1, "Любит котов", 1),
+        memory(2, "Любит котов.", 30, importance=2, is_merged=True),
+        memory(3, "Сдал экзамен по физике", 40),
+    ]
+
+    await consolidator.consolidate(1)
+
+    merged = db.consolidate_long_term_memories.await_args.args[1]
+    assert merged == [(10, "Любит котов", 2, NOW - timedelta(days=1))]
+
+
+async def test_llm_failure_keeps_newest_wording(consolidator, db, llm):
+    llm.execute_text.side_effect = LLMError("квота")
+
+    await consolidator.consolidate(1)
+
+    merged = db.consolidate_long_term_memories.await_args.args[1]
+    assert merged[0][1] == "Ездит на рыбалку по выходным"
+
+
+async def test_nothing_to_do_touches_nothing(consolidator, db, memory_rows):
+    memory_rows[:] = [memory(1, "Любит котов", 1), memory(2, "Сдал экзамен по физике", 400, importance=3)]
+
+    report = await consolidator.consolidate(1)
+
+    assert report.reclaimed == 0
+    db.consolidate_long_term_memories.assert_not_awaited()
+    db.get_long_term_memories_since.assert_not_awaited()
+
+
+async def test_no_candidates_skips_loading(consolidator, db):
+    db.get_memory_consolidation_candidates.return_value = []
+
+    report = await consolidator.consolidate(1)
+
+    assert report.participants == 0
+    db.get_memories_for_participants.assert_not_awaited()
+    db.get_memory_consolidation_candidates.assert_awaited_once_with(1, 3, consolidator.batch_size)
@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from tests.test_operator import redis_client, test_config
+from core.chat_context import ChatContextLoader
+from core.memory_index import CATCH_UP_OVERLAP, HashedNgramEmbedder, MemoryVectorIndex
+
+MEMORIES = [
+    {"id": 1, "participant_id": 10, "memory_summary": "Любит котов и хочет завести котенка"},
+    {"id": 2, "participant_id": 10, "memory_summary": "Сдал экзамен по физике на пятерку"},
+    {"id": 3, "participant_id": 10, "memory_summary": "Ездит на рыбалку по выходным"},
+    {"id": 4, "participant_id": 11, "memory_summary": "Учится играть на гитаре"},
+    {"id": 5, "participant_id": 12, "memory_summary": "Обиделась на брата"},
+]
+
+
+# ---- Фикстуры
+@pytest.fixture
+def memory_rows() -> list[dict]:
+    """Строки long_term_memory чата в БД."""
+    return [dict(row) for row in MEMORIES]
+
+
+@pytest.fixture
+def loader(memory_rows) -> AsyncMock:
+    """Мок AsyncPostgresManager.get_long_term_memories_since."""
+    return AsyncMock(side_effect=lambda config_id, after_id: [m for m in memory_rows if m["id"] > after_id])
+
+
+@pytest.fixture
+def memory_index(tmp_path) -> MemoryVectorIndex:
+    return MemoryVectorIndex(directory=str(tmp_path), embedder=HashedNgramEmbedder(dim=256))
+
+
+# ---- Тесты
+def test_embedder_is_normalized_and_tolerates_word_forms():
+    vectors = HashedNgramEmbedder(dim=256).embed(["котов любит", "котик", "экзамен по физике", "!!!"])
+
+    assert vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0)
+    assert not vectors[3].any()
+    assert vectors[0] @ vectors[1] > vectors[2] @ vectors[1]
+
+
+async def test_search_ranks_by_similarity_per_participant(memory_index, loader):
+    await memory_index.sync(1, loader)
+
+    memories = memory_index.search(1, "Мам, смотри какого котенка я нашел!", [10, 11], k=2)
+
+    assert memories[10][0] == "Любит котов и хочет завести котенка"
+    assert len(memories[10]) == 2
+    assert memories[11] == ["Учится играть на гитаре"]
+    assert 12 not in memories
+
+
+async def test_unrelated_query_falls_back_to_newest(memory_index, loader):
+    await memory_index.sync(1, loader)
+
+    assert memory_index.search(1, "", [10], k=1) == {10: ["Ездит на рыбалку по выходным"]}
+
+
+async def test_index_persists_and_catches_up_from_db(memory_index, loader, memory_rows, tmp_path):
+    await memory_index.sync(1, loader)
+    memory_index.add(1, [{"id": 6, "participant_id": 11, "memory_summary": "Купил новую гитару"}])
+    await memory_index.flush()
+    assert (tmp_path / "1.npz").exists()
+
+    memory_rows.append({"id": 7, "participant_id": 11, "memory_summary": "Выступил с гитарой на концерте"})
+    restored = MemoryVectorIndex(directory=str(tmp_path), embedder=HashedNgramEmbedder(dim=256))
+    await restored.sync(1, loader)
+
+    # Строка 6 пришла в индекс через add, а из БД он догружен только до 5.
+    loader.assert_awaited_with(1, max(5 - CATCH_UP_OVERLAP, 0))
+    assert restored.search(1, "гитара", [11], k=3)[11][0] in {"Купил новую гитару", "Выступил с гитарой на концерте"}
+    assert len(restored.search(1, "гитара", [11], k=3)[11]) == 3
+
+
+async def test_sync_sees_memories_written_by_other_workers(memory_index, loader, memory_rows, tmp_path):
+    other_worker = MemoryVectorIndex(directory=str(tmp_path), embedder=HashedNgramEmbedder(dim=256))
+    await memory_index.sync(1, loader)
+    await other_worker.sync(1, loader)
+
+    memory_rows.append({"id": 6, "participant_id": 11, "memory_summary": "Купил новую гитару"})
+    other_worker.add(1, [memory_rows[-1]])
+    await memory_index.sync(1, loader)
+
+    assert sorted(memory_index.search(1, "гитара", [11], k=5)[11]) == ["Купил новую гитару", "Учится играть на гитаре"]
+    assert len(other_worker.search(1, "гитара", [11], k=5)[11]) == 2
+
+
+async def test_invalidate_reaches_other_workers(redis_client, loader, memory_rows, tmp_path):
+    worker_a = MemoryVectorIndex(str(tmp_path / "a"), HashedNgramEmbedder(dim=256), redis_client=redis_client)
+    worker_b = MemoryVectorIndex(str(tmp_path / "b"), HashedNgramEmbedder(dim=256), redis_client=redis_client)
+    await worker_a.sync(1, loader)
+    await worker_b.sync(1, loader)
+    await worker_b.flush()
+
+    memory_rows[:] = [row for row in memory_rows if row["id"] != 4]
+    await worker_a.invalidate(1)
+    await worker_b.sync(1, loader)
+
+    assert worker_b.search(1, "гитара", [11], k=5) == {}
+    restarted_b = MemoryVectorIndex(str(tmp_path / "b"), HashedNgramEmbedder(dim=256), redis_client=redis_client)
+    await restarted_b.sync(1, loader)
+    assert restarted_b.search(1, "гитара", [11], k=5) == {}
+
+
+async def test_flush_leaves_no_temp_files(memory_index, loader, tmp_path):
+    await memory_index.sync(1, loader)
+    await memory_index.flush()
+
+    assert [path.name for path in tmp_path.iterdir()] == ["1.npz"]
+
+
+async def test_add_before_load_is_left_to_db(memory_index, loader):
+    memory_index.add(1, [{"id": 6, "participant_id": 11, "memory_summary": "Купил новую гитару"}])
+    await memory_index.sync(1, loader)
+
+    assert memory_index.search(1, "гитара", [11], k=5) == {11: ["Учится играть на гитаре"]}
+
+
+async def test_context_loader_recalls_relevant_memories(redis_client, memory_index, loader, test_config):
+    db = MagicMock()
+    db.get_config_with_participants = AsyncMock(return_value=(test_config, [
+        {"id": 10, "user_id": 111, "custom_name": "Леша"}, {"id": 11, "user_id": 222, "custom_name": "Петя"}
+    ]))
+    db.get_long_term_memories_since = loader
+    await redis_client.enqueue("online_batch_queue:1", {"user_id": 111, "text": "Я опять про физику, мам"})
+
+    context = await ChatContextLoader(db, redis_client, memories_per_participant=1, memory_index=memory_index).load(
+        1, ["online_batch_queue:1"], with_memories=True
+    )
+
+    assert [p["memories"] for p in context.participants] == [
+        ["Сдал экзамен по физике на пятерку"], ["Учится играть на гитаре"]
+    ]
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from unittest.mock import AsyncMock, MagicMock
+
+from core.exceptions import LLMError
+from core.llm_manager import LLMManager
+from core.model_router import ModelRouter, ModelRoute
+from core.token_budget import PromptType
+
+
+# ---- Фикстуры
+@pytest.fixture
+def router() -> ModelRouter:
+    return ModelRouter(
+        routes={
+            PromptType.GATHERING: ModelRoute("big", 2048, 60),
+            PromptType.ONLINE: ModelRoute("fast", 256, 10),
+        },
+        fast_model="fast",
+        latency_threshold=5,
+        error_rate_threshold=0.3,
+        window=10,
+        cooldown=0.05
+    )
+
+
+# ---- Тесты
+def test_routes_by_prompt_type(router):
+    assert router.select(PromptType.GATHERING) == ModelRoute("big", 2048, 60)
+    assert router.select(PromptType.ONLINE) == ModelRoute("fast", 256, 10)
+
+
+async def test_errors_downgrade_model_until_cooldown(router):
+    for i in range(10):
+        router.record("big", 1.0, ok=i % 2 == 0)
+
+    assert router.degraded_models == ["big"]
+    assert router.select(PromptType.GATHERING) == ModelRoute("fast", 2048, 60)
+
+    await asyncio.sleep(0.06)
+    assert router.select(PromptType.GATHERING).model == "big"
+    assert router.degraded_models == []
+
+
+def test_slow_model_is_downgraded(router):
+    for _ in range(9):
+        router.record("big", 10.0, ok=True)
+    assert router.select(PromptType.GATHERING).model == "big"
+
+    router.record("big", 10.0, ok=True)
+    assert router.select(PromptType.GATHERING).model == "fast"
+
+
+async def test_manager_applies_route_and_timeout(router, mocker):
+    llm_manager = LLMManager(api_key='fake-api-key', router=router)
+    generate = mocker.patch.object(llm_manager._client.aio.models, 'generate_content', new_callable=AsyncMock)
+    generate.return_value = MagicMock(text="Привет!")
+
+    assert await llm_manager.get_raw_response("Промпт", PromptType.ONLINE) == "Привет!"
+    assert generate.await_args.kwargs["model"] == "fast"
+    assert generate.await_args.kwargs["config"].max_output_tokens == 256
+
+    async def hang(**kwargs):
+        await asyncio.sleep(1)
+
+    generate.side_effect = hang
+    router.routes[PromptType.ONLINE] = ModelRoute("fast", 256, 0.01)
+    with pytest.raises(LLMError, match="не ответила"):
+        await llm_manager.get_raw_response("Промпт", PromptType.ONLINE)
+    assert llm_manager.stats.in_flight == 0
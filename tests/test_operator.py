@@ -1,299 +1,529 @@
-import pytest
-import pytest_asyncio
-import datetime
-
-from fakeredis.aioredis import FakeRedis
-from unittest.mock import AsyncMock, MagicMock
-from typing import Any, AsyncGenerator
-from aiogram import types
-
-from core.config.parameters import ONLINE_MODE_BATCH_THRESHOLD, ONLINE_MODE_REPLY_LIMIT
-from core.brain_service import BrainService
-from core.operator import Operator
-from core.database.redis_client import RedisClient
-
-
-# фикстуры
-@pytest_asyncio.fixture
-async def redis_client() -> AsyncGenerator[RedisClient, Any]:
-    """
-    Создает RedisClient, привязанный к fake Redis.
-    - Каждая фикстура с "function" scope имеет чистую БД.
-    - flushdb очищает все ключи перед и после теста.
-    """
-    fake_redis_instance = await FakeRedis(decode_responses=True)
-    client = RedisClient(host='localhost', port=6379)
-    client._pool = fake_redis_instance.connection_pool
-    client._client = fake_redis_instance
-
-    await client._client.flushdb()
-    yield client
-    await client._client.flushdb()
-
-
-@pytest.fixture
-def brain_service_mock() -> MagicMock:
-    """Мок BrainService."""
-    instance = MagicMock(spec=BrainService)
-    instance.process_single_message_immediately = AsyncMock()
-    instance.process_online_batch = AsyncMock()
-    instance.say_goodbye_and_switch_to_passive = AsyncMock()
-    return instance
-
-
-@pytest.fixture
-def operator(redis_client, brain_service_mock) -> Operator:
-    """Фикстура, создающая 'боевой' инстанс Operator с нашими тестовыми зависимостями."""
-    return Operator(redis_client, brain_service_mock)
-
-
-@pytest.fixture
-def test_config() -> dict:
-    """Возвращает стандартный словарь конфигурации."""
-    return {
-        "id": 1,
-        "chat_id": -100123456789,
-        "bot_name": "Мама",
-        "child_participant_id": 10,
-        "timezone": "UTC",
-    }
-
-
-@pytest.fixture
-def test_participant() -> dict:
-    """Возвращает стандартный словарь участника."""
-    return {
-        "id": 11,
-        "user_id": 555666777,
-        "custom_name": "Петя",
-        "relationship_score": 50
-    }
-
-
-@pytest.fixture
-def test_child_participant() -> dict:
-    """Возвращает словарь участника, который является 'ребенком'."""
-    return {
-        "id": 10,
-        "user_id": 111222333,
-        "custom_name": "Леша",
-        "relationship_score": 75
-    }
-
-
-# --- Фикстуры, имитирующие объекты aiogram
-@pytest.fixture
-def background_message(test_participant, test_config) -> MagicMock:
-    """Сообщение — обычный фоновый шум."""
-    message = MagicMock(spec=types.Message)
-
-    from_user = MagicMock(spec=types.User)
-    from_user.is_bot = False
-    from_user.id = test_participant['user_id']
-    message.from_user = from_user
-
-    chat = MagicMock(spec=types.Chat)
-    chat.id = test_config['chat_id']
-    message.chat = chat
-
-    message.text = "Сегодня хорошая погода?"
-    message.date = datetime.datetime.utcnow()
-    message.reply_to_message = None
-
-    return message
-
-
-@pytest.fixture
-def direct_mention_message(test_participant, test_config) -> MagicMock:
-    """Сообщение с прямым упоминанием 'Мамы'."""
-    message = MagicMock(spec=types.Message)
-
-    from_user = MagicMock(spec=types.User)
-    from_user.is_bot = False
-    from_user.id = test_participant['user_id']
-    message.from_user = from_user
-
-    chat = MagicMock(spec=types.Chat)
-    chat.id = test_config['chat_id']
-    message.chat = chat
-
-    message.text = "Мама, а что на ужин?"
-    message.date = datetime.datetime.utcnow()
-    message.reply_to_message = None
-
-    return message
-
-
-@pytest.fixture
-def child_message(test_child_participant, test_config) -> MagicMock:
-    """Сообщение от 'ребенка'."""
-    message = MagicMock(spec=types.Message)
-
-    from_user = MagicMock(spec=types.User)
-    from_user.is_bot = False
-    from_user.id = test_child_participant['user_id']
-    message.from_user = from_user
-
-    chat = MagicMock(spec=types.Chat)
-    chat.id = test_config['chat_id']
-    message.chat = chat
-
-    message.text = "Мам, я шапку надел."
-    message.date = datetime.datetime.utcnow()
-    message.reply_to_message = None
-
-    return message
-
-
-# ----- Тесты FakeRedis
-
-@pytest.mark.asyncio
-async def test_redis_enqueue_and_size(redis_client):
-    queue_name = "test_queue"
-    payload = {"text": "Привет"}
-
-    size = await redis_client.get_queue_size(queue_name)
-    assert size == 0
-
-    await redis_client.enqueue(queue_name, payload)
-
-    size = await redis_client.get_queue_size(queue_name)
-    assert size == 1
-
-    item = await redis_client.dequeue(queue_name)
-    assert item["text"] == "Привет"
-
-    size = await redis_client.get_queue_size(queue_name)
-    assert size == 0
-
-
-@pytest.mark.asyncio
-async def test_set_and_get_mode(redis_client):
-    chat_id = 123
-    mode = 'GATHERING'
-
-    await redis_client.set_mode(chat_id, mode)
-
-    retrieved_mode = await redis_client.get_mode(chat_id)
-
-    assert retrieved_mode == mode
-
-
-# ---- Тесты Operator
-async def test_gathering_direct_mention_goes_to_direct_queue(redis_client, operator, brain_service_mock, test_config,
-                                                             test_participant,
-                                                             direct_mention_message):
-    await redis_client.set_mode(test_config['id'], 'GATHERING')
-    direct_queue = f"direct_queue:{test_config['id']}"
-    background_queue = f"background_queue:{test_config['id']}"
-
-    await operator.handle_message(direct_mention_message, test_config, test_participant)
-
-    assert await redis_client.get_queue_size(direct_queue) == 1
-    assert await redis_client.get_queue_size(background_queue) == 0
-    brain_service_mock.assert_not_called()
-
-
-async def test_gathering_background_noise_goes_to_background_queue(redis_client, operator, brain_service_mock,
-                                                                   test_config,
-                                                                   test_participant,
-                                                                   background_message):
-    await redis_client.set_mode(test_config['id'], 'GATHERING')
-    direct_queue = f"direct_queue:{test_config['id']}"
-    background_queue = f"background_queue:{test_config['id']}"
-
-    await operator.handle_message(background_message, test_config, test_participant)
-    assert await redis_client.get_queue_size(direct_queue) == 0
-    assert await redis_client.get_queue_size(background_queue) == 1
-    brain_service_mock.assert_not_called()
-
-
-async def test_passive_child_message_is_queued(
-        operator, redis_client, brain_service_mock, test_config, test_child_participant, child_message
-):
-    await redis_client.set_mode(test_config['id'], "PASSIVE")
-    direct_queue = f"direct_queue:{test_config['id']}"
-
-    await operator.handle_message(child_message, test_config, test_child_participant)
-
-    assert await redis_client.get_queue_size(direct_queue) == 1
-    brain_service_mock.process_single_message_immediately.assert_not_called()
-
-
-async def test_passive_mention_with_successful_roll(
-        operator, redis_client, brain_service_mock, mocker, test_config, test_participant, direct_mention_message
-):
-    await redis_client.set_mode(test_config['id'], 'PASSIVE')
-    mocker.patch('core.operator.random.randint', return_value=1)
-
-    await operator.handle_message(direct_mention_message, test_config, test_participant)
-
-    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
-    brain_service_mock.process_single_message_immediately.assert_called_once()
-
-
-async def test_passive_mention_with_failed_roll(
-        operator, redis_client, brain_service_mock, mocker, test_config, test_participant, direct_mention_message
-):
-    await redis_client.set_mode(test_config['id'], 'PASSIVE')
-    mocker.patch('core.operator.random.randint', return_value=100)
-
-    await operator.handle_message(direct_mention_message, test_config, test_participant)
-    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
-    brain_service_mock.process_single_message_immediately.assert_not_called()
-
-
-async def test_online_batch_trigger_fires_on_threshold(
-        operator, redis_client, brain_service_mock, test_config, test_participant, background_message, mocker
-):
-    await redis_client.set_mode(test_config['id'], 'ONLINE')
-
-    mocker.patch.object(redis_client, "get_flag", return_value=False)
-    mocker.patch.object(redis_client, "set_flag", return_value=True)
-
-    for _ in range(ONLINE_MODE_BATCH_THRESHOLD - 1):
-        await operator.handle_message(background_message, test_config, test_participant)
-        brain_service_mock.process_online_batch.assert_not_called()
-
-    await operator.handle_message(background_message, test_config, test_participant)
-
-    await redis_client.get_queue_size(f"online_batch_queue:{test_config['id']}")
-
-    brain_service_mock.process_online_batch.assert_called_once_with(test_config['id'])
-
-
-async def test_online_reply_limit_is_respected(
-        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
-):
-    # Устанавливаем режим ONLINE
-    await redis_client.set_mode(test_config['id'], 'ONLINE')
-
-    counter_key = f"online_replies_count:{test_config['id']}"
-    for _ in range(ONLINE_MODE_REPLY_LIMIT):
-        await redis_client.increment_counter(counter_key)
-
-    await operator.handle_message(background_message, test_config, test_participant)
-
-    brain_service_mock.process_online_batch.assert_not_called()
-
-    brain_service_mock.say_goodbye_and_switch_to_passive.assert_called_once_with(test_config['id'])
-
-
-async def test_online_user_cooldown_works(
-        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
-):
-    await redis_client.set_mode(test_config['id'], 'ONLINE')
-    config_id = test_config['id']
-    user_id = test_participant['user_id']
-
-    await operator.handle_message(background_message, test_config, test_participant)
-
-    cooldown_key = f"online_user_cooldown:{config_id}:{user_id}"
-    flag = await redis_client.get_flag(cooldown_key)
-    assert flag is True
-
-    await operator.handle_message(background_message, test_config, test_participant)
-
-    batch_queue = f"online_batch_queue:{config_id}"
-    size = await redis_client.get_queue_size(batch_queue)
-    assert size == 1
+import asyncio
+import pytest
+import pytest_asyncio
+import datetime
+
+from fakeredis.aioredis import FakeRedis
+from unittest.mock import AsyncMock, MagicMock
+from typing import Any, AsyncGenerator
+from aiogram import types
+
+from core.config.parameters import ONLINE_MODE_BATCH_THRESHOLD, ONLINE_MODE_REPLY_LIMIT
+from core.brain_service import BrainService
+from core.operator import Operator
+from core.database.redis_client import RedisClient, QueueBackend
+from core.database.redis_scripts import DISPATCH_MESSAGE
+
+
+# фикстуры
+@pytest_asyncio.fixture
+async def redis_client() -> AsyncGenerator[RedisClient, Any]:
+    """
+    Создает RedisClient, привязанный к fake Redis.
+    - Каждая фикстура с "function" scope имеет чистую БД.
+    - flushdb очищает все ключи перед и после теста.
+    """
+    fake_redis_instance = await FakeRedis(decode_responses=False)
+    client = RedisClient(host='localhost', port=6379)
+    client._pool = fake_redis_instance.connection_pool
+    client._client = fake_redis_instance
+
+    await client._client.flushdb()
+    yield client
+    await client._client.flushdb()
+
+
+@pytest_asyncio.fixture
+async def batching_redis_client() -> AsyncGenerator[RedisClient, Any]:
+    """RedisClient на fake Redis с включенной пакетной записью."""
+    fake_redis_instance = await FakeRedis(decode_responses=False)
+    client = RedisClient(host='localhost', port=6379, write_batching=True, write_batch_delay_ms=5,
+                         write_batch_max_items=8)
+    client._pool = fake_redis_instance.connection_pool
+    client._client = fake_redis_instance
+
+    await client._client.flushdb()
+    yield client
+    await client._client.flushdb()
+
+
+def make_stream_client(fake_redis_instance: FakeRedis, claim_idle_ms: int = 60000) -> RedisClient:
+    """RedisClient с очередями на Redis Streams поверх общего fake Redis (как отдельный воркер)."""
+    client = RedisClient(host='localhost', port=6379, queue_backend=QueueBackend.STREAM,
+                         stream_claim_idle_ms=claim_idle_ms)
+    client._pool = fake_redis_instance.connection_pool
+    client._client = fake_redis_instance
+    return client
+
+
+@pytest_asyncio.fixture
+async def stream_redis_client() -> AsyncGenerator[RedisClient, Any]:
+    """RedisClient на fake Redis с очередями на Redis Streams."""
+    fake_redis_instance = await FakeRedis(decode_responses=False)
+    client = make_stream_client(fake_redis_instance)
+
+    await client._client.flushdb()
+    yield client
+    await client._client.flushdb()
+
+
+@pytest.fixture
+def brain_service_mock() -> MagicMock:
+    """Мок BrainService."""
+    instance = MagicMock(spec=BrainService)
+    instance.process_single_message_immediately = AsyncMock()
+    instance.process_online_batch = AsyncMock()
+    instance.say_goodbye_and_switch_to_passive = AsyncMock()
+    return instance
+
+
+@pytest.fixture
+def operator(redis_client, brain_service_mock) -> Operator:
+    """Фикстура, создающая 'боевой' инстанс Operator с нашими тестовыми зависимостями."""
+    return Operator(redis_client, brain_service_mock)
+
+
+@pytest.fixture
+def test_config() -> dict:
+    """Возвращает стандартный словарь конфигурации."""
+    return {
+        "id": 1,
+        "chat_id": -100123456789,
+        "bot_name": "Мама",
+        "child_participant_id": 10,
+        "timezone": "UTC",
+    }
+
+
+@pytest.fixture
+def test_participant() -> dict:
+    """Возвращает стандартный словарь участника."""
+    return {
+        "id": 11,
+        "user_id": 555666777,
+        "custom_name": "Петя",
+        "relationship_score": 50
+    }
+
+
+@pytest.fixture
+def test_child_participant() -> dict:
+    """Возвращает словарь участника, который является 'ребенком'."""
+    return {
+        "id": 10,
+        "user_id": 111222333,
+        "custom_name": "Леша",
+        "relationship_score": 75
+    }
+
+
+# --- Фикстуры, имитирующие объекты aiogram
+@pytest.fixture
+def background_message(test_participant, test_config) -> MagicMock:
+    """Сообщение — обычный фоновый шум."""
+    message = MagicMock(spec=types.Message)
+
+    from_user = MagicMock(spec=types.User)
+    from_user.is_bot = False
+    from_user.id = test_participant['user_id']
+    message.from_user = from_user
+
+    chat = MagicMock(spec=types.Chat)
+    chat.id = test_config['chat_id']
+    message.chat = chat
+
+    message.text = "Сегодня хорошая погода?"
+    message.date = datetime.datetime.utcnow()
+    message.reply_to_message = None
+
+    return message
+
+
+@pytest.fixture
+def direct_mention_message(test_participant, test_config) -> MagicMock:
+    """Сообщение с прямым упоминанием 'Мамы'."""
+    message = MagicMock(spec=types.Message)
+
+    from_user = MagicMock(spec=types.User)
+    from_user.is_bot = False
+    from_user.id = test_participant['user_id']
+    message.from_user = from_user
+
+    chat = MagicMock(spec=types.Chat)
+    chat.id = test_config['chat_id']
+    message.chat = chat
+
+    message.text = "Мама, а что на ужин?"
+    message.date = datetime.datetime.utcnow()
+    message.reply_to_message = None
+
+    return message
+
+
+@pytest.fixture
+def child_message(test_child_participant, test_config) -> MagicMock:
+    """Сообщение от 'ребенка'."""
+    message = MagicMock(spec=types.Message)
+
+    from_user = MagicMock(spec=types.User)
+    from_user.is_bot = False
+    from_user.id = test_child_participant['user_id']
+    message.from_user = from_user
+
+    chat = MagicMock(spec=types.Chat)
+    chat.id = test_config['chat_id']
+    message.chat = chat
+
+    message.text = "Мам, я шапку надел."
+    message.date = datetime.datetime.utcnow()
+    message.reply_to_message = None
+
+    return message
+
+
+# ----- Тесты FakeRedis
+
+@pytest.mark.asyncio
+async def test_redis_enqueue_and_size(redis_client):
+    queue_name = "test_queue"
+    payload = {"text": "Привет"}
+
+    size = await redis_client.get_queue_size(queue_name)
+    assert size == 0
+
+    await redis_client.enqueue(queue_name, payload)
+
+    size = await redis_client.get_queue_size(queue_name)
+    assert size == 1
+
+    item = await redis_client.dequeue(queue_name)
+    assert item["text"] == "Привет"
+
+    size = await redis_client.get_queue_size(queue_name)
+    assert size == 0
+
+
+@pytest.mark.asyncio
+async def test_set_and_get_mode(redis_client):
+    chat_id = 123
+    mode = 'GATHERING'
+
+    await redis_client.set_mode(chat_id, mode)
+
+    retrieved_mode = await redis_client.get_mode(chat_id)
+
+    assert retrieved_mode == mode
+
+
+# ---- Тесты Operator
+async def test_gathering_direct_mention_goes_to_direct_queue(redis_client, operator, brain_service_mock, test_config,
+                                                             test_participant,
+                                                             direct_mention_message):
+    await redis_client.set_mode(test_config['id'], 'GATHERING')
+    direct_queue = f"direct_queue:{test_config['id']}"
+    background_queue = f"background_queue:{test_config['id']}"
+
+    await operator.handle_message(direct_mention_message, test_config, test_participant)
+
+    assert await redis_client.get_queue_size(direct_queue) == 1
+    assert await redis_client.get_queue_size(background_queue) == 0
+    brain_service_mock.assert_not_called()
+
+
+async def test_queued_payload_references_participant(
+        redis_client, operator, test_config, test_participant, direct_mention_message
+):
+    """В очередь кладется только ссылка на участника, а не его данные целиком."""
+    await redis_client.set_mode(test_config['id'], 'GATHERING')
+
+    await operator.handle_message(direct_mention_message, test_config, test_participant)
+
+    [payload] = await redis_client.get_and_clear_batch(f"direct_queue:{test_config['id']}")
+    assert payload == {
+        "participant_id": test_participant['id'],
+        "user_id": test_participant['user_id'],
+        "text": direct_mention_message.text,
+        "timestamp": direct_mention_message.date.timestamp(),
+        "is_direct": True,
+        "is_reply": False
+    }
+
+
+async def test_gathering_background_noise_goes_to_background_queue(redis_client, operator, brain_service_mock,
+                                                                   test_config,
+                                                                   test_participant,
+                                                                   background_message):
+    await redis_client.set_mode(test_config['id'], 'GATHERING')
+    direct_queue = f"direct_queue:{test_config['id']}"
+    background_queue = f"background_queue:{test_config['id']}"
+
+    await operator.handle_message(background_message, test_config, test_participant)
+    assert await redis_client.get_queue_size(direct_queue) == 0
+    assert await redis_client.get_queue_size(background_queue) == 1
+    brain_service_mock.assert_not_called()
+
+
+async def test_passive_child_message_is_queued(
+        operator, redis_client, brain_service_mock, test_config, test_child_participant, child_message
+):
+    await redis_client.set_mode(test_config['id'], "PASSIVE")
+    direct_queue = f"direct_queue:{test_config['id']}"
+
+    await operator.handle_message(child_message, test_config, test_child_participant)
+
+    assert await redis_client.get_queue_size(direct_queue) == 1
+    brain_service_mock.process_single_message_immediately.assert_not_called()
+
+
+async def test_passive_mention_with_successful_roll(
+        operator, redis_client, brain_service_mock, mocker, test_config, test_participant, direct_mention_message
+):
+    await redis_client.set_mode(test_config['id'], 'PASSIVE')
+    mocker.patch('core.operator.random.randint', return_value=1)
+
+    await operator.handle_message(direct_mention_message, test_config, test_participant)
+
+    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
+    brain_service_mock.process_single_message_immediately.assert_called_once()
+
+
+async def test_passive_mention_with_failed_roll(
+        operator, redis_client, brain_service_mock, mocker, test_config, test_participant, direct_mention_message
+):
+    await redis_client.set_mode(test_config['id'], 'PASSIVE')
+    mocker.patch('core.operator.random.randint', return_value=100)
+
+    await operator.handle_message(direct_mention_message, test_config, test_participant)
+    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
+    brain_service_mock.process_single_message_immediately.assert_not_called()
+
+
+async def test_online_batch_trigger_fires_on_threshold(
+        operator, redis_client, brain_service_mock, test_config, test_participant, background_message, mocker
+):
+    await redis_client.set_mode(test_config['id'], 'ONLINE')
+    cooldown_key = f"online_user_cooldown:{test_config['id']}:{test_participant['user_id']}"
+
+    for _ in range(ONLINE_MODE_BATCH_THRESHOLD - 1):
+        await operator.handle_message(background_message, test_config, test_participant)
+        brain_service_mock.process_online_batch.assert_not_called()
+        await redis_client.delete(cooldown_key)
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    await redis_client.get_queue_size(f"online_batch_queue:{test_config['id']}")
+
+    brain_service_mock.process_online_batch.assert_called_once_with(test_config['id'])
+
+
+async def test_online_reply_limit_is_respected(
+        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    # Устанавливаем режим ONLINE
+    await redis_client.set_mode(test_config['id'], 'ONLINE')
+
+    counter_key = f"online_replies_count:{test_config['id']}"
+    for _ in range(ONLINE_MODE_REPLY_LIMIT):
+        await redis_client.increment_counter(counter_key)
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    brain_service_mock.process_online_batch.assert_not_called()
+
+    brain_service_mock.say_goodbye_and_switch_to_passive.assert_called_once_with(test_config['id'])
+
+
+async def test_online_user_cooldown_works(
+        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    await redis_client.set_mode(test_config['id'], 'ONLINE')
+    config_id = test_config['id']
+    user_id = test_participant['user_id']
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    cooldown_key = f"online_user_cooldown:{config_id}:{user_id}"
+    flag = await redis_client.get_flag(cooldown_key)
+    assert flag is True
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    batch_queue = f"online_batch_queue:{config_id}"
+    size = await redis_client.get_queue_size(batch_queue)
+    assert size == 1
+
+
+async def test_online_reply_limit_triggers_goodbye_once(
+        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    await redis_client.set_mode(test_config['id'], 'ONLINE')
+
+    counter_key = f"online_replies_count:{test_config['id']}"
+    for _ in range(ONLINE_MODE_REPLY_LIMIT):
+        await redis_client.increment_counter(counter_key)
+
+    for _ in range(3):
+        await operator.handle_message(background_message, test_config, test_participant)
+
+    brain_service_mock.say_goodbye_and_switch_to_passive.assert_called_once_with(test_config['id'])
+
+
+async def test_passive_background_message_is_ignored(
+        operator, redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    await redis_client.set_mode(test_config['id'], 'PASSIVE')
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
+    assert await redis_client.get_queue_size(f"background_queue:{test_config['id']}") == 0
+    brain_service_mock.process_single_message_immediately.assert_not_called()
+
+
+async def test_message_without_mode_is_ignored(
+        operator, redis_client, brain_service_mock, test_config, test_participant, direct_mention_message
+):
+    await operator.handle_message(direct_mention_message, test_config, test_participant)
+
+    assert await redis_client.get_queue_size(f"direct_queue:{test_config['id']}") == 0
+    brain_service_mock.process_single_message_immediately.assert_not_called()
+
+
+async def test_dispatch_is_single_round_trip(
+        operator, redis_client, test_config, test_participant, background_message, mocker
+):
+    """Вся диспетчеризация — один EVALSHA, без отдельных GET/INCR/RPUSH."""
+    await redis_client.set_mode(test_config['id'], 'ONLINE')
+    await redis_client._client.script_load(DISPATCH_MESSAGE)  # как в RedisClient.connect()
+    execute_spy = mocker.spy(redis_client._client, 'execute_command')
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    commands = [call.args[0] for call in execute_spy.call_args_list]
+    assert commands == ['EVALSHA']
+
+
+# ----- Тесты пакетной записи
+
+async def test_batched_enqueue_keeps_order_and_coalesces(batching_redis_client):
+    queue_name = "test_queue"
+
+    await asyncio.gather(*(batching_redis_client.enqueue(queue_name, {"n": i}) for i in range(20)))
+
+    items = [await batching_redis_client.dequeue(queue_name) for _ in range(20)]
+    assert [item["n"] for item in items] == list(range(20))
+    stats = batching_redis_client.write_batch_stats
+    assert stats.items == 20
+    assert stats.flushes == 3  # 8 + 8 + 4
+    assert stats.max_batch_size == 8
+    assert stats.queue_depth == 0
+
+
+async def test_batched_dispatch_reloads_missing_script(
+        batching_redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    """Если скрипта нет в кэше Redis (например, после рестарта), пакет загружает его и повторяет команду."""
+    operator = Operator(batching_redis_client, brain_service_mock)
+    await batching_redis_client.set_mode(test_config['id'], 'GATHERING')
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    assert await batching_redis_client.get_queue_size(f"background_queue:{test_config['id']}") == 1
+    assert batching_redis_client.write_batch_stats.flushes == 1
+
+
+async def test_batched_write_error_reaches_only_its_caller(batching_redis_client):
+    await batching_redis_client._client.set("not_a_list", "x")
+
+    results = await asyncio.gather(
+        batching_redis_client._submit_write(lambda pipe: pipe.rpush("not_a_list", "1")),
+        batching_redis_client.enqueue("test_queue", {"n": 1}),
+        return_exceptions=True
+    )
+
+    assert isinstance(results[0], Exception)
+    assert await batching_redis_client.get_queue_size("test_queue") == 1
+
+
+# ----- Тесты очередей на Redis Streams
+
+async def test_stream_claim_and_ack(stream_redis_client):
+    queue_name = "direct_queue:1"
+    for i in range(3):
+        await stream_redis_client.enqueue(queue_name, {"n": i})
+
+    batch = await stream_redis_client.claim_batch(queue_name)
+    assert [item["n"] for item in batch.items] == [0, 1, 2]
+    assert (await stream_redis_client.claim_batch(queue_name)).items == []
+
+    await stream_redis_client.ack_batch(batch)
+    assert await stream_redis_client.get_queue_size(queue_name) == 0
+
+
+async def test_stream_workers_do_not_share_messages(stream_redis_client):
+    queue_name = "direct_queue:1"
+    other_worker = make_stream_client(stream_redis_client._client)
+    other_worker._stream_consumer = "other-worker"
+    await stream_redis_client.enqueue(queue_name, {"n": 1})
+
+    first = await stream_redis_client.claim_batch(queue_name)
+    second = await other_worker.claim_batch(queue_name)
+
+    assert len(first.items) == 1
+    assert second.items == []
+
+
+async def test_stream_recovers_batch_of_dead_worker(stream_redis_client):
+    """Неподтвержденная пачка упавшего воркера забирается другим через XAUTOCLAIM."""
+    queue_name = "online_batch_queue:1"
+    await stream_redis_client.enqueue(queue_name, {"n": 1})
+    await stream_redis_client.claim_batch(queue_name)  # воркер упал, не сделав ack
+
+    rescuer = make_stream_client(stream_redis_client._client, claim_idle_ms=0)
+    rescuer._stream_consumer = "rescuer"
+    batch = await rescuer.claim_batch(queue_name)
+
+    assert [item["n"] for item in batch.items] == [1]
+    await rescuer.ack_batch(batch)
+    assert await rescuer.get_queue_size(queue_name) == 0
+
+
+async def test_stream_touch_keeps_batch_from_other_workers(stream_redis_client):
+    """Пачку, которую еще обрабатывают, XAUTOCLAIM не отдает другому воркеру после touch_batch."""
+    queue_name = "direct_queue:1"
+    await stream_redis_client.enqueue(queue_name, {"n": 1})
+    batch = await stream_redis_client.claim_batch(queue_name)
+    rescuer = make_stream_client(stream_redis_client._client, claim_idle_ms=100)
+    rescuer._stream_consumer = "rescuer"
+
+    await asyncio.sleep(0.15)
+    await stream_redis_client.touch_batch(batch)
+
+    assert (await rescuer.claim_batch(queue_name)).items == []
+
+
+async def test_stream_get_and_clear_batch_is_refused(stream_redis_client):
+    """Забрать и сразу подтвердить пачку Streams нельзя: при падении воркера она бы потерялась."""
+    await stream_redis_client.enqueue("direct_queue:1", {"n": 1})
+
+    with pytest.raises(ValueError):
+        await stream_redis_client.get_and_clear_batch("direct_queue:1")
+    assert await stream_redis_client.get_queue_size("direct_queue:1") == 1
+
+
+async def test_stream_dispatch_counts_only_unclaimed_messages(
+        stream_redis_client, brain_service_mock, test_config, test_participant, background_message
+):
+    """Порог микро-пакета считается по новым сообщениям, а не по тем, что уже в обработке."""
+    operator = Operator(stream_redis_client, brain_service_mock)
+    config_id = test_config['id']
+    queue_name = f"online_batch_queue:{config_id}"
+    await stream_redis_client.set_mode(config_id, 'ONLINE')
+    for _ in range(ONLINE_MODE_BATCH_THRESHOLD - 1):
+        await stream_redis_client.enqueue(queue_name, {"text": "старое"})
+    await stream_redis_client.claim_batch(queue_name)
+
+    await operator.handle_message(background_message, test_config, test_participant)
+
+    brain_service_mock.process_online_batch.assert_not_called()
+    assert await stream_redis_client.get_queue_size(queue_name) == ONLINE_MODE_BATCH_THRESHOLD
@@ -1,129 +1,168 @@
-import pytest
-from core.prompt_factory import PromptFactory
-
-
-# ---- Фикстуры
-
-@pytest.fixture(scope="session")
-def prompt_factory() -> PromptFactory:
-    """Простой инстанс нашего класса."""
-    return PromptFactory()
-
-
-@pytest.fixture(scope="session")
-def test_config() -> dict:
-    """Фикстура с полной конфигурацией 'Мамы'."""
-    return {
-        "id": 1,
-        "bot_name": "Мамуля",
-        "personality_prompt": "Ты немного саркастичная, но очень заботливая.",
-        "child_participant_id": 10
-    }
-
-
-@pytest.fixture(scope="session")
-def test_participants() -> list[dict]:
-    """Фикстура со списком известных участников."""
-    return [
-        {
-            "id": 10,
-            "user_id": 111,
-            "custom_name": "Леша",
-            "relationship_score": 75
-        },
-        {
-            "id": 11,
-            "user_id": 222,
-            "custom_name": "Петя",
-            "relationship_score": 50
-        }
-    ]
-
-
-@pytest.fixture(scope="session")
-def test_messages() -> list[dict]:
-    """
-    Фикстура со списком сообщений:
-    - Одно от известного участника.
-    - Одно от нового пользователя.
-    """
-    return [
-        {
-            "user_id": 111,
-            "text": "Мам, я сегодня поздно приду.",
-            "participant_info": {"id": 10, "custom_name": "Леша"}
-        },
-        {
-            "user_id": 333,
-            "text": "Всем привет!",
-            "participant_info": None
-        }
-    ]
-
-
-def test_create_gathering_prompt_full_data(
-        prompt_factory: PromptFactory,
-        test_config: dict,
-        test_participants: list[dict],
-        test_messages: list[dict]
-):
-    prompt = prompt_factory.create_gathering_prompt(
-        config=test_config,
-        participants=test_participants,
-        messages=test_messages,
-        time_of_day="morning"
-    )
-
-    assert "ТВОЯ РОЛЬ" in prompt
-    assert test_config['bot_name'] in prompt
-    assert test_config['personality_prompt'] in prompt
-
-    assert "УЧАСТНИКИ ДИАЛОГА" in prompt
-    assert test_participants[0]['custom_name'] in prompt
-    assert str(test_participants[0]['relationship_score']) in prompt
-    assert "(твой ребенок)" in prompt
-
-    assert "ИСТОРИЯ СООБЩЕНИЙ" in prompt
-    assert test_messages[0]['text'] in prompt
-    assert f"Новый пользователь (user_id: {test_messages[1]['user_id']})" in prompt
-
-    assert "ТВОЯ ЗАДАЧА" in prompt
-    assert "===JSON===" in prompt
-    assert '"updates":' in prompt
-    assert '"new_participants":' in prompt
-
-
-@pytest.mark.parametrize(
-    "time_of_day, expected_phrase",
-    [
-        ("morning", "доброго утра"),
-        ("afternoon", "дневных обсуждениях"),
-        ("evening", "хорошего вечера"),
-        ("random", "внепланово проверить"),
-    ]
-)
-def test_prompt_adapts_to_time_of_day(
-        prompt_factory: PromptFactory, test_config: dict, time_of_day: str, expected_phrase: str
-):
-    prompt = prompt_factory.create_gathering_prompt(
-        config=test_config,
-        participants=[],
-        messages=[],
-        time_of_day=time_of_day
-    )
-
-    assert expected_phrase in prompt
-
-
-def test_prompt_handles_empty_data(prompt_factory: PromptFactory, test_config: dict):
-    prompt = prompt_factory.create_gathering_prompt(
-        config=test_config,
-        participants=[],
-        messages=[],
-        time_of_day="morning"
-    )
-
-    assert "Пока в чате нет никого, кого бы ты знала." in prompt
-    assert "В чате за это время не было сообщений." in prompt
-    assert "ТВОЯ РОЛЬ" in prompt
-    assert "===JSON===" in prompt
+import pytest
+from core.prompt_factory import PromptFactory
+
+
+# ---- Фикстуры
+
+@pytest.fixture(scope="session")
+def prompt_factory() -> PromptFactory:
+    """Простой инстанс нашего класса (формат ответа с разделителем '===JSON===')."""
+    return PromptFactory(structured_output=False)
+
+
+@pytest.fixture(scope="session")
+def test_config() -> dict:
+    """Фикстура с полной конфигурацией 'Мамы'."""
+    return {
+        "id": 1,
+        "bot_name": "Мамуля",
+        "personality_prompt": "Ты немного саркастичная, но очень заботливая.",
+        "child_participant_id": 10
+    }
+
+
+@pytest.fixture(scope="session")
+def test_participants() -> list[dict]:
+    """Фикстура со списком известных участников."""
+    return [
+        {
+            "id": 10,
+            "user_id": 111,
+            "custom_name": "Леша",
+            "relationship_score": 75
+        },
+        {
+            "id": 11,
+            "user_id": 222,
+            "custom_name": "Петя",
+            "relationship_score": 50
+        }
+    ]
+
+
+@pytest.fixture(scope="session")
+def test_messages() -> list[dict]:
+    """
+    Фикстура со списком сообщений:
+    - Одно от известного участника.
+    - Одно от нового пользователя.
+    """
+    return [
+        {
+            "participant_id": 10,
+            "user_id": 111,
+            "text": "Мам, я сегодня поздно приду.",
+            "is_direct": True,
+            "is_reply": False
+        },
+        {
+            "participant_id": None,
+            "user_id": 333,
+            "text": "Всем привет!",
+            "is_direct": False,
+            "is_reply": False
+        }
+    ]
+
+
+def test_create_gathering_prompt_full_data(
+        prompt_factory: PromptFactory,
+        test_config: dict,
+        test_participants: list[dict],
+        test_messages: list[dict]
+):
+    prompt, _ = prompt_factory.create_gathering_prompt(
+        config=test_config,
+        participants=test_participants,
+        messages=test_messages,
+        time_of_day="morning",
+        child_was_active=True
+    )
+
+    assert "ТВОЯ РОЛЬ" in prompt
+    assert test_config['bot_name'] in prompt
+    assert test_config['personality_prompt'] in prompt
+
+    assert "УЧАСТНИКИ ДИАЛОГА" in prompt
+    assert test_participants[0]['custom_name'] in prompt
+    assert str(test_participants[0]['relationship_score']) in prompt
+    assert "(твой ребенок)" in prompt
+
+    assert "ИСТОРИЯ СООБЩЕНИЙ" in prompt
+    assert test_messages[0]['text'] in prompt
+    assert f"Новый пользователь (user_id: {test_messages[1]['user_id']})" in prompt
+
+    assert "ТВОЯ ЗАДАЧА" in prompt
+    assert "===JSON===" in prompt
+    assert '"updates":' in prompt
+    assert '"new_participants":' in prompt
+
+
+@pytest.mark.parametrize(
+    "time_of_day, expected_phrase",
+    [
+        ("morning", "доброго утра"),
+        ("afternoon", "дневных обсуждениях"),
+        ("evening", "хорошего вечера"),
+        ("random", "внепланово проверить"),
+    ]
+)
+def test_prompt_adapts_to_time_of_day(
+        prompt_factory: PromptFactory, test_config: dict, time_of_day: str, expected_phrase: str
+):
+    prompt, _ = prompt_factory.create_gathering_prompt(
+        config=test_config,
+        participants=[],
+        messages=[],
+        time_of_day=time_of_day,
+        child_was_active=True
+    )
+
+    assert expected_phrase in prompt
+
+
+def test_prompt_handles_empty_data(prompt_factory: PromptFactory, test_config: dict):
+    prompt, _ = prompt_factory.create_gathering_prompt(
+        config=test_config,
+        participants=[],
+        messages=[],
+        time_of_day="morning",
+        child_was_active=True
+    )
+
+    assert "Пока в чате нет никого, кого бы ты знала." in prompt
+    assert "В чате за это время не было сообщений." in prompt
+    assert "ТВОЯ РОЛЬ" in prompt
+    assert "===JSON===" in prompt
+
+
+def test_messages_block_takes_names_from_roster(
+        prompt_factory: PromptFactory, test_config: dict, test_participants: list[dict], test_messages: list[dict]
+):
+    dialog = test_messages + [{"role": "model", "content": "Леша, до скольки?"}]
+
+    prompt, _ = prompt_factory.create_online_prompt(test_config, dialog, test_participants)
+
+    assert "[Леша]: Мам, я сегодня поздно приду." in prompt
+    assert "[Новый пользователь (user_id: 333)]: Всем привет!" in prompt
+    assert "[Ты]: Леша, до скольки?" in prompt
+
+
+def test_messages_block_reads_legacy_payloads(prompt_factory: PromptFactory, test_config: dict):
+    """Сообщения старого формата (с participant_info внутри) еще могут лежать в Redis."""
+    legacy = [{"user_id": 111, "text": "Я дома", "participant_info": {"id": 10, "custom_name": "Леша"}}]
+
+    prompt, _ = prompt_factory.create_online_prompt(test_config, legacy)
+
+    assert "[Леша]: Я дома" in prompt
+
+
+def test_participants_block_renders_long_term_memories(
+        prompt_factory: PromptFactory, test_config: dict, test_participants: list[dict]
+):
+    participants = [{**test_participants[0], "memories": ["Любит котов", "Сдал экзамен"]}, test_participants[1]]
+
+    prompt, _ = prompt_factory.create_single_reply_prompt(test_config, participants, {"user_id": 111, "text": "Мам?"})
+
+    assert "- Леша (user_id: 111) (твой ребенок). Ваши отношения: 75/100.\n  • Помнишь: Любит котов\n" \
+           "  • Помнишь: Сдал экзамен\n- Петя" in prompt
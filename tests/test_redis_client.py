@@ -1,151 +1,183 @@
-import pytest
-
-
-from typing import AsyncGenerator
-from unittest.mock import AsyncMock
-
-from core.database.redis_client import RedisClient
-from core.config.parameters import REDIS_PORT, REDIS_HOST
-
-
-@pytest.fixture
-async def redis_client() -> AsyncGenerator[RedisClient, None]:
-    """Фикстура, которая создает и очищает клиент для каждого теста."""
-    client = RedisClient(host=REDIS_HOST, port=REDIS_PORT)
-    async with client.lifecycle():
-        await client._client.flushdb()
-        yield client
-
-
-async def test_exception_connect_error(mocker, redis_client):
-    mocker.patch.object(redis_client, "connect", AsyncMock(side_effect=Exception("Что-то совсем непредвиденное")))
-
-    with pytest.raises(Exception, match="Что-то совсем непредвиденное"):
-        async with redis_client.lifecycle():
-            pass
-
-
-async def test_enqueue_and_dequeue(redis_client: RedisClient):
-    """
-    Тест: проверяем, что мы можем положить в очередь словарь и получить его обратно.
-    """
-    queue_name = "test_queue"
-    test_item = {"user_id": 123, "text": "hello"}
-
-    await redis_client.enqueue(queue_name, test_item)
-
-    retrieved_item = await redis_client.dequeue(queue_name, timeout=1)
-
-    assert retrieved_item is not None
-    assert isinstance(retrieved_item, dict)
-    assert retrieved_item["user_id"] == 123
-    assert retrieved_item["text"] == "hello"
-
-
-async def test_get_queue_size_and_get_clear_batch(redis_client: RedisClient):
-    queue = "test_multi"
-    items = [
-        {"user_id": 1, "text": "a"},
-        {"user_id": 2, "text": "b"},
-        {"user_id": 3, "text": "c"},
-    ]
-
-    for item in items:
-        await redis_client.enqueue(queue, item)
-
-    size = await redis_client.get_queue_size(queue)
-    assert size == len(items)
-
-    result = await redis_client.get_and_clear_batch(queue)
-
-    assert result == items or result == list(reversed(items))
-
-    retrieved_item = await redis_client.dequeue(queue, timeout=1)
-    assert retrieved_item is None
-
-async def test_trim_queue(redis_client: RedisClient):
-    queue = "test_trim"
-    for i in range(5):
-        await redis_client.enqueue(queue, {"n": i})
-    await redis_client.trim_queue(queue, max_len=2)
-    size = await redis_client.get_queue_size(queue)
-    assert size == 2
-    result = await redis_client.get_and_clear_batch(queue)
-    assert result == [{"n": 3}, {"n": 4}]
-
-async def test_set_and_get_state(redis_client: RedisClient):
-    key = "state:123"
-    state = {"a": "1", "b": "2"}
-    await redis_client.set_state(key, state)
-    result = await redis_client.get_state(key)
-    assert result == state
-
-async def test_set_and_get_mode(redis_client: RedisClient):
-    config_id = 42
-    await redis_client.set_mode(config_id, "active")
-    result = await redis_client.get_mode(config_id)
-    assert result == "active"
-
-async def test_set_and_get_flag(redis_client: RedisClient):
-    key = "flag:test"
-    await redis_client.set_flag(key, True)
-    assert await redis_client.get_flag(key) is True
-    await redis_client.set_flag(key, False)
-    assert await redis_client.get_flag(key) is False
-
-async def test_delete(redis_client: RedisClient):
-    key = "to_delete"
-    await redis_client.set_mode(99, "temp")
-    await redis_client.delete(f"mode:99")
-    result = await redis_client.get_mode(99)
-    assert result is None
-
-async def test_increment_counter(redis_client: RedisClient):
-    key = "counter:test"
-    value1 = await redis_client.increment_counter(key)
-    value2 = await redis_client.increment_counter(key)
-    assert value1 == 1
-    assert value2 == 2
-
-async def test_set_and_get_json(redis_client: RedisClient):
-    key = "json:test"
-    data = {"user": "Alice", "score": 100}
-
-    # Сохраняем словарь в Redis
-    await redis_client.set_json(key, data, ttl_seconds=60)
-
-    # Достаём обратно
-    retrieved = await redis_client.get_json(key)
-
-    assert retrieved is not None
-    assert isinstance(retrieved, dict)
-    assert retrieved == data
-
-async def test_get_json_missing_key(redis_client: RedisClient):
-    key = "json:missing"
-
-    # Если ключа нет, должно вернуть None
-    result = await redis_client.get_json(key)
-    assert result is None
-
-async def test_set_and_get_string(redis_client: RedisClient):
-    key = "string:test"
-    value = "hello world"
-
-    # Сохраняем строку
-    await redis_client.set_string(key, value, ttl_seconds=60)
-
-    # Достаём обратно
-    result = await redis_client.get_string(key)
-
-    assert result is not None
-    assert isinstance(result, str)
-    assert result == value
-
-
-async def test_get_string_missing_key(redis_client: RedisClient):
-    key = "string:missing"
-
-    # Если ключа нет, должно вернуть None
-    result = await redis_client.get_string(key)
-    assert result is None
\ No newline at end of file
+import pytest
+
+
+from typing import AsyncGenerator
+from unittest.mock import AsyncMock
+
+from aiogram.fsm.storage.base import StorageKey
+
+from core.database.redis_client import RedisClient
+from core.config.parameters import REDIS_PORT, REDIS_HOST
+from states.setup_state import SetupMama
+
+
+@pytest.fixture
+async def redis_client() -> AsyncGenerator[RedisClient, None]:
+    """Фикстура, которая создает и очищает клиент для каждого теста."""
+    client = RedisClient(host=REDIS_HOST, port=REDIS_PORT)
+    async with client.lifecycle():
+        await client._client.flushdb()
+        yield client
+
+
+async def test_exception_connect_error(mocker, redis_client):
+    mocker.patch.object(redis_client, "connect", AsyncMock(side_effect=Exception("Что-то совсем непредвиденное")))
+
+    with pytest.raises(Exception, match="Что-то совсем непредвиденное"):
+        async with redis_client.lifecycle():
+            pass
+
+
+async def test_enqueue_and_dequeue(redis_client: RedisClient):
+    """
+    Тест: проверяем, что мы можем положить в очередь словарь и получить его обратно.
+    """
+    queue_name = "test_queue"
+    test_item = {"user_id": 123, "text": "hello"}
+
+    await redis_client.enqueue(queue_name, test_item)
+
+    retrieved_item = await redis_client.dequeue(queue_name, timeout=1)
+
+    assert retrieved_item is not None
+    assert isinstance(retrieved_item, dict)
+    assert retrieved_item["user_id"] == 123
+    assert retrieved_item["text"] == "hello"
+
+
+async def test_get_queue_size_and_get_clear_batch(redis_client: RedisClient):
+    queue = "test_multi"
+    items = [
+        {"user_id": 1, "text": "a"},
+        {"user_id": 2, "text": "b"},
+        {"user_id": 3, "text": "c"},
+    ]
+
+    for item in items:
+        await redis_client.enqueue(queue, item)
+
+    size = await redis_client.get_queue_size(queue)
+    assert size == len(items)
+
+    result = await redis_client.get_and_clear_batch(queue)
+
+    assert result == items or result == list(reversed(items))
+
+    retrieved_item = await redis_client.dequeue(queue, timeout=1)
+    assert retrieved_item is None
+
+async def test_trim_queue(redis_client: RedisClient):
+    queue = "test_trim"
+    for i in range(5):
+        await redis_client.enqueue(queue, {"n": i})
+    await redis_client.trim_queue(queue, max_len=2)
+    size = await redis_client.get_queue_size(queue)
+    assert size == 2
+    result = await redis_client.get_and_clear_batch(queue)
+    assert result == [{"n": 3}, {"n": 4}]
+
+async def test_set_and_get_state(redis_client: RedisClient):
+    key = "state:123"
+    state = {"a": "1", "b": "2"}
+    await redis_client.set_state(key, state)
+    result = await redis_client.get_state(key)
+    assert result == state
+
+async def test_set_and_get_mode(redis_client: RedisClient):
+    config_id = 42
+    await redis_client.set_mode(config_id, "active")
+    result = await redis_client.get_mode(config_id)
+    assert result == "active"
+
+async def test_set_and_get_flag(redis_client: RedisClient):
+    key = "flag:test"
+    await redis_client.set_flag(key, True)
+    assert await redis_client.get_flag(key) is True
+    await redis_client.set_flag(key, False)
+    assert await redis_client.get_flag(key) is False
+
+async def test_delete(redis_client: RedisClient):
+    key = "to_delete"
+    await redis_client.set_mode(99, "temp")
+    await redis_client.delete(f"mode:99")
+    result = await redis_client.get_mode(99)
+    assert result is None
+
+async def test_increment_counter(redis_client: RedisClient):
+    key = "counter:test"
+    value1 = await redis_client.increment_counter(key)
+    value2 = await redis_client.increment_counter(key)
+    assert value1 == 1
+    assert value2 == 2
+
+async def test_set_and_get_json(redis_client: RedisClient):
+    key = "json:test"
+    data = {"user": "Alice", "score": 100}
+
+    # Сохраняем словарь в Redis
+    await redis_client.set_json(key, data, ttl_seconds=60)
+
+    # Достаём обратно
+    retrieved = await redis_client.get_json(key)
+
+    assert retrieved is not None
+    assert isinstance(retrieved, dict)
+    assert retrieved == data
+
+async def test_get_json_missing_key(redis_client: RedisClient):
+    key = "json:missing"
+
+    # Если ключа нет, должно вернуть None
+    result = await redis_client.get_json(key)
+    assert result is None
+
+async def test_set_and_get_string(redis_client: RedisClient):
+    key = "string:test"
+    value = "hello world"
+
+    # Сохраняем строку
+    await redis_client.set_string(key, value, ttl_seconds=60)
+
+    # Достаём обратно
+    result = await redis_client.get_string(key)
+
+    assert result is not None
+    assert isinstance(result, str)
+    assert result == value
+
+
+async def test_get_string_missing_key(redis_client: RedisClient):
+    key = "string:missing"
+
+    # Если ключа нет, должно вернуть None
+    result = await redis_client.get_string(key)
+    assert result is None
+
+
+async def test_fsm_storage_shared_between_workers_with_ttl(redis_client: RedisClient):
+    """Состояние диалога настройки, записанное одним воркером, видно другому и истекает по TTL."""
+    key = StorageKey(bot_id=42, chat_id=-100123456789, user_id=555666777)
+    worker_a = redis_client.create_fsm_storage(state_ttl=3600, data_ttl=3600)
+    worker_b = redis_client.create_fsm_storage(state_ttl=3600, data_ttl=3600)
+
+    await worker_a.set_state(key, SetupMama.getting_mama_name)
+    await worker_a.set_data(key, {"bot_name": "Мамуля"})
+
+    assert await worker_b.get_state(key) == SetupMama.getting_mama_name.state
+    assert await worker_b.get_data(key) == {"bot_name": "Мамуля"}
+    fsm_keys = [k async for k in redis_client._client.scan_iter("fsm:*")]
+    assert fsm_keys
+    for fsm_key in fsm_keys:
+        assert 0 < await redis_client._client.ttl(fsm_key) <= 3600
+    await worker_a.close()
+    await worker_b.close()
+
+
+async def test_fsm_storage_close_keeps_client_pool(redis_client: RedisClient):
+    """Dispatcher закрывает storage при остановке — общий клиент после этого должен работать."""
+    storage = redis_client.create_fsm_storage()
+
+    await storage.close()
+
+    await redis_client.set_flag("flag:after_fsm_close", True, ttl_seconds=60)
+    assert await redis_client.get_flag("flag:after_fsm_close")
@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+
+from aiogram import Dispatcher, Router, types, Bot
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from tests.test_operator import redis_client, test_config, brain_service_mock
+from tests.test_listener import db_manager_mock
+
+from core.scheduler import SchedulerManager
+from core.sharding import HashRing, ShardCoordinator, ShardRoutingMiddleware, MEMBERS_KEY
+
+
+# ---- Фикстуры
+@pytest.fixture
+def chat_ids() -> list[int]:
+    return [-100_000_000_000 - i for i in range(2000)]
+
+
+def chat_update(chat_id: int, update_id: int = 1) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 1717000000,
+            "chat": {"id": chat_id, "type": "supergroup", "title": "Семья"},
+            "from": {"id": 111222333, "is_bot": False, "first_name": "Леша"},
+            "text": "Мама, привет",
+        },
+    }
+
+
+# ---- Тесты HashRing
+def test_ring_spreads_chats_evenly(chat_ids):
+    ring = HashRing(["a", "b", "c", "d"])
+    counts = {}
+    for chat_id in chat_ids:
+        counts[ring.owner(chat_id)] = counts.get(ring.owner(chat_id), 0) + 1
+
+    assert set(counts) == {"a", "b", "c", "d"}
+    assert min(counts.values()) > len(chat_ids) / 4 * 0.6
+
+
+def test_ring_moves_only_chats_of_changed_worker(chat_ids):
+    before = HashRing(["a", "b", "c"])
+    after = HashRing(["a", "b", "c", "d"])
+
+    moved = [chat_id for chat_id in chat_ids if before.owner(chat_id) != after.owner(chat_id)]
+
+    assert all(after.owner(chat_id) == "d" for chat_id in moved)
+    assert len(moved) < len(chat_ids) / 2
+
+
+# ---- Тесты ShardCoordinator
+async def test_workers_see_each_other_and_expire(redis_client):
+    worker_a = ShardCoordinator(redis_client, worker_id="a", lease_ttl=15)
+    worker_b = ShardCoordinator(redis_client, worker_id="b", lease_ttl=15)
+
+    await worker_a.heartbeat()
+    await worker_b.heartbeat()
+    assert await worker_a.heartbeat() is True
+    assert worker_a.ring.members == ["a", "b"]
+
+    await redis_client._client.zadd(MEMBERS_KEY, {"b": 0})  # аренда b истекла
+    assert await worker_a.heartbeat() is True
+    assert worker_a.ring.members == ["a"]
+
+
+async def test_foreign_chat_update_is_forwarded_to_owner(redis_client):
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def remember(message: types.Message):
+        handled.append(message.chat.id)
+
+    worker_a = ShardCoordinator(redis_client, worker_id="a")
+    worker_a.ring = HashRing(["a", "b"])
+    dp = Dispatcher()
+    dp.include_router(router)
+    dp.update.outer_middleware(ShardRoutingMiddleware(worker_a))
+    bot = Bot(token="42:TEST")
+
+    own_chat = next(c for c in range(-1000, 0) if worker_a.owns(c))
+    foreign_chat = next(c for c in range(-1000, 0) if not worker_a.owns(c))
+    await dp.feed_raw_update(bot, chat_update(own_chat, 1))
+    await dp.feed_raw_update(bot, chat_update(foreign_chat, 2))
+
+    assert handled == [own_chat]
+    forwarded = await redis_client.receive_update("shard_inbox:b", timeout=1)
+    assert forwarded["message"]["chat"]["id"] == foreign_chat
+    await bot.session.close()
+
+
+async def test_inbox_of_departed_worker_is_rerouted(redis_client):
+    """Апдейты, пересланные воркеру до его падения, забирает и обрабатывает новый владелец чатов."""
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def remember(message: types.Message):
+        handled.append(message.chat.id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="42:TEST")
+    worker_a = ShardCoordinator(redis_client, worker_id="a", inbox_ttl=300)
+    worker_b = ShardCoordinator(redis_client, worker_id="b")
+    await worker_b.heartbeat()
+    await worker_a.start(dp, bot)
+
+    foreign_chats = [c for c in range(-1000, 0) if not worker_a.owns(c)][:2]
+    for update_id, chat_id in enumerate(foreign_chats, 1):
+        await worker_a.forward("b", types.Update.model_validate(chat_update(chat_id, update_id)))
+    assert 0 < await redis_client._client.ttl("shard_inbox:b") <= 300
+
+    await redis_client._client.zadd(MEMBERS_KEY, {"b": 0})  # b упал, не разобрав очередь
+    assert await worker_a.heartbeat() is True
+    for _ in range(100):
+        if len(handled) == len(foreign_chats):
+            break
+        await asyncio.sleep(0.01)
+
+    assert handled == foreign_chats
+    assert not await redis_client._client.exists("shard_inbox:b")
+    await worker_a.stop()
+    await bot.session.close()
+
+
+async def test_scheduler_keeps_only_owned_chats_after_rebalance(
+        redis_client, db_manager_mock, brain_service_mock, test_config
+):
+    configs = [{**test_config, "id": i, "chat_id": -100 - i} for i in range(1, 41)]
+    db_manager_mock.get_all_mama_configs.return_value = configs
+    shard = ShardCoordinator(redis_client, worker_id="a")
+    manager = SchedulerManager(AsyncIOScheduler(), redis_client, db_manager_mock, brain_service_mock, shard=shard)
+
+    await manager.start()
+    assert {job.args[0] for job in manager.scheduler.get_jobs()} == {c["id"] for c in configs}
+
+    shard.ring = HashRing(["a", "b"])
+    await manager.rebalance()
+
+    owned = {c["id"] for c in configs if shard.owns(c["chat_id"])}
+    assert 0 < len(owned) < len(configs)
+    assert {job.args[0] for job in manager.scheduler.get_jobs()} == owned
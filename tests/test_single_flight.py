@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+
+from tests.test_operator import redis_client
+
+from core.exceptions import LeaseLostError
+from core.single_flight import SingleFlight
+
+
+class Recorder:
+    """Фейковая обработка чата: считает запуски и ловит параллельные."""
+
+    def __init__(self, duration: float = 0.05):
+        self.duration = duration
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, config_id: int):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(self.duration)
+        self.active -= 1
+
+
+# ---- Тесты
+async def test_calls_during_run_schedule_exactly_one_follow_up(redis_client):
+    flight = SingleFlight(redis_client, poll_interval=0.01)
+    work = Recorder()
+
+    first = asyncio.create_task(flight.run("online_batch", 1, work))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(flight.run("online_batch", 1, work) for _ in range(5)), first)
+
+    assert work.calls == 2
+    assert work.max_active == 1
+    assert await redis_client._client.get("single_flight:1") is None
+    assert flight._locks == {}
+
+
+async def test_calls_waiting_for_chat_join_one_run(redis_client):
+    flight = SingleFlight(redis_client, poll_interval=0.01)
+    goodbye, batch = Recorder(), Recorder()
+
+    end = asyncio.create_task(flight.run("online_end", 1, goodbye))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(flight.run("online_batch", 1, batch) for _ in range(3)), end)
+
+    assert goodbye.calls == 1
+    assert batch.calls == 1
+
+
+async def test_processes_never_run_same_chat_in_parallel(redis_client):
+    work = Recorder(duration=0.02)
+    workers = [SingleFlight(redis_client, poll_interval=0.005) for _ in range(3)]
+
+    await asyncio.gather(*(worker.run("online_batch", 7, work) for worker in workers for _ in range(2)))
+
+    assert work.max_active == 1
+    assert 3 <= work.calls <= 6
+
+
+async def test_lost_lease_aborts_processing(redis_client):
+    """Если аренду перехватил другой процесс, обработка прерывается, а чужая аренда остается."""
+    flight = SingleFlight(redis_client, lease_ttl=1, poll_interval=0.01)
+    finished = []
+
+    async def stalled(config_id: int):
+        await redis_client._client.set(f"single_flight:{config_id}", "other")  # аренда истекла и занята
+        await asyncio.sleep(5)
+        finished.append(config_id)
+
+    with pytest.raises(LeaseLostError):
+        await flight.run("online_batch", 1, stalled)
+
+    assert finished == []
+    assert await redis_client._client.get("single_flight:1") == b"other"
+    assert flight._locks == {}
+
+
+async def test_release_lease_keeps_foreign_lease(redis_client):
+    assert await redis_client.acquire_lease("single_flight:1", "mine", 10000)
+    assert not await redis_client.acquire_lease("single_flight:1", "other", 10000)
+
+    await redis_client.release_lease("single_flight:1", "other")
+    assert not await redis_client.renew_lease("single_flight:1", "other", 10000)
+    assert await redis_client.renew_lease("single_flight:1", "mine", 10000)
+
+    await redis_client.release_lease("single_flight:1", "mine")
+    assert await redis_client._client.get("single_flight:1") is None
@@ -0,0 +1,95 @@
+import asyncio
+
+from tests.test_operator import redis_client
+from tests.test_promt_factory import test_config, test_participants
+
+from core.exceptions import LLMError
+from core.llm_scheduler import Priority
+from core.prompt_factory import PromptFactory
+from core.summarizer import BackgroundSummarizer
+
+
+class FakeLLM:
+    """LLMProcessor с execute_text, который 'пересказывает' кусок по номеру первого сообщения."""
+
+    def __init__(self, fail_on: set[int] | None = None):
+        self.fail_on = fail_on or set()
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self.priorities = set()
+
+    async def execute_text(self, prompt, priority, config_id, prompt_type):
+        self.calls += 1
+        self.priorities.add(priority)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        first = int(prompt.split("сообщение ")[1].split()[0])
+        if first in self.fail_on:
+            raise LLMError("Квота исчерпана")
+        return f"Пересказ с {first}"
+
+
+def background(count: int) -> list[dict]:
+    return [{"participant_id": 11, "user_id": 222, "text": f"сообщение {i} о делах", "timestamp": i}
+            for i in range(count)]
+
+
+# ---- Тесты
+async def test_small_queue_goes_raw(redis_client, test_participants):
+    llm = FakeLLM()
+    summarizer = BackgroundSummarizer(llm, redis_client, PromptFactory(), min_messages=150)
+
+    result = await summarizer.summarize(1, background(20), test_participants)
+
+    assert result.summaries == [] and len(result.raw_messages) == 20
+    assert llm.calls == 0
+
+
+async def test_chunks_are_summarized_in_parallel_and_cached(redis_client, test_participants):
+    llm = FakeLLM()
+    summarizer = BackgroundSummarizer(llm, redis_client, PromptFactory(), min_messages=150, chunk_size=100,
+                                      max_parallel=2)
+
+    result = await summarizer.summarize(1, background(450), test_participants)
+
+    assert result.summaries == [f"Пересказ с {i}" for i in (0, 100, 200, 300, 400)]
+    assert result.raw_messages == []
+    assert llm.max_active == 2
+    assert llm.priorities == {Priority.BACKGROUND}
+
+    again = await summarizer.summarize(1, background(450), test_participants)
+    assert again.summaries == result.summaries
+    assert again.cache_hits == 5
+    assert llm.calls == 5
+
+
+async def test_chunks_use_callers_priority(redis_client, test_participants):
+    """Сбор ждет пересказ, поэтому куски идут в LLM с его приоритетом, а не фоновым."""
+    llm = FakeLLM()
+    summarizer = BackgroundSummarizer(llm, redis_client, PromptFactory(), min_messages=150, chunk_size=100)
+
+    await summarizer.summarize(1, background(300), test_participants, Priority.GATHERING)
+
+    assert llm.priorities == {Priority.GATHERING}
+
+
+async def test_failed_chunk_falls_back_to_raw_messages(redis_client, test_participants):
+    summarizer = BackgroundSummarizer(FakeLLM(fail_on={100}), redis_client, PromptFactory(), min_messages=150,
+                                      chunk_size=100)
+
+    result = await summarizer.summarize(1, background(300), test_participants)
+
+    assert result.summaries == ["Пересказ с 0", "Пересказ с 200"]
+    assert [msg["timestamp"] for msg in result.raw_messages] == list(range(100, 200))
+
+
+def test_gathering_prompt_includes_summaries(test_config, test_participants):
+    prompt, _ = PromptFactory().create_gathering_prompt(
+        test_config, test_participants, [], "evening", True, summaries=["Петя хвастался уловом."]
+    )
+
+    assert "КРАТКОЕ СОДЕРЖАНИЕ ФОНОВОЙ ПЕРЕПИСКИ" in prompt
+    assert "Петя хвастался уловом." in prompt
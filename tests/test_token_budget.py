@@ -0,0 +1,69 @@
+import pytest
+
+from tests.test_promt_factory import test_config, test_participants
+
+from core.prompt_factory import PromptFactory
+from core.token_budget import TokenBudget, PromptType, estimate_tokens
+
+
+# ---- Фикстуры
+@pytest.fixture
+def busy_gathering() -> list[dict]:
+    """Шумный сбор: 2000 фоновых сообщений, среди которых несколько от ребенка и прямых обращений."""
+    messages = []
+    for i in range(2000):
+        message = {"participant_id": 11, "user_id": 222, "text": f"Фоновое сообщение номер {i} про погоду и футбол",
+                   "is_direct": False, "timestamp": i}
+        if i % 500 == 0:
+            message.update(participant_id=10, user_id=111, text=f"Мам, это Леша, сообщение {i}")
+        if i % 700 == 1:
+            message.update(text=f"Мама, ответь пожалуйста {i}", is_direct=True)
+        messages.append(message)
+    return messages
+
+
+# ---- Тесты
+def test_estimate_tokens_counts_cyrillic_denser_than_latin():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("привет" * 100) > estimate_tokens("privet" * 100)
+
+
+def test_gathering_prompt_fits_budget_and_keeps_priority(test_config, test_participants, busy_gathering):
+    factory = PromptFactory(TokenBudget({PromptType.GATHERING: 3000}))
+
+    prompt, report = factory.create_gathering_prompt(test_config, test_participants, busy_gathering, "morning", True)
+
+    assert estimate_tokens(prompt) <= 3000
+    assert report.total <= 3000
+    assert set(report.blocks) == {"role", "context", "participants", "task", "json_schema", "messages"}
+    assert 0 < report.messages_kept < report.messages_total == 2000
+    for i in (0, 500, 1000, 1500):
+        assert f"Мам, это Леша, сообщение {i}" in prompt
+    for i in (1, 701, 1401):
+        assert f"Мама, ответь пожалуйста {i}" in prompt
+    assert "Фоновое сообщение номер 1999 " in prompt
+    assert "Фоновое сообщение номер 10 " in prompt or "Фоновое сообщение номер 2 " in prompt
+    assert "опущена" in prompt
+    # Политика детерминирована: тот же вход — тот же промпт.
+    assert factory.create_gathering_prompt(test_config, test_participants, busy_gathering, "morning", True)[0] == prompt
+
+
+def test_online_prompt_keeps_only_recent_tail(test_config, test_participants, busy_gathering):
+    factory = PromptFactory(TokenBudget({PromptType.ONLINE: 1500}))
+
+    prompt, report = factory.create_online_prompt(test_config, busy_gathering, test_participants)
+
+    assert report.total <= 1500
+    assert "Фоновое сообщение номер 1999 " in prompt
+    assert "Фоновое сообщение номер 3 " not in prompt
+
+
+def test_long_message_is_truncated(test_config, test_participants):
+    factory = PromptFactory(TokenBudget(max_message_tokens=50))
+    message = {"participant_id": 11, "user_id": 222, "text": "очень " * 1000, "is_direct": True}
+
+    prompt, report = factory.create_single_reply_prompt(test_config, test_participants, message)
+
+    assert "очень " * 60 not in prompt
+    assert "…" in prompt
+    assert report.messages_truncated == 1
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from aiogram import Bot, Dispatcher, Router, types
+from aiohttp.test_utils import TestClient, TestServer
+
+from core.webhook import create_webhook_app
+
+SECRET = "test-secret"
+PATH = "/webhook"
+
+
+# ---- Фикстуры
+@pytest.fixture
+def recorded_updates() -> list[dict]:
+    """Апдейты в том виде, в каком их присылает Telegram в группу с мамой."""
+    chat = {"id": -100123456789, "type": "supergroup", "title": "Семья"}
+    users = [
+        {"id": 111222333, "is_bot": False, "first_name": "Леша"},
+        {"id": 555666777, "is_bot": False, "first_name": "Петя"},
+    ]
+    texts = ["Мама, я дома!", "Всем привет", "Что на ужин?", "Я в магазин", "Мам, купи хлеба"]
+    return [
+        {
+            "update_id": 1000 + i,
+            "message": {
+                "message_id": 500 + i,
+                "date": 1717000000 + i,
+                "chat": chat,
+                "from": users[i % len(users)],
+                "text": text,
+            },
+        }
+        for i, text in enumerate(texts)
+    ]
+
+
+@pytest.fixture
+def received() -> list[str]:
+    return []
+
+
+@pytest_asyncio.fixture
+async def webhook_client(received) -> TestClient:
+    """HTTP-клиент к вебхуку с Dispatcher'ом, который просто запоминает тексты сообщений."""
+    router = Router()
+
+    @router.message()
+    async def remember(message: types.Message):
+        received.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="42:TEST")
+
+    client = TestClient(TestServer(create_webhook_app(dp, bot, PATH, SECRET)))
+    await client.start_server()
+    yield client
+    await client.close()
+
+
+async def wait_for(condition, timeout: float = 2.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+
+
+# ---- Тесты
+async def test_webhook_replays_recorded_updates(webhook_client, recorded_updates, received):
+    for update in recorded_updates:
+        response = await webhook_client.post(
+            PATH, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+        assert response.status == 200
+
+    await wait_for(lambda: len(received) == len(recorded_updates))
+    assert sorted(received) == sorted(u["message"]["text"] for u in recorded_updates)
+
+
+async def test_webhook_rejects_wrong_secret(webhook_client, recorded_updates, received):
+    response = await webhook_client.post(
+        PATH, json=recorded_updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+    )
+    missing = await webhook_client.post(PATH, json=recorded_updates[0])
+
+    assert response.status == 401
+    assert missing.status == 401
+    await asyncio.sleep(0.05)
+    assert received == []
+
+
+@pytest.mark.parametrize("secret", ["", None])
+def test_webhook_requires_secret(secret):
+    with pytest.raises(ValueError):
+        create_webhook_app(Dispatcher(), Bot(token="42:TEST"), PATH, secret)